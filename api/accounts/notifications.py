@@ -6,10 +6,18 @@ from fastapi import APIRouter, Request, HTTPException, status, Query
 
 from database import accounts, charts
 from helpers.session import get_session, Session
-from helpers.models import NotificationRequest, Notification, ReadUpdate
+from helpers.models import (
+    NotificationRequest,
+    Notification,
+    NotificationList,
+    ReadUpdate,
+)
+from helpers.record_json import RecordEncoder, json_array, json_response
 
 router = APIRouter()
 
+notification_list_encoder = RecordEncoder(NotificationList)
+
 
 @router.get("/")
 async def main(
@@ -22,20 +30,20 @@ async def main(
     page = page if page else 0
 
     async with app.db_acquire() as conn:
-        notifications = await conn.fetch(
+        notifications = await conn.fetch_raw(
             accounts.get_notifications(
                 session.sonolus_id, page=page, only_unread=only_unread
             )
         )
 
-    notifs = (
-        [notification.model_dump() for notification in notifications]
-        if notifications
-        else []
+    notifs = json_array(
+        notification_list_encoder.encode(
+            notification,
+            timestamp=int(notification["created_at"].timestamp() * 1000),
+        )
+        for notification in notifications
     )
-    for notif in notifs:
-        notif["timestamp"] = int(notif["created_at"].timestamp() * 1000)
-    return {"notifications": notifs}
+    return json_response({"notifications": notifs})
 
 
 @router.post("/")
@@ -45,7 +53,7 @@ async def add(
     session: Session = get_session(enforce_auth=True, allow_banned_users=False),
 ):
     app: ChartFastAPI = request.app
-    user = await session.user()
+    user = session.context
 
     if not user.admin and not user.mod:
         raise HTTPException(status.HTTP_403_FORBIDDEN)
@@ -125,7 +133,7 @@ async def delete(
 ):
     app: ChartFastAPI = request.app
 
-    user = await session.user()
+    user = session.context
     if not user.admin and not user.mod:
         raise HTTPException(status.HTTP_403_FORBIDDEN)
 
@@ -23,7 +23,6 @@ async def login_discord(
         enforce_auth=True, enforce_type="external", allow_banned_users=False
     ),
 ):
-    await session.user()
     app: ChartFastAPI = request.app
     redirect_uri = request.url_for("link_discord")
     return await app.oauth.discord.authorize_redirect(request, redirect_uri)
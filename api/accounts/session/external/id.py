@@ -1,5 +1,4 @@
-import uuid, json, base64, hashlib
-import hmac
+import uuid
 from core import ChartFastAPI
 
 from fastapi import APIRouter, Request, HTTPException, status
@@ -12,12 +11,7 @@ router = APIRouter()
 @router.post("/")
 async def main(request: Request):
     app: ChartFastAPI = request.app
-    id_data = {"id": str(uuid.uuid4())}
-    encoded_id = base64.urlsafe_b64encode(json.dumps(id_data).encode()).decode()
-    signature = hmac.new(
-        app.token_secret_key.encode(), encoded_id.encode(), hashlib.sha256
-    ).hexdigest()
-    id_key = f"{encoded_id}.{signature}"
+    id_key = app.encode_key({"id": str(uuid.uuid4())})
     query = external.create_external_login(id_key)
 
     async with app.db_acquire() as conn:
@@ -1,12 +1,12 @@
-import asyncio, json, base64, hashlib
-import hmac
 from core import ChartFastAPI
 
 from fastapi import APIRouter, Request, HTTPException, status
 
 from database import accounts, external
+from database.listener import EXTERNAL_LOGIN_CHANNEL
 
 from helpers.models import ExternalServiceUserProfileWithType
+from helpers.session import new_session_key
 
 router = APIRouter()
 
@@ -29,28 +29,32 @@ async def main(request: Request, data: ExternalServiceUserProfileWithType):
 
     id_data = app.decode_key(data.id_key)
 
-    session_key_data = {
-        "id": id_data.id,
-        "user_id": data.id,
-        "type": data.type,
-    }
-    encoded_key = base64.urlsafe_b64encode(
-        json.dumps(session_key_data).encode()
-    ).decode()
-    signature = hmac.new(
-        app.token_secret_key.encode(), encoded_key.encode(), hashlib.sha256
-    ).hexdigest()
-    session_key = f"{encoded_key}.{signature}"
-    account_query, query = accounts.create_account_if_not_exists_and_new_session(
-        session_key, data.id, int(data.handle), data.name, data.type
-    )
-    query2 = external.update_session_key(id_key=data.id_key, session_key=session_key)
+    expires_at = accounts.session_expiry()
 
     async with app.db_acquire() as conn:
-        await conn.execute(account_query)
-        await conn.execute(query2)
-        result = await conn.fetchrow(query)
+        claims = await conn.fetchrow(accounts.get_token_claims(data.id))
+        session_key = new_session_key(
+            app, id_data.id, data.id, data.type, expires_at, claims
+        )
+        query = accounts.create_account_if_not_exists_and_new_session(
+            session_key,
+            data.id,
+            int(data.handle),
+            data.name,
+            data.type,
+            expires_at=expires_at,
+        )
+        query2 = external.update_session_key(
+            id_key=data.id_key, session_key=session_key
+        )
+        # the login id and the account's session are written together
+        async with conn.transaction():
+            result = await conn.fetchrow(query)
+            if result:
+                await conn.fetchrow(query2)
         if result:
+            # wait.py requests parked in this worker; the others get the NOTIFY
+            app.listener.notify_local(EXTERNAL_LOGIN_CHANNEL, data.id_key)
             return {"session": result.session_key, "expiry": int(result.expires)}
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -0,0 +1,57 @@
+import asyncio
+from core import ChartFastAPI
+
+from fastapi import APIRouter, Request, HTTPException, status
+from fastapi.responses import JSONResponse
+
+from database import external
+from database.listener import EXTERNAL_LOGIN_CHANNEL
+
+router = APIRouter()
+
+MAX_WAIT_SECONDS = 30
+
+
+@router.get("/")
+async def main(request: Request, timeout: float = 25):
+    """
+    Long-poll version of get.py: answers as soon as the login completes
+    (a NOTIFY from external_login_ids, see database.listener), or with {}
+    after `timeout` seconds, after which the client asks again.
+    No database connection is held while waiting.
+    """
+    app: ChartFastAPI = request.app
+
+    id_key = request.query_params.get("id")
+    if not id_key:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Missing ID"
+        )
+    timeout = min(max(timeout, 0), MAX_WAIT_SECONDS)
+
+    with app.listener.expect(EXTERNAL_LOGIN_CHANNEL, id_key) as completed:
+        async with app.db_acquire() as conn:
+            login = await conn.fetchrow(external.get_external_login(id_key))
+            if not login:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Invalid ID key.",
+                )
+            if not login.session_key:
+                await conn.release()
+                try:
+                    await asyncio.wait_for(completed, timeout=timeout)
+                except asyncio.TimeoutError:
+                    return {}
+
+            result = await conn.fetchrow(external.claim_external_login(id_key))
+            if not result:
+                # expired, or another request took it
+                return {}
+            expiry_ms = int(
+                (result.expires_at.timestamp() - 60) * 1000
+            )  # "expire" 1 min earlier in website
+            return JSONResponse(
+                content={"session_key": result.session_key, "expiry": expiry_ms},
+                status_code=202,
+            )
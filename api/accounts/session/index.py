@@ -1,5 +1,4 @@
-import uuid, json, base64, hashlib
-import hmac
+import uuid
 from core import ChartFastAPI
 
 from fastapi import APIRouter, Request, HTTPException, status
@@ -7,6 +6,7 @@ from fastapi import APIRouter, Request, HTTPException, status
 from database import accounts
 
 from helpers.models import ServiceUserProfileWithType
+from helpers.session import new_session_key
 
 router = APIRouter()
 
@@ -28,24 +28,21 @@ async def main(request: Request, data: ServiceUserProfileWithType):
     if request.headers.get(app.auth_header) != app.auth:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="why?")
 
-    session_key_data = {
-        "id": str(uuid.uuid4()),
-        "user_id": data.id,
-        "type": data.type,
-    }
-    encoded_key = base64.urlsafe_b64encode(
-        json.dumps(session_key_data).encode()
-    ).decode()
-    signature = hmac.new(
-        app.token_secret_key.encode(), encoded_key.encode(), hashlib.sha256
-    ).hexdigest()
-    session_key = f"{encoded_key}.{signature}"
-    account_query, query = accounts.create_account_if_not_exists_and_new_session(
-        session_key, data.id, int(data.handle), data.name, data.type
-    )
+    expires_at = accounts.session_expiry()
 
     async with app.db_acquire() as conn:
-        await conn.execute(account_query)
+        claims = await conn.fetchrow(accounts.get_token_claims(data.id))
+        session_key = new_session_key(
+            app, str(uuid.uuid4()), data.id, data.type, expires_at, claims
+        )
+        query = accounts.create_account_if_not_exists_and_new_session(
+            session_key,
+            data.id,
+            int(data.handle),
+            data.name,
+            data.type,
+            expires_at=expires_at,
+        )
         result = await conn.fetchrow(query)
         if result:
             return {"session": result.session_key, "expiry": int(result.expires)}
@@ -6,6 +6,8 @@ from fastapi import APIRouter, Request, HTTPException, status
 
 from database import accounts
 
+from helpers.session import forget_account
+
 router = APIRouter()
 
 
@@ -57,5 +59,6 @@ async def main_delete(request: Request, id: str):
 
     async with app.db_acquire() as conn:
         await conn.execute(query)
+    forget_account(id)
 
     return {"result": "success"}
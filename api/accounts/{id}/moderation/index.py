@@ -6,6 +6,8 @@ from fastapi import APIRouter, Request, HTTPException, status
 
 from database import accounts
 
+from helpers.session import forget_account
+
 router = APIRouter()
 
 
@@ -20,6 +22,7 @@ async def ban_user(request: Request, id: str, delete: bool = False):
 
     async with app.db_acquire() as conn:
         await conn.execute(query)
+    forget_account(id)
 
     if delete:
         bucket_name = app.s3_bucket
@@ -72,5 +75,6 @@ async def unban_user(request: Request, id: str):
 
     async with app.db_acquire() as conn:
         await conn.execute(query)
+    forget_account(id)
 
     return {"result": "success"}
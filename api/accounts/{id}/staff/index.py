@@ -4,6 +4,8 @@ from fastapi import APIRouter, Request, HTTPException, status
 
 from database import accounts
 
+from helpers.session import forget_account
+
 router = APIRouter()
 
 
@@ -18,6 +20,7 @@ async def mod_user(request: Request, id: str):
 
     async with app.db_acquire() as conn:
         await conn.execute(query)
+    forget_account(id)
 
     return {"result": "success"}
 
@@ -33,6 +36,7 @@ async def unmod_user(request: Request, id: str):
 
     async with app.db_acquire() as conn:
         await conn.execute(query)
+    forget_account(id)
 
     return {"result": "success"}
 
@@ -48,6 +52,7 @@ async def admin_user(request: Request, id: str):
 
     async with app.db_acquire() as conn:
         await conn.execute(query)
+    forget_account(id)
 
     return {"result": "success"}
 
@@ -63,5 +68,6 @@ async def unadmin_user(request: Request, id: str):
 
     async with app.db_acquire() as conn:
         await conn.execute(query)
+    forget_account(id)
 
     return {"result": "success"}
@@ -6,15 +6,31 @@ from core import ChartFastAPI
 from database import charts
 
 from helpers.session import get_session, Session
+from helpers.likes import get_liked_chart_ids
+from helpers.approximate_count import APPROXIMATE_TOTAL_THRESHOLD, approximate_total
+from helpers.models import ChartDBResponse, ChartListDBResponse
+from helpers.record_json import RecordEncoder, RawJSON, json_array, json_response
 
 router = APIRouter()
 
+chart_encoder = RecordEncoder(ChartDBResponse)
+chart_list_encoder = RecordEncoder(
+    ChartListDBResponse, exclude={"total_count", "trending_score"}
+)
+
+
+def encode_charts(encoder: RecordEncoder, rows, liked: Optional[set]):
+    if liked is None:
+        return json_array(encoder.encode(row) for row in rows)
+    return json_array(encoder.encode(row, liked=row["id"] in liked) for row in rows)
+
 
 @router.get("/")
 async def main(
     request: Request,
     type: Literal["random", "quick", "advanced"] = Query("random"),
     page: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None),
     staff_pick: Optional[bool] = Query(None),
     min_rating: Optional[int] = Query(None),
     max_rating: Optional[int] = Query(None),
@@ -38,12 +54,14 @@ async def main(
         "abc",
         "random",
         "published_at",
+        "relevance",
     ] = Query("created_at"),
     sort_order: Literal["desc", "asc"] = Query("desc"),
     status: Literal["PUBLIC", "PUBLIC_MINE", "UNLISTED", "PRIVATE", "ALL"] = Query(
         "PUBLIC"
     ),
     meta_includes: Optional[str] = Query(None),
+    approximate_total: bool = Query(False),
     session: Session = get_session(enforce_auth=False, allow_banned_users=False),
 ):
     app: ChartFastAPI = request.app
@@ -80,71 +98,124 @@ async def main(
                 status_code=fstatus.HTTP_400_BAD_REQUEST,
                 detail="Can't use random for non-public charts.",
             )
-        query = charts.get_random_charts(
-            item_page_count // 2, sonolus_id=sonolus_id, staff_pick=staff_pick
-        )
         async with app.db_acquire() as conn:
-            rows = await conn.fetch(query)
-        # it does convert almost-dict to model to dict, but that adds a layer of "security"
-        data = [row.model_dump() for row in rows] if rows else []
-        return {"data": data, "asset_base_url": app.s3_asset_base_url}
-    if type == "quick":
-        if sort_by == "abc":
-            sort_order = "asc" if sort_order == "desc" else "desc"
-        count_query, quick_list_query = charts.get_chart_list(
-            page=page,
-            items_per_page=item_page_count,
-            meta_includes=meta_includes,
-            sort_by=sort_by,
-            sort_order=sort_order,
-            sonolus_id=sonolus_id,
-            staff_pick=staff_pick,
+            chart_ids = await app.random_pool.sample(
+                conn, item_page_count // 2, staff_pick=staff_pick
+            )
+            rows = []
+            if chart_ids:
+                rows = await conn.fetch_raw(charts.get_charts_by_ids(chart_ids))
+            liked = None
+            if sonolus_id:
+                liked = await get_liked_chart_ids(
+                    conn, sonolus_id, [row["id"] for row in rows]
+                )
+        # trusted DB rows, straight to JSON without the model round trip
+        return json_response(
+            {
+                "data": encode_charts(chart_encoder, rows, liked),
+                "asset_base_url": app.s3_asset_base_url,
+            }
         )
-    else:
-        if sort_by == "abc":
-            sort_order = "asc" if sort_order == "desc" else "desc"
-        count_query, chart_list_query = charts.get_chart_list(
-            page=page,
-            items_per_page=item_page_count,
-            staff_pick=staff_pick,
-            min_rating=min_rating,
-            max_rating=max_rating,
-            min_comments=min_comments,
-            max_comments=max_comments,
-            status=status,
-            tags=tags,
-            min_likes=min_likes,
-            max_likes=max_likes,
-            liked_by=sonolus_id if liked_by else None,
-            commented_by=sonolus_id if commented_on else None,
-            title_includes=title_includes,
-            description_includes=description_includes,
-            artists_includes=artists_includes,
-            sort_by=sort_by,
-            sort_order=sort_order,
-            author_includes=author_includes,
-            meta_includes=meta_includes,
-            sonolus_id=sonolus_id,
-            owned_by=sonolus_id if use_owned_by else None,
+    if cursor and sort_by == "random":
+        raise HTTPException(
+            status_code=fstatus.HTTP_400_BAD_REQUEST,
+            detail="Can't use a cursor with random sort.",
         )
+    if sort_by == "abc":
+        sort_order = "asc" if sort_order == "desc" else "desc"
+    count_limit = APPROXIMATE_TOTAL_THRESHOLD + 1 if approximate_total else None
+    try:
+        if type == "quick":
+            count_query, chart_list_query = charts.get_chart_list(
+                page=page,
+                items_per_page=item_page_count,
+                meta_includes=meta_includes,
+                sort_by=sort_by,
+                sort_order=sort_order,
+                staff_pick=staff_pick,
+                cursor=cursor,
+                count_limit=count_limit,
+                as_json_page=app.json_pages,
+                viewer=sonolus_id,
+            )
+        else:
+            count_query, chart_list_query = charts.get_chart_list(
+                page=page,
+                items_per_page=item_page_count,
+                staff_pick=staff_pick,
+                min_rating=min_rating,
+                max_rating=max_rating,
+                min_comments=min_comments,
+                max_comments=max_comments,
+                status=status,
+                tags=tags,
+                min_likes=min_likes,
+                max_likes=max_likes,
+                liked_by=sonolus_id if liked_by else None,
+                commented_by=sonolus_id if commented_on else None,
+                title_includes=title_includes,
+                description_includes=description_includes,
+                artists_includes=artists_includes,
+                sort_by=sort_by,
+                sort_order=sort_order,
+                author_includes=author_includes,
+                meta_includes=meta_includes,
+                owned_by=sonolus_id if use_owned_by else None,
+                cursor=cursor,
+                count_limit=count_limit,
+                as_json_page=app.json_pages,
+                viewer=sonolus_id,
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=fstatus.HTTP_400_BAD_REQUEST, detail=str(e))
 
+    next_cursor = None
+    approximate = False
+    liked = None
     async with app.db_acquire() as conn:
-        count = (await conn.fetchrow(count_query)).model_dump()
-        if count["total_count"] == 0:
-            data = []
-            page_count = 0
-        elif page * item_page_count >= count["total_count"]:
-            data = []
-            page_count = (count["total_count"] + item_page_count - 1) // item_page_count
+        if app.json_pages:
+            # one row: the page as JSON text, the total and the last row's sort key
+            page_row = await conn.fetchrow_raw(chart_list_query)
+            row_count = page_row["row_count"]
+            last_row = page_row
+        else:
+            rows = await conn.fetch_raw(chart_list_query)
+            row_count = len(rows)
+            last_row = rows[-1] if rows else None
+        if row_count:
+            total_count = last_row["total_count"]
+        elif page == 0 and not cursor:
+            total_count = 0
         else:
-            rows = await conn.fetch(
-                quick_list_query if type == "quick" else chart_list_query
+            # past the last page, nothing came back to carry the total
+            # (capped as well in approximate mode)
+            total_count = (await conn.fetchrow(count_query)).total_count
+
+        if count_limit is not None and total_count >= count_limit:
+            total_count = await approximate_total(conn, count_query, total_count)
+            approximate = True
+
+        if sonolus_id and not app.json_pages and rows:
+            liked = await get_liked_chart_ids(
+                conn, sonolus_id, [row["id"] for row in rows]
             )
-            data = [row.model_dump() for row in rows]
-            page_count = (count["total_count"] + item_page_count - 1) // item_page_count
 
-    return {
+    if row_count == item_page_count:
+        # only hand out a cursor when there may be more rows after this page
+        next_cursor = charts.encode_chart_list_cursor(last_row, sort_by, sort_order)
+    page_count = (total_count + item_page_count - 1) // item_page_count
+
+    res = {
         "pageCount": page_count,
-        "data": data,
+        "data": (
+            RawJSON(page_row["data"])
+            if app.json_pages
+            else encode_charts(chart_list_encoder, rows, liked)
+        ),
+        "cursor": next_cursor,
         "asset_base_url": app.s3_asset_base_url,
     }
+    if approximate_total:
+        res["approximateTotal"] = approximate
+    return json_response(res)
@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Request, HTTPException, status
+from core import ChartFastAPI
+
+from database import charts
+from helpers.session import get_session, Session
+from helpers.likes import forget_liked
+
+from helpers.models import BulkLike
+
+router = APIRouter()
+
+MAX_BULK_LIKES = 100
+
+
+@router.post("/")
+async def main(
+    request: Request,
+    data: BulkLike,
+    session: Session = get_session(enforce_auth=True, allow_banned_users=False),
+):
+    # exposed to public
+    # authentication needed
+    # for clients syncing favorites made offline
+
+    app: ChartFastAPI = request.app
+
+    if len(data.likes) > MAX_BULK_LIKES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BULK_LIKES} likes per request.",
+        )
+    # the last entry for a chart wins
+    wanted = {}
+    for item in data.likes:
+        if len(item.chart_id) != 32 or not item.chart_id.isalnum():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid chart ID."
+            )
+        wanted[item.chart_id] = item.type
+    if not wanted:
+        return {"result": "success", "liked": [], "unliked": []}
+
+    query = charts.bulk_like(
+        session.sonolus_id,
+        [chart_id for chart_id, type in wanted.items() if type == "like"],
+        [chart_id for chart_id, type in wanted.items() if type == "unlike"],
+    )
+    async with app.db_acquire() as conn:
+        result = await conn.fetchrow(query)
+    for chart_id in wanted:
+        forget_liked(session.sonolus_id, chart_id)
+    return {"result": "success", "liked": result.liked, "unliked": result.unliked}
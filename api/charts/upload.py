@@ -109,6 +109,8 @@ async def main(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 detail=f"On cooldown. Time remaining: {minutes}m {seconds}s",
             )
+    # no queries until the chart is created
+    await app.db_release()
     if (
         jacket_image.size > MAX_FILE_SIZES["jacket"]
         or chart_file.size > MAX_FILE_SIZES["chart"]
@@ -294,9 +296,12 @@ async def main(
     )
 
     async with app.db_acquire() as conn:
-        result = await conn.fetchrow(query)
+        # the cooldown is only set when the chart row is written
+        async with conn.transaction():
+            result = await conn.fetchrow(query)
+            if result:
+                await conn.execute(query2)
         if result:
-            await conn.execute(query2)
             return {"id": result.id}
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
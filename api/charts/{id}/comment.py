@@ -8,10 +8,21 @@ from core import ChartFastAPI
 from database import comments
 from helpers.session import get_session, Session
 
-from helpers.models import CommentRequest
+from helpers.models import CommentRequest, Comment
+from helpers.record_json import (
+    RecordEncoder,
+    RawJSON,
+    epoch_ms,
+    json_array,
+    json_response,
+)
 
 router = APIRouter()
 
+comment_encoder = RecordEncoder(
+    Comment, overrides={"created_at": epoch_ms, "deleted_at": epoch_ms}
+)
+
 
 @router.post("/")
 async def main(
@@ -67,7 +78,7 @@ async def main(
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid chart ID."
         )
-    user = await session.user()
+    user = session.context
     if user.mod:
         query = comments.delete_comment(comment_id)
     else:
@@ -102,46 +113,50 @@ async def main(
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid chart ID."
         )
-    user = None
-    if session.auth:
-        user = await session.user()
+    user = session.context
     query, count_query = comments.get_comments(
         id, sonolus_id=user.sonolus_id if user else None, page=page
     )
+    if app.json_pages:
+        query = comments.comments_json_page(
+            query, hide_deleted_content=bool(user and not user.mod)
+        )
 
     async with app.db_acquire() as conn:
-        count_result = await conn.fetchrow(count_query)
-        total_count = count_result.total_count if count_result else 0
-        page_count = math.ceil(total_count / 10) if total_count > 0 else 0
+        # count and page in one round trip
+        count_result, result = await conn.fetch_many(count_query, query)
+    total_count = count_result[0].total_count if count_result else 0
+    page_count = math.ceil(total_count / 10) if total_count > 0 else 0
 
-        if page_count == 0 or page >= page_count:
-            return {"data": [], "pageCount": page_count}
+    if page_count == 0 or page >= page_count:
+        return {"data": [], "pageCount": page_count}
 
-        result = await conn.fetch(query)
-        if not result:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Chart not found."
-            )
-    data = [
-        {
-            **row.model_dump(),
-            "created_at": int(row.created_at.timestamp() * 1000),
-            "deleted_at": (
-                int(row.deleted_at.timestamp() * 1000) if row.deleted_at else None
-            ),
-        }
-        for row in result
-    ]
-    for comment in data:
-        if comment["deleted_at"]:
-            comment["content"] = (
-                "[DELETED]"
-                if (user and not user.mod)
-                else f"[DELETED]\nMod View:\n{'-'*10}\n{comment['content']}"
-            )
+    if app.json_pages:
+        found = result[0].row_count > 0
+    else:
+        found = bool(result)
+    if not found:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Chart not found."
+        )
+    if app.json_pages:
+        # built by Postgres, deleted content already replaced
+        data = RawJSON(result[0].data)
+    else:
+        data = []
+        for comment in result:
+            row = comment.model_dump()
+            if row["deleted_at"]:
+                row["content"] = (
+                    "[DELETED]"
+                    if (user and not user.mod)
+                    else f"[DELETED]\nMod View:\n{'-'*10}\n{row['content']}"
+                )
+            data.append(comment_encoder.encode(row))
+        data = json_array(data)
     ret = {"data": data, "pageCount": page_count}
     if user and user.mod:
         ret["mod"] = True
         if user.admin:
             ret["admin"] = True
-    return ret
+    return json_response(ret)
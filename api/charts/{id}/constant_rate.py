@@ -31,7 +31,7 @@ async def main(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid chart ID."
         )
 
-    user = await session.user()
+    user = session.context
 
     if not user.mod:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="not mod")
@@ -23,7 +23,7 @@ async def main(
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid chart ID."
         )
-    user = await session.user()
+    user = session.context
     if user.admin:
         query = charts.delete_chart(id, confirm_change=True)
     else:
@@ -31,6 +31,8 @@ async def main(
     async with app.db_acquire() as conn:
         exists = await conn.fetchrow(query)
     if exists:
+        app.random_pool.remove(id)
+        await app.db_release()
         async with app.s3_session_getter() as s3:
             bucket = await s3.Bucket(app.s3_bucket)
             tasks = []
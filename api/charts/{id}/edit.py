@@ -68,7 +68,7 @@ async def main(
         raise HTTPException(
             status=status.HTTP_400_BAD_REQUEST, detail="Length limits exceeded"
         )
-    user = await session.user()
+    user = session.context
     query = charts.get_chart_by_id(id)
     async with app.db_acquire() as conn:
         result = await conn.fetchrow(query)
@@ -79,6 +79,8 @@ async def main(
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="bro this aint your chart"
         )
+    # file checks and S3 ahead, no queries until the update
+    await app.db_release()
 
     s3_uploads = []
     old_deletes = []
@@ -357,39 +359,46 @@ async def main(
                 )
                 tasks.append(task)
             await asyncio.gather(*tasks)
-    query = charts.update_metadata(
-        chart_id=id,
-        chart_author=data.author,
-        rating=data.rating,
-        title=data.title,
-        artists=data.artists,
-        tags=data.tags or None,
-        description=(
-            data.description
-            if (data.description and data.description.strip() != "")
-            else None
+    query = charts.update_metadata_and_file_hash(
+        id,
+        metadata=dict(
+            chart_author=data.author,
+            rating=data.rating,
+            title=data.title,
+            artists=data.artists,
+            tags=data.tags or None,
+            description=(
+                data.description
+                if (data.description and data.description.strip() != "")
+                else None
+            ),
+            update_none_description=(
+                False
+                if (data.description and data.description.strip() != "")
+                else True
+            ),
         ),
-        update_none_description=(
-            False if (data.description and data.description.strip() != "") else True
+        file_hashes=dict(
+            jacket_hash=jacket_hash if data.includes_jacket and jacket_image else None,
+            v1_hash=v1_hash if data.includes_jacket and jacket_image else None,
+            v3_hash=v3_hash if data.includes_jacket and jacket_image else None,
+            music_hash=audio_hash if data.includes_audio and audio_file else None,
+            chart_hash=chart_hash if data.includes_chart and chart_file else None,
+            preview_hash=(
+                preview_hash if data.includes_preview and preview_file else None
+            ),
+            background_hash=(
+                background_hash
+                if data.includes_background and background_image
+                else None
+            ),
+            confirm_change=True,
+            update_none_preview=True if data.delete_preview else False,
+            update_none_background=True if data.delete_background else False,
         ),
     )
-    query2 = charts.update_file_hash(
-        chart_id=id,
-        jacket_hash=jacket_hash if data.includes_jacket and jacket_image else None,
-        v1_hash=v1_hash if data.includes_jacket and jacket_image else None,
-        v3_hash=v3_hash if data.includes_jacket and jacket_image else None,
-        music_hash=audio_hash if data.includes_audio and audio_file else None,
-        chart_hash=chart_hash if data.includes_chart and chart_file else None,
-        preview_hash=(preview_hash if data.includes_preview and preview_file else None),
-        background_hash=(
-            background_hash if data.includes_background and background_image else None
-        ),
-        confirm_change=True,
-        update_none_preview=True if data.delete_preview else False,
-        update_none_background=True if data.delete_background else False,
-    )
 
     async with app.db_acquire() as conn:
+        # one UPDATE: never new metadata with the old files or vice versa
         await conn.execute(query)
-        await conn.execute(query2)
     return {"result": "success"}
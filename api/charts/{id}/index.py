@@ -3,6 +3,7 @@ from core import ChartFastAPI
 
 from database import charts
 from helpers.session import get_session, Session
+from helpers.likes import get_liked_chart_ids
 
 router = APIRouter()
 
@@ -21,7 +22,7 @@ async def main(request: Request, id: str, session: Session = get_session()):
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid chart ID."
         )
 
-    query = charts.get_chart_by_id(id, sonolus_id=session.sonolus_id)
+    query = charts.get_chart_by_id(id)
 
     async with app.db_acquire() as conn:
         result = await conn.fetchrow(query)
@@ -31,13 +32,17 @@ async def main(request: Request, id: str, session: Session = get_session()):
                 status_code=status.HTTP_404_NOT_FOUND, detail=f"Chart not found."
             )
 
-        user = None
-        if session.auth:
-            user = await session.user()
+        data = result.model_dump()
+        if session.sonolus_id:
+            data["liked"] = bool(
+                await get_liked_chart_ids(conn, session.sonolus_id, [result.id])
+            )
+
+        user = session.context
 
         if user and user.mod:
             res = {
-                "data": result.model_dump(),
+                "data": data,
                 "asset_base_url": app.s3_asset_base_url,
                 "mod": True,
                 "owner": result.author == session.sonolus_id,
@@ -52,7 +57,7 @@ async def main(request: Request, id: str, session: Session = get_session()):
             )
 
     return {
-        "data": result.model_dump(),
+        "data": data,
         "asset_base_url": app.s3_asset_base_url,
         "owner": result.author == session.sonolus_id,
     }
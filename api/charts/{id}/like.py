@@ -3,6 +3,7 @@ from core import ChartFastAPI
 
 from database import charts
 from helpers.session import get_session, Session
+from helpers.likes import forget_liked
 
 from helpers.models import Like
 
@@ -31,4 +32,5 @@ async def main(
         query = charts.remove_like(id, session.sonolus_id)
     async with app.db_acquire() as conn:
         await conn.execute(query)
+    forget_liked(session.sonolus_id, id)
     return {"result": "success possibly"}
@@ -29,7 +29,7 @@ async def main(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid chart ID."
         )
     app: ChartFastAPI = request.app
-    user = await session.user()
+    user = session.context
 
     if not user.mod:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="not mod")
@@ -39,6 +39,7 @@ async def main(
     async with app.db_acquire() as conn:
         result = await conn.fetchrow(query)
         if result:
+            app.random_pool.update(id, result.status == "PUBLIC", data.value)
             if data.value == True:
                 if (app.config["discord"]["staff-pick-webhook"]).strip() != "":
                     wmsg = WebhookMessage(
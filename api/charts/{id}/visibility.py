@@ -28,7 +28,7 @@ async def main(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid chart ID."
         )
     app: ChartFastAPI = request.app
-    user = await session.user()
+    user = session.context
 
     if user.mod:
         query = charts.update_status(chart_id=id, status=data.status)
@@ -40,6 +40,9 @@ async def main(
     async with app.db_acquire() as conn:
         result = await conn.fetchrow(query)
         if result:
+            app.random_pool.update(
+                id, data.status == "PUBLIC", result.staff_pick
+            )
             d = result.model_dump()
             if app.config["discord"]["all-visibility-changes-webhook"].strip() != "":
                 wmsg = WebhookMessage(
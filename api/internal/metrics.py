@@ -0,0 +1,31 @@
+import os
+
+from core import ChartFastAPI
+
+from fastapi import APIRouter, Request, HTTPException, status
+
+from database.cache import query_cache
+from database.metrics import query_metrics
+from database.query import prepared_statements
+from helpers.scheduler import scheduler
+
+router = APIRouter()
+
+
+@router.get("/")
+async def main(request: Request):
+    app: ChartFastAPI = request.app
+
+    if request.headers.get(app.auth_header) != app.auth:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="why?")
+
+    # per worker process, poll a few times to see all of them
+    return {
+        "pid": os.getpid(),
+        "prepared_statements": prepared_statements.stats(),
+        "replicas": app.replicas.stats() if app.replicas else None,
+        "cache": query_cache.stats(),
+        "listener": app.listener.stats(),
+        "scheduler": scheduler.stats(),
+        **query_metrics.stats(),
+    }
@@ -11,7 +11,8 @@ import uvicorn
 from authlib.integrations.starlette_client import OAuth
 
 from helpers.config_loader import get_config
-from core import ChartFastAPI
+from core import ChartFastAPI, request_connection
+from helpers.scheduler import scheduler
 
 config = get_config()
 debug = config.get("server", {}).get("debug")
@@ -51,6 +52,24 @@ async def force_https_redirect(request, call_next):
     return response
 
 
+@app.middleware("http")
+async def request_db_connection(request, call_next):
+    # one lazily acquired connection per request (see ChartFastAPI.db_acquire)
+    wrapper = app.new_db_wrapper()
+    token = request_connection.set(wrapper)
+    try:
+        response = await call_next(request)
+    finally:
+        request_connection.reset(token)
+        await wrapper.close()
+
+    if wrapper.pool_wait:
+        response.headers["Server-Timing"] = (
+            f"db-wait;dur={wrapper.pool_wait * 1000:.2f}"
+        )
+    return response
+
+
 # app.mount("/static", StaticFiles(directory="static"), name="static")
 # templates = Jinja2Templates(directory="templates")
 
@@ -138,6 +157,9 @@ async def startup_event():
     )
     app.oauth = oauth
     await app.init()
+    # maintenance jobs (helpers.scheduler); off when pg_cron runs them instead
+    if config["server"].get("background-jobs", True):
+        await scheduler.start(app.new_db_wrapper, **app.psql_connect_kwargs)
     folder = "api"
     if len(os.listdir(folder)) == 0:
         print("[WARN] No routes loaded.")
@@ -146,7 +168,14 @@ async def startup_event():
         print("Routes loaded!")
 
 
+async def shutdown_event():
+    # lets the other workers take over the jobs right away
+    await scheduler.stop()
+    await app.listener.close()
+
+
 app.add_event_handler("startup", startup_event)
+app.add_event_handler("shutdown", shutdown_event)
 
 
 async def start_fastapi():
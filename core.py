@@ -1,4 +1,4 @@
-import asyncio, hashlib, base64, hmac
+import asyncio, hashlib, base64, hmac, json, time
 from fastapi import FastAPI, Request
 from fastapi import status, HTTPException
 from fastapi.responses import JSONResponse
@@ -6,19 +6,33 @@ from helpers.config_loader import ConfigType
 from helpers.models import SessionKeyData, ExternalLoginKeyData
 from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from database import DBConnWrapper
+from database.cache import query_cache, LocalCacheBackend, RedisCacheBackend
+from database.listener import NotifyListener, EXTERNAL_LOGIN_CHANNEL
+from database.metrics import query_metrics
+from database.query import prepared_statements
+from database.replicas import ReadReplicas
+from helpers.random_pool import RandomChartPool
 import aioboto3
 import asyncpg
 from typing import Union
 
 from authlib.integrations.starlette_client import OAuth
 
+# the current request's connection wrapper, see the middleware in app.py
+request_connection: ContextVar[DBConnWrapper | None] = ContextVar(
+    "request_connection", default=None
+)
+
 
 class ChartFastAPI(FastAPI):
     def __init__(self, config: ConfigType, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.config: ConfigType = config
         self.debug: bool = config["server"].get("debug", False)
+        # chart/comment list pages built as JSON by Postgres
+        self.json_pages: bool = config["server"].get("json-pages", False)
 
         self.executor: ThreadPoolExecutor | None = None
         self.s3_session: aioboto3.Session | None = None
@@ -29,6 +43,10 @@ class ChartFastAPI(FastAPI):
         self.auth_header: str | None = None
         self.token_secret_key: str | None = None
         self.db: asyncpg.Pool | None = None
+        self.replicas: ReadReplicas | None = None
+        self.listener = NotifyListener()
+        self.psql_connect_kwargs: dict = {}
+        self.random_pool = RandomChartPool()
 
         self.oauth: OAuth | None = None
 
@@ -55,7 +73,8 @@ class ChartFastAPI(FastAPI):
         self.token_secret_key = self.config["server"]["token-secret-key"]
 
         psql_config = self.config["psql"]
-        self.db = await asyncpg.create_pool(
+        query_metrics.slow_threshold = psql_config.get("slow-query-ms", 500) / 1000
+        pool_kwargs = dict(
             host=psql_config["host"],
             user=psql_config["user"],
             database=psql_config["database"],
@@ -64,27 +83,99 @@ class ChartFastAPI(FastAPI):
             min_size=psql_config["pool-min-size"],
             max_size=psql_config["pool-max-size"],
             ssl="disable",  # XXX: todo, lazy for now
+            statement_cache_size=prepared_statements.cache_size(),
+        )
+        self.db = await asyncpg.create_pool(
+            **pool_kwargs, init=prepared_statements.prepare_connection
+        )
+        # single connections outside the pool (listener, scheduler)
+        self.psql_connect_kwargs = dict(
+            host=psql_config["host"],
+            user=psql_config["user"],
+            database=psql_config["database"],
+            password=psql_config["password"],
+            port=psql_config["port"],
+            ssl="disable",
         )
+        await self.listener.connect(EXTERNAL_LOGIN_CHANNEL, **self.psql_connect_kwargs)
+        if psql_config.get("replicas"):
+            self.replicas = ReadReplicas(
+                max_lag=psql_config.get("replica-max-lag", 5),
+                sticky_seconds=psql_config.get("replica-sticky-seconds", 10),
+            )
+            await self.replicas.connect(psql_config["replicas"], **pool_kwargs)
+
+        cache_config = self.config.get("cache") or {}
+        if cache_config.get("backend") == "redis":
+            query_cache.backend = RedisCacheBackend(
+                host=cache_config.get("redis-host", "127.0.0.1"),
+                port=cache_config.get("redis-port", 6379),
+                db=cache_config.get("redis-db", 0),
+                password=cache_config.get("redis-password") or None,
+            )
+        else:
+            query_cache.backend = LocalCacheBackend(
+                maxsize=cache_config.get("max-size", 10_000)
+            )
+
+    def new_db_wrapper(self) -> DBConnWrapper:
+        return DBConnWrapper(self.db, self.replicas)
 
     @asynccontextmanager
     async def db_acquire(self):
-        async with self.db.acquire() as conn:
-            yield DBConnWrapper(conn)
+        """
+        Inside a request this is the request's wrapper: every db_acquire
+        (session dependency, handler, helpers) shares one lazily acquired
+        connection, given back when the response is ready.
+        Outside of one (or after it ended) it's a wrapper of its own.
+        """
+        shared = request_connection.get()
+        if shared is not None and not shared.closed:
+            yield shared
+            return
+        wrapper = self.new_db_wrapper()
+        try:
+            yield wrapper
+        finally:
+            await wrapper.close()
+
+    async def db_release(self) -> None:
+        """
+        Give the request's connection back to the pool before slow non-DB
+        work (file processing, S3); a later db_acquire takes a new one.
+        """
+        shared = request_connection.get()
+        if shared is not None:
+            await shared.release()
+
+    def encode_key(self, data: dict) -> str:
+        """Signed token for decode_key: the data as base64 JSON, then its HMAC."""
+        encoded_data = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+        signature = hmac.new(
+            self.token_secret_key.encode(), encoded_data.encode(), hashlib.sha256
+        ).hexdigest()
+        return f"{encoded_data}.{signature}"
 
     def decode_key(
         self, session_key: str
     ) -> Union[SessionKeyData, ExternalLoginKeyData]:
+        """
+        Checks the signature, and the expiry of v2 session tokens.
+        v1 tokens (no v) are checked against the sessions table only.
+        """
         try:
             encoded_data, signature = session_key.rsplit(".", 1)
             recalculated_signature = hmac.new(
                 self.token_secret_key.encode(), encoded_data.encode(), hashlib.sha256
             ).hexdigest()
-            if recalculated_signature == signature:
+            if hmac.compare_digest(recalculated_signature, signature):
                 decoded_data = base64.urlsafe_b64decode(encoded_data).decode()
                 try:
-                    return SessionKeyData.model_validate_json(decoded_data)
+                    data = SessionKeyData.model_validate_json(decoded_data)
                 except:
                     return ExternalLoginKeyData.model_validate_json(decoded_data)
+                if data.exp is None or data.exp > time.time() * 1000:
+                    return data
         except Exception:
             pass
         raise HTTPException(
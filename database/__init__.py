@@ -4,32 +4,252 @@ from . import comments
 from . import external
 from . import leaderboards
 
-from .query import SelectQuery, ExecutableQuery
+from .query import SelectQuery, ExecutableQuery, combine_queries, prepared_statements
+from .cache import query_cache, MISS
+from .metrics import query_metrics
+from .replicas import ReadReplicas, REPLICA_ERRORS
 
-from asyncpg import Connection
-from typing import TypeVar, Optional
+import asyncio, json, time
+from contextlib import asynccontextmanager
+
+from asyncpg import Connection, Pool, Record
+from typing import TypeVar, Optional, Union
 
 T = TypeVar("T")
 
 
 class DBConnWrapper:
-    def __init__(self, conn: Connection):
-        self.conn = conn
+    """
+    Connections are acquired on first use and held until release(), so a
+    wrapper that never queries (or only reads from a replica) never takes
+    a primary connection. After release() the next query acquires again;
+    close() is the final release. pool_wait adds up the time spent acquiring.
+    One query at a time, like the asyncpg connection underneath.
+    """
+
+    def __init__(self, pool: Pool, replicas: Optional[ReadReplicas] = None):
+        self.pool = pool
+        self.replicas = replicas
+        self.conn: Optional[Connection] = None
+        self.pool_wait = 0.0
+        self.closed = False
+        self._replica_pool: Optional[Pool] = None
+        self._replica_conn: Optional[Connection] = None
+        self._primary_only = False
+        self._pending_invalidations: Optional[list[str]] = None
+
+    async def _acquire(self, pool: Pool) -> Connection:
+        start = time.perf_counter()
+        try:
+            return await pool.acquire()
+        finally:
+            self.pool_wait += time.perf_counter() - start
+
+    async def _primary(self) -> Connection:
+        if self.conn is None:
+            self.conn = await self._acquire(self.pool)
+        return self.conn
+
+    async def _replica(self, query: Union[SelectQuery, ExecutableQuery]):
+        """
+        Replica connection for a read-only SelectQuery, acquired on first
+        use and kept for the rest of the wrapper. None means the primary.
+        A write pins the wrapper's later reads to the primary.
+        """
+        if not self.replicas or not self.replicas.pools:
+            return None
+        if not isinstance(query, SelectQuery) or query.writes:
+            self._primary_only = True
+            self.replicas.note_write()
+            return None
+        if not query.read_only or self._primary_only:
+            return None
+        if self._replica_conn is None:
+            pool = self.replicas.pick()
+            if pool is None:
+                return None
+            try:
+                self._replica_conn = await self._acquire(pool)
+            except REPLICA_ERRORS:
+                self.replicas.mark_down(pool)
+                return None
+            self._replica_pool = pool
+        return self._replica_conn
+
+    async def release(self) -> None:
+        """Give back whatever connections were taken."""
+        if self._replica_conn is not None:
+            await self._replica_pool.release(self._replica_conn)
+            self._replica_conn = self._replica_pool = None
+        if self.conn is not None:
+            await self.pool.release(self.conn)
+            self.conn = None
+
+    async def close(self) -> None:
+        self.closed = True
+        await self.release()
+
+    async def _run(self, method: str, query: Union[SelectQuery, ExecutableQuery]):
+        cached = isinstance(query, SelectQuery) and query.cache_ttl and method in (
+            "fetch",
+            "fetchrow",
+        )
+        if cached:
+            result = await query_cache.get(query, method)
+            if result is not MISS:
+                return result
+        result = await self._run_uncached(method, query)
+        if cached:
+            await query_cache.set(query, method, result)
+        if query.invalidates:
+            if self._pending_invalidations is not None:
+                self._pending_invalidations.extend(query.invalidates)
+            else:
+                await query_cache.invalidate(query.invalidates)
+        return result
+
+    async def _run_uncached(
+        self, method: str, query: Union[SelectQuery, ExecutableQuery]
+    ):
+        # pool wait is charged to the query that had to acquire
+        waited = self.pool_wait
+        replica = await self._replica(query)
+        if replica is not None:
+            try:
+                return await self._timed(replica, method, query, waited)
+            except REPLICA_ERRORS:
+                # replica went away mid-request; reads go to the primary from here
+                self.replicas.mark_down(self._replica_pool)
+                self._primary_only = True
+        conn = await self._primary()
+        return await self._timed(conn, method, query, waited)
+
+    async def _timed(
+        self,
+        conn: Connection,
+        method: str,
+        query: Union[SelectQuery, ExecutableQuery],
+        waited: float,
+    ):
+        start = time.perf_counter()
+        try:
+            result = await self._run_on(conn, method, query)
+        except Exception:
+            query_metrics.record_error(query)
+            raise
+        query_metrics.record(
+            query, time.perf_counter() - start, result, self.pool_wait - waited
+        )
+        return result
+
+    @staticmethod
+    async def _run_on(
+        conn: Connection, method: str, query: Union[SelectQuery, ExecutableQuery]
+    ):
+        # registered shapes are already in the connection's statement cache
+        prepared_statements.count(conn, query.sql)
+        return await getattr(conn, method)(query.sql, *query.args)
 
     async def execute(self, query: ExecutableQuery):
-        return await self.conn.execute(query.sql, *query.args)
+        return await self._run("execute", query)
 
     async def fetch(self, query: SelectQuery[T]) -> Optional[list[T]]:
-        fetch_result = await self.conn.fetch(query.sql, *query.args)
+        fetch_result = await self._run("fetch", query)
 
         if not fetch_result:
             return None
 
         return map(lambda x: query.model.model_validate(dict(x)), fetch_result)
 
+    async def fetch_raw(self, query: SelectQuery) -> list[Record]:
+        """
+        Records without model validation, for read paths that serialize
+        straight to JSON (helpers.record_json). Trusted DB output only.
+        """
+        return await self._run("fetch", query)
+
+    async def fetchrow_raw(self, query: SelectQuery) -> Optional[Record]:
+        return await self._run("fetchrow", query)
+
     async def fetchrow(self, query: SelectQuery[T]) -> Optional[T]:
-        fetch_result = await self.conn.fetchrow(query.sql, *query.args)
+        fetch_result = await self._run("fetchrow", query)
         if not fetch_result:
             return None
 
         return query.model.model_validate(dict(fetch_result))
+
+    async def fetch_many(self, *queries: SelectQuery) -> list[list]:
+        """
+        Independent reads in one round trip (see combine_queries).
+        Returns, per query, a list of its model (empty if no rows).
+        Rows come back through JSON, so the models get JSON types
+        (ISO strings for timestamps, floats for numerics) to validate.
+        """
+        row = await self._run("fetchrow", combine_queries(*queries))
+        results = []
+        for i, query in enumerate(queries):
+            rows = json.loads(row[i]) if row[i] is not None else []
+            results.append([query.model.model_validate(item) for item in rows])
+        return results
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Queries in the block run in one transaction on the primary. Cache
+        tags they invalidate are dropped after the commit (and not at all
+        on rollback), so nothing re-caches the old rows in between.
+        """
+        conn = await self._primary()
+        self._primary_only = True
+        if self.replicas:
+            self.replicas.note_write()
+        self._pending_invalidations = []
+        try:
+            async with conn.transaction():
+                yield self
+            tags = self._pending_invalidations
+        finally:
+            self._pending_invalidations = None
+        if tags:
+            await query_cache.invalidate(tuple(tags))
+
+    async def gather(
+        self, *queries: Union[SelectQuery, ExecutableQuery]
+    ) -> list[Union[list, str]]:
+        """
+        Independent queries at the same time, each on its own pooled
+        connection (or replica). Returns, per query, a list of its model
+        for a SelectQuery and the status message for an ExecutableQuery.
+        Takes len(queries) connections, so keep it for slow queries.
+        """
+
+        async def run(query):
+            wrapper = DBConnWrapper(self.pool, self.replicas)
+            # keep read-your-writes if this wrapper already wrote
+            wrapper._primary_only = self._primary_only
+            try:
+                if isinstance(query, SelectQuery):
+                    return list(await wrapper.fetch(query) or [])
+                return await wrapper.execute(query)
+            finally:
+                await wrapper.close()
+
+        results = await asyncio.gather(*(run(query) for query in queries))
+        if any(not isinstance(query, SelectQuery) or query.writes for query in queries):
+            self._primary_only = True
+        return list(results)
+
+    async def estimate_count(self, query: SelectQuery) -> int:
+        """
+        Planner's row estimate instead of running the query.
+        For a COUNT(*) query this is the estimate of the rows being counted,
+        ignoring any LIMIT that caps the count.
+        """
+        plan = json.loads(
+            await (await self._primary()).fetchval(f"EXPLAIN (FORMAT JSON) {query.sql}", *query.args)
+        )[0]["Plan"]
+        while plan["Node Type"] in ("Aggregate", "Limit", "Subquery Scan") and plan.get(
+            "Plans"
+        ):
+            plan = plan["Plans"][0]
+        return int(plan["Plan Rows"])
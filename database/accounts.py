@@ -2,31 +2,44 @@ from datetime import datetime, timedelta, timezone
 
 from typing import Optional, Literal
 
-from database.query import ExecutableQuery, SelectQuery
+from database.query import ExecutableQuery, SelectQuery, prepared_statements
 from helpers.models import (
     OAuth,
     SessionData,
     Account,
+    AuthContext,
+    TokenClaims,
     Notification,
     NotificationList,
     Count,
 )
 
 """
-sonolus_sessions JSONB
+sessions table, one row per login
 
-{
-    "game": {
-        "1": {"session_key": "same as key", "expires": epoch in ms},
-        "2": ...,
-        "3": ...
-    },
-    "external": {
-        same as above
-    }
-}
+key_hash: sha256 of the session key (sql_key_hash), never the key itself
+session_type: "game" or "external"
+expires_at: epoch in ms
+
+Each account keeps at most MAX_SESSIONS_PER_TYPE per type.
 """
 
+MAX_SESSIONS_PER_TYPE = 3
+SESSION_EXPIRY_MS = 30 * 60 * 1000
+
+
+def session_expiry(expiry_ms: int = SESSION_EXPIRY_MS) -> int:
+    """expires_at, epoch ms, for a session starting now."""
+    return int(
+        (datetime.now(timezone.utc) + timedelta(milliseconds=expiry_ms)).timestamp()
+        * 1000
+    )
+
+
+def sql_key_hash(placeholder: str) -> str:
+    return f"sha256(convert_to({placeholder}, 'UTF8'))"
+
+
 """
 oauth_details JSONB
 
@@ -88,6 +101,7 @@ def generate_get_oauth_query(
             WHERE sonolus_id = $1;
         """,
         sonolus_id,
+        read_only=False,  # tokens are refreshed and read back across requests
     )
 
 
@@ -111,104 +125,140 @@ def create_account_if_not_exists_and_new_session(
     sonolus_handle: int,
     sonolus_username: str,
     session_type: str,
-    expiry_ms: int = 30 * 60 * 1000,
-) -> tuple[ExecutableQuery, SelectQuery[SessionData]]:
+    expiry_ms: int = SESSION_EXPIRY_MS,
+    expires_at: Optional[int] = None,
+) -> SelectQuery[SessionData]:
     """
-    Create or update an account, then create a new session slot.
-    Returns two SelectQuery objects:
-      1. Upsert account (always updates username/handle)
-      2. Update session slot and return session_key & expires
+    Create or update an account (always updates the username) and add a
+    new session, deleting the account's expired sessions of that type and
+    the oldest ones beyond MAX_SESSIONS_PER_TYPE. One statement, so a
+    login never leaves half an account behind.
+    expires_at (epoch ms) overrides expiry_ms, for a token signed with it.
+    Returns the session_key & expires.
     """
     if session_type not in ("game", "external"):
         raise ValueError("invalid session type. must be 'game' or 'external'.")
 
-    expiry_time = int(
-        (datetime.now(timezone.utc) + timedelta(milliseconds=expiry_ms)).timestamp()
-        * 1000
-    )
+    expiry_time = expires_at if expires_at is not None else session_expiry(expiry_ms)
 
-    upsert_query = ExecutableQuery(
-        f"""
-        INSERT INTO accounts (sonolus_id, sonolus_handle, sonolus_username, sonolus_sessions)
-        VALUES ($1, $2, $3, jsonb_build_object('game','{{}}'::jsonb,'external','{{}}'::jsonb))
-        ON CONFLICT (sonolus_id) DO UPDATE
-        SET sonolus_username = EXCLUDED.sonolus_username;
-        """,
-        sonolus_id,
-        sonolus_handle,
-        sonolus_username,
-    )
-
-    session_query = SelectQuery(
+    return SelectQuery(
         SessionData,
         f"""
-        WITH slot_to_use AS (
-            SELECT
-                CASE
-                    WHEN jsonb_extract_path(sonolus_sessions, $2, '1') IS NULL OR
-                        (jsonb_extract_path(sonolus_sessions, $2, '1')->>'expires')::bigint < extract(epoch from now())*1000
-                    THEN '1'
-                    WHEN jsonb_extract_path(sonolus_sessions, $2, '2') IS NULL OR
-                        (jsonb_extract_path(sonolus_sessions, $2, '2')->>'expires')::bigint < extract(epoch from now())*1000
-                    THEN '2'
-                    WHEN jsonb_extract_path(sonolus_sessions, $2, '3') IS NULL OR
-                        (jsonb_extract_path(sonolus_sessions, $2, '3')->>'expires')::bigint < extract(epoch from now())*1000
-                    THEN '3'
-                    ELSE (
-                        SELECT key
-                        FROM jsonb_each(jsonb_extract_path(sonolus_sessions, $2)) AS t(key,val)
-                        ORDER BY (val->>'expires')::bigint ASC
-                        LIMIT 1
-                    )
-                END AS slot
-            FROM accounts
-            WHERE sonolus_id=$1
-        )
-        UPDATE accounts a
-        SET sonolus_sessions = jsonb_set(
-            a.sonolus_sessions,
-            array[$2, s.slot],
-            jsonb_build_object(
-                'session_key', $3::text,
-                'expires', $4::bigint
-            ),
-            true
+        WITH account AS (
+            INSERT INTO accounts (sonolus_id, sonolus_handle, sonolus_username)
+            VALUES ($1, $5, $6)
+            ON CONFLICT (sonolus_id) DO UPDATE
+            SET sonolus_username = EXCLUDED.sonolus_username
+            RETURNING sonolus_id
+        ),
+        new_session AS (
+            INSERT INTO sessions (key_hash, sonolus_id, session_type, expires_at)
+            SELECT {sql_key_hash("$3::text")}, sonolus_id, $2, $4
+            FROM account
+        ),
+        evicted AS (
+            -- doesn't see new_session's row, so keep one less
+            DELETE FROM sessions
+            WHERE key_hash IN (
+                SELECT key_hash
+                FROM sessions
+                WHERE sonolus_id = $1 AND session_type = $2
+                ORDER BY expires_at DESC
+                OFFSET {MAX_SESSIONS_PER_TYPE - 1}
+            )
+            OR (
+                sonolus_id = $1 AND session_type = $2
+                AND expires_at < EXTRACT(EPOCH FROM NOW()) * 1000
+            )
         )
-        FROM slot_to_use s
-        WHERE a.sonolus_id=$1
-        RETURNING 
-            (jsonb_extract_path(a.sonolus_sessions, $2, s.slot)->>'session_key')::text AS session_key,
-            (jsonb_extract_path(a.sonolus_sessions, $2, s.slot)->>'expires')::bigint AS expires;
+        SELECT $3::text AS session_key, $4::bigint AS expires
+        FROM account;
         """,
         sonolus_id,
         session_type,
         session_key,
         expiry_time,
+        sonolus_handle,
+        sonolus_username,
     )
-    return upsert_query, session_query
 
 
-def get_account_from_session(
+def get_auth_context(
     sonolus_id: str, session_key: str, session_type: str
-) -> SelectQuery[Account]:
+) -> SelectQuery[AuthContext]:
+    """
+    Checks a (v1) session and returns only what authorization needs;
+    the full row is get_account.
+    """
     assert session_type in ["game", "external"]
 
     return SelectQuery(
-        Account,
+        AuthContext,
         f"""
+            SELECT a.sonolus_id, a.mod, a.admin, a.banned, s.expires_at AS session_expires
+            FROM sessions s
+            JOIN accounts a ON a.sonolus_id = s.sonolus_id
+            WHERE s.key_hash = {sql_key_hash("$2::text")}
+                AND s.sonolus_id = $1
+                AND s.session_type = $3
+                AND s.expires_at > EXTRACT(EPOCH FROM NOW()) * 1000;
+        """,
+        sonolus_id,
+        session_key,
+        session_type,
+        # a fresh login or ban has to apply on the very next request
+        read_only=False,
+    )
+
+
+def get_account(sonolus_id: str) -> SelectQuery[Account]:
+    return SelectQuery(
+        Account,
+        """
             SELECT *
             FROM accounts
-            WHERE sonolus_id = $1
-            AND EXISTS (
-                SELECT 1
-                FROM jsonb_each(COALESCE(sonolus_sessions->'{session_type}', '{{}}'::jsonb)) AS sessions(slot, data)
-                WHERE data->>'session_key' = $2::text
-                    AND (data->>'expires')::bigint > EXTRACT(EPOCH FROM NOW()) * 1000
-            )
-            LIMIT 1;
+            WHERE sonolus_id = $1;
         """,
         sonolus_id,
-        session_key,
+        # upload cooldowns and oauth tokens are read back across requests
+        read_only=False,
+    )
+
+
+def delete_expired_sessions(batch_size: int) -> ExecutableQuery:
+    """At most batch_size expired sessions, oldest first (helpers.scheduler)."""
+    return ExecutableQuery(
+        """
+            DELETE FROM sessions
+            WHERE key_hash IN (
+                SELECT key_hash
+                FROM sessions
+                WHERE expires_at < EXTRACT(EPOCH FROM NOW()) * 1000
+                ORDER BY expires_at
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            );
+        """,
+        batch_size,
+    )
+
+
+def get_token_claims(sonolus_id: str) -> SelectQuery[TokenClaims]:
+    """
+    What a v2 token is signed with, and what its epoch is checked
+    against. No row: the account doesn't exist (or was deleted).
+    """
+    return SelectQuery(
+        TokenClaims,
+        """
+            SELECT a.mod, a.admin, a.banned, COALESCE(e.epoch, 0) AS epoch
+            FROM accounts a
+            LEFT JOIN token_epochs e ON e.sonolus_id = a.sonolus_id
+            WHERE a.sonolus_id = $1;
+        """,
+        sonolus_id,
+        # a ban has to apply on the very next request
+        read_only=False,
     )
 
 
@@ -449,3 +499,9 @@ def toggle_notification_read_status(
         user_id,
         is_read,
     )
+
+
+# run on (nearly) every authenticated request
+prepared_statements.register(
+    get_auth_context("", "", "game"), get_token_claims(""), get_account("")
+)
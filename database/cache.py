@@ -0,0 +1,276 @@
+import asyncio, hashlib, json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Iterable, Optional
+
+from helpers.ttl_cache import TTLCache
+
+MISS = object()
+
+# tag sets in Redis live this long; cache_ttl must stay below it
+TAG_TTL = 24 * 60 * 60
+
+
+class CacheBackendError(Exception):
+    pass
+
+
+# a failing cache backend is a miss, never a failed request
+CACHE_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncio.IncompleteReadError,
+    asyncio.LimitOverrunError,
+    CacheBackendError,
+)
+
+
+def _encode_value(value: Any):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    raise TypeError(f"can't cache {type(value).__name__}")
+
+
+_DECODERS = {
+    "$datetime": datetime.fromisoformat,
+    "$date": date.fromisoformat,
+    "$decimal": Decimal,
+}
+
+
+def _decode_object(obj: dict):
+    if len(obj) == 1:
+        key, value = next(iter(obj.items()))
+        if key in _DECODERS:
+            return _DECODERS[key](value)
+    return obj
+
+
+def dump_rows(result) -> str:
+    """fetch()/fetchrow() result as JSON, keeping datetimes and Decimals."""
+    if result is None:
+        rows = None
+    elif isinstance(result, list):
+        rows = [dict(row) for row in result]
+    else:
+        rows = dict(result)
+    return json.dumps(rows, default=_encode_value, separators=(",", ":"))
+
+
+def load_rows(text: str):
+    """dump_rows back to dicts, which stand in for the Records."""
+    return json.loads(text, object_hook=_decode_object)
+
+
+class LocalCacheBackend:
+    """
+    In-process LRU (helpers.ttl_cache).
+    NOTE: per worker, so a write only invalidates the worker that made it;
+    the others serve their copy until it expires. Use RedisCacheBackend
+    when that matters.
+    """
+
+    def __init__(self, maxsize: int = 10_000):
+        self._entries = TTLCache(maxsize=maxsize)
+        self._tags: dict[str, set[str]] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._entries.get(key)
+
+    async def set(self, key: str, value: str, ttl: float, tags: Iterable[str]) -> None:
+        self._entries.set(key, value, ttl)
+        for tag in tags:
+            keys = self._tags.setdefault(tag, set())
+            if len(keys) >= 1000:
+                # forget keys that were evicted or expired meanwhile
+                keys = self._tags[tag] = {k for k in keys if k in self._entries}
+            keys.add(key)
+
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        for tag in tags:
+            for key in self._tags.pop(tag, ()):
+                self._entries.pop(key)
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisCacheBackend:
+    """
+    Minimal RESP client over one asyncio stream, for anything speaking the
+    Redis protocol (Redis, Valkey, KeyDB, ...). Commands are serialized on
+    the connection and pipelined where possible; a broken connection is
+    dropped and reopened on the next command.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        timeout: float = 0.5,
+    ):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _pack(*args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    async def _read_reply(self):
+        line = await self._reader.readuntil(b"\r\n")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise CacheBackendError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            return (await self._reader.readexactly(length + 2))[:-2]
+        if kind == b"*":
+            length = int(body)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise CacheBackendError(f"unexpected reply {line!r}")
+
+    async def _pipeline(self, *commands: tuple) -> list:
+        async with self._lock:
+            try:
+                return await asyncio.wait_for(
+                    self._send(commands), timeout=self.timeout
+                )
+            except BaseException:
+                # half-read replies would be returned to the next command
+                self._disconnect()
+                raise
+
+    async def _send(self, commands) -> list:
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+            setup = []
+            if self.password:
+                setup.append(("AUTH", self.password))
+            if self.db:
+                setup.append(("SELECT", self.db))
+            commands = (*setup, *commands)
+        else:
+            setup = []
+        self._writer.write(b"".join(self._pack(*command) for command in commands))
+        await self._writer.drain()
+        replies = [await self._read_reply() for _ in commands]
+        return replies[len(setup) :]
+
+    def _disconnect(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def get(self, key: str) -> Optional[str]:
+        (value,) = await self._pipeline(("GET", key))
+        return value.decode() if value is not None else None
+
+    async def set(self, key: str, value: str, ttl: float, tags: Iterable[str]) -> None:
+        commands = [("SET", key, value.encode(), "PX", int(ttl * 1000))]
+        for tag in tags:
+            commands.append(("SADD", f"tag:{tag}", key))
+            commands.append(("EXPIRE", f"tag:{tag}", TAG_TTL))
+        await self._pipeline(*commands)
+
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        tag_keys = [f"tag:{tag}" for tag in tags]
+        if not tag_keys:
+            return
+        members = await self._pipeline(*(("SMEMBERS", tag) for tag in tag_keys))
+        keys = {key for tag_members in members for key in tag_members or ()}
+        await self._pipeline(("DEL", *keys, *tag_keys))
+
+    async def close(self) -> None:
+        async with self._lock:
+            self._disconnect()
+
+
+class QueryCache:
+    """
+    Result cache for SelectQuerys created with cache_ttl (and cache_tags);
+    DBConnWrapper checks it before fetch()/fetchrow() and drops the tags a
+    query `invalidates` after running it. Keys are the SQL, args and fetch
+    method. Cached rows come back as dicts instead of Records.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or LocalCacheBackend()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    @staticmethod
+    def key(query, method: str) -> str:
+        args = json.dumps(query.args, default=str, separators=(",", ":"))
+        digest = hashlib.sha256(f"{method}\0{query.sql}\0{args}".encode()).hexdigest()
+        return f"query:{digest}"
+
+    async def get(self, query, method: str):
+        try:
+            text = await self.backend.get(self.key(query, method))
+        except CACHE_ERRORS:
+            self.errors += 1
+            text = None
+        if text is None:
+            self.misses += 1
+            return MISS
+        self.hits += 1
+        return load_rows(text)
+
+    async def set(self, query, method: str, result) -> None:
+        try:
+            await self.backend.set(
+                self.key(query, method),
+                dump_rows(result),
+                query.cache_ttl,
+                query.cache_tags,
+            )
+        except CACHE_ERRORS:
+            self.errors += 1
+
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        self.invalidations += 1
+        try:
+            await self.backend.invalidate(tags)
+        except CACHE_ERRORS:
+            self.errors += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+        }
+
+
+query_cache = QueryCache()
@@ -1,18 +1,43 @@
+import base64, json, re
 from typing import List, Optional, Literal, Union
 from decimal import Decimal
-
-from database.query import ExecutableQuery, SelectQuery
+from datetime import datetime
+
+from asyncpg import Record
+
+from database.query import (
+    ExecutableQuery,
+    SelectQuery,
+    QueryParams,
+    JSONPage,
+    json_page,
+    sql_isoformat,
+    prepared_statements,
+    query_name,
+)
 from helpers.models import (
     Chart,
     ChartDBResponse,
     ChartByID,
     Count,
     DBID,
-    ChartByIDLiked,
-    ChartDBResponseLiked,
+    ChartListDBResponse,
+    ChartPoolEntry,
+    BulkLikeResult,
+    RescoreBatch,
 )
 
 
+# database.cache: a write to a chart drops its own entries and every list page
+CHART_LIST_TAG = "chart-list"
+CHART_CACHE_TTL = 10
+CHART_LIST_CACHE_TTL = 15
+
+
+def chart_tag(chart_id: str) -> str:
+    return f"chart:{chart_id}"
+
+
 def create_chart(chart: Chart) -> SelectQuery[DBID]:
     tags_str = chart.tags if chart.tags else []
 
@@ -40,9 +65,115 @@ def create_chart(chart: Chart) -> SelectQuery[DBID]:
         chart.background_file_hash if chart.background_file_hash else None,
         chart.background_v1_file_hash,
         chart.background_v3_file_hash,
+        invalidates=(chart_tag(chart.id), CHART_LIST_TAG),
     )
 
 
+# sort_by -> (chart_data column, cursor value parser)
+CHART_LIST_SORT_COLUMNS = {
+    "created_at": ("created_at", datetime.fromisoformat),
+    "published_at": ("published_at", datetime.fromisoformat),
+    "rating": ("rating", Decimal),
+    "likes": ("like_count", int),
+    "comments": ("comment_count", int),
+    "decaying_likes": ("trending_score", float),
+    "abc": ("title", str),
+    "relevance": ("relevance", float),
+}
+
+
+# kana, CJK ideographs, hangul, halfwidth katakana
+CJK_RE = re.compile(
+    r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af\uff66-\uff9f]"
+)
+
+
+# pg_trgm indexes only serve LIKE patterns with at least one trigram
+SUBSTRING_MIN_LENGTH = 3
+
+
+def split_search_words(text: str) -> tuple[list[str], list[str]]:
+    """
+    Returns (words, substrings) of a search string.
+    Substrings are matched like the original search, LOWER(col) LIKE
+    '%word%' through the pg_trgm indexes, so "ight" still finds "Night".
+    Words are the ones too short for a trigram, matched as word prefixes
+    through charts.search_vector instead of a scan.
+    CJK runs are always substrings: the 'simple' parser doesn't split them
+    (千本桜 is one token), so a prefix couldn't find 本桜 in it.
+    """
+    words, substrings = [], []
+    for word in re.findall(r"[^\W_]+", text.lower()):
+        if CJK_RE.search(word) or len(word) >= SUBSTRING_MIN_LENGTH:
+            substrings.append(word)
+        else:
+            words.append(word)
+    return words, substrings
+
+
+def build_search_tsquery(
+    words: List[str], weights: str = "", operator: str = "&"
+) -> Optional[str]:
+    """
+    Prefix-match (non-CJK) `words` against charts.search_vector.
+    weights restricts matches to tsvector weights:
+    A = title, B = artists, C = author_full, D = description
+    """
+    words = [word for word in words if not CJK_RE.search(word)]
+    if not words:
+        return None
+    return f" {operator} ".join(f"{word}:*{weights}" for word in words)
+
+
+def encode_chart_list_cursor(
+    chart: Union[ChartDBResponse, Record, dict],
+    sort_by: str,
+    sort_order: Literal["desc", "asc"],
+) -> Optional[str]:
+    """
+    Opaque keyset cursor pointing after `chart` (a model, a raw Record or a
+    cached row dict) for the given sort. Random sorts can't be resumed, so they never get a cursor.
+    """
+    if isinstance(chart, ChartDBResponse):
+        chart = chart.model_dump()
+    if sort_by == "relevance" and chart.get("relevance") is None:
+        # no search text, so get_chart_list sorted by created_at instead
+        sort_by = "created_at"
+    if sort_by not in CHART_LIST_SORT_COLUMNS:
+        return None
+    column, _ = CHART_LIST_SORT_COLUMNS[sort_by]
+    value, chart_id = chart.get(column), chart["id"]
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif isinstance(value, Decimal):
+        value = str(value)
+    data = {"s": sort_by, "o": sort_order, "v": value, "i": chart_id}
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def decode_chart_list_cursor(
+    cursor: str, sort_by: str, sort_order: Literal["desc", "asc"]
+) -> tuple:
+    """
+    Returns (sort value, chart id) of the last row seen.
+    Raises ValueError if the cursor is malformed or was made for another sort.
+    """
+    if sort_by not in CHART_LIST_SORT_COLUMNS:
+        raise ValueError("Cursors are not supported for this sort.")
+    _, parse = CHART_LIST_SORT_COLUMNS[sort_by]
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        matches_sort = data["s"] == sort_by and data["o"] == sort_order
+        last_value, last_id = parse(data["v"]), str(data["i"])
+    except Exception:
+        raise ValueError("Invalid cursor.")
+    if not matches_sort:
+        raise ValueError("Cursor does not match the requested sort.")
+    return last_value, last_id
+
+
 def get_chart_list(
     page: int,
     items_per_page: int,
@@ -70,14 +201,27 @@ def get_chart_list(
         "abc",
         "random",
         "published_at",
+        "relevance",
     ] = "created_at",
     sort_order: Literal["desc", "asc"] = "desc",
-    sonolus_id: Optional[str] = None,
     meta_includes: Optional[str] = None,
     owned_by: Optional[str] = None,
+    cursor: Optional[str] = None,
+    count_limit: Optional[int] = None,
+    as_json_page: bool = False,
+    viewer: Optional[str] = None,
 ) -> tuple[
-    SelectQuery[Count], SelectQuery[Union[ChartDBResponse, ChartDBResponseLiked]]
+    SelectQuery[Count],
+    Union[SelectQuery[ChartListDBResponse], SelectQuery[JSONPage]],
 ]:
+    """
+    Returns (count_query, list_query).
+    Every list_query row carries total_count, so a non-empty page needs one round trip.
+    With count_limit set, total_count stops counting at count_limit rows.
+
+    as_json_page: list_query returns a single row instead, the page built
+    by Postgres (see chart_list_json_page), with `liked` set for viewer.
+    """
     inner_select = """
         SELECT 
             c.id, 
@@ -101,257 +245,360 @@ def get_chart_list(
             c.created_at,
             c.published_at,
             c.updated_at,
-            c.log_like_score,
-            c.chart_author || '#' || a.sonolus_handle AS author_full,
+            c.trending_score,
+            c.author_full,
             c.chart_author AS chart_design
     """
-
-    if sonolus_id:
-        inner_select += """,
-            CASE WHEN cl.sonolus_id IS NULL THEN FALSE ELSE TRUE END AS liked
-        """
-
-    inner_select += """
+    from_clause = """
         FROM charts c
-        JOIN accounts a ON c.author = a.sonolus_id
     """
 
     if liked_by:
-        inner_select += " JOIN chart_likes clb ON c.id = clb.chart_id"
+        from_clause += " JOIN chart_likes clb ON c.id = clb.chart_id"
 
     conditions = []
-    params: List = []
-
-    if sonolus_id:
-        params.append(sonolus_id)
-        inner_select += f" LEFT JOIN chart_likes cl ON c.id = cl.chart_id AND cl.sonolus_id = ${len(params)}"
-
-    if status:
-        params.append(status)
-        conditions.append(f"c.status = ${len(params)}::chart_status")
-
+    params = QueryParams()
+
+    if status == "PUBLIC":
+        # literal so generic plans can still use the WHERE status = 'PUBLIC' indexes
+        conditions.append("c.status = 'PUBLIC'")
+    elif status:
+        conditions.append(f"c.status = {params.add(status, 'chart_status')}")
+
+    # Filters are only in the SQL when set. `($n IS NULL OR ...)` shapes
+    # would cut the number of texts, but their generic plans can't use the
+    # partial/(col, id) indexes and push the total count onto a seq scan
+    # (scripts/check_query_plans.py); the common unfiltered shapes are
+    # prepared up front instead (_canonical_shapes).
     if staff_pick is not None:
-        params.append(staff_pick)
-        conditions.append(f"c.staff_pick = ${len(params)}::BOOL")
-
+        # literal as well, for the staff pick partial index
+        conditions.append("c.staff_pick" if staff_pick else "NOT c.staff_pick")
     if min_rating is not None:
-        min_rating -= 1
-        params.append(min_rating)
-        conditions.append(f"c.rating > ${len(params)}")
+        conditions.append(f"c.rating > {params.add(min_rating - 1)}")
     if max_rating is not None:
-        max_rating += 1
-        params.append(max_rating)
-        conditions.append(f"c.rating < ${len(params)}")
-
+        conditions.append(f"c.rating < {params.add(max_rating + 1)}")
     if tags:
-        params.append(tags)
-        conditions.append(f"c.tags @> ${len(params)}::text[]")
-
+        conditions.append(f"c.tags @> {params.add(tags, 'text[]')}")
     if min_likes is not None:
-        params.append(min_likes)
-        conditions.append(f"c.like_count >= ${len(params)}")
+        conditions.append(f"c.like_count >= {params.add(min_likes)}")
     if max_likes is not None:
-        params.append(max_likes)
-        conditions.append(f"c.like_count <= ${len(params)}")
-
+        conditions.append(f"c.like_count <= {params.add(max_likes)}")
     if min_comments is not None:
-        params.append(min_comments)
-        conditions.append(f"c.comment_count >= ${len(params)}")
+        conditions.append(f"c.comment_count >= {params.add(min_comments)}")
     if max_comments is not None:
-        params.append(max_comments)
-        conditions.append(f"c.comment_count <= ${len(params)}")
+        conditions.append(f"c.comment_count <= {params.add(max_comments)}")
 
     if liked_by:
-        params.append(liked_by)
-        conditions.append(f"clb.sonolus_id = ${len(params)}")
+        conditions.append(f"clb.sonolus_id = {params.add(liked_by)}")
     if commented_by:
-        params.append(commented_by)
-        inner_select += f"""
+        from_clause += f"""
             JOIN (
                 SELECT DISTINCT chart_id
                 FROM comments
-                WHERE commenter = ${len(params)}
+                WHERE commenter = {params.add(commented_by)}
             ) cmt ON c.id = cmt.chart_id
         """
     if owned_by:
-        params.append(owned_by)
-        conditions.append(f"c.author = ${len(params)}")
-
-    if title_includes:
-        params.append(f"%{title_includes.lower()}%")
-        conditions.append(f"LOWER(c.title) LIKE ${len(params)}")
-    if description_includes:
-        params.append(f"%{description_includes.lower()}%")
-        conditions.append(f"LOWER(c.description) LIKE ${len(params)}")
-    if artists_includes:
-        params.append(f"%{artists_includes.lower()}%")
-        conditions.append(f"LOWER(c.artists) LIKE ${len(params)}")
-    if author_includes:
-        params.append(f"%{author_includes.lower()}%")
-        conditions.append(
-            f"LOWER(c.chart_author || '#' || a.sonolus_handle) LIKE ${len(params)}"
-        )
-    if meta_includes:
-        params.append(f"%{meta_includes.lower()}%")
-        placeholder = f"${len(params)}"
-        conditions.append(
-            f"(LOWER(c.title) LIKE {placeholder} "
-            f"OR LOWER(c.description) LIKE {placeholder} "
-            f"OR LOWER(c.chart_author || '#' || a.sonolus_handle) LIKE {placeholder} "
-            f"OR LOWER(c.artists) LIKE {placeholder})"
+        conditions.append(f"c.author = {params.add(owned_by)}")
+
+    search_fields = (
+        (title_includes, "A", ["c.title"]),
+        (artists_includes, "B", ["c.artists"]),
+        (author_includes, "C", ["c.author_full"]),
+        (description_includes, "D", ["c.description"]),
+        (meta_includes, "", ["c.title", "c.artists", "c.author_full", "c.description"]),
+    )
+    prefix_terms, rank_terms = [], []
+    for text, weights, columns in search_fields:
+        if not text:
+            continue
+        words, substrings = split_search_words(text)
+        term = build_search_tsquery(words, weights)
+        if term:
+            prefix_terms.append(term)
+        # ranked by whole-word (prefix) matches; substring-only matches rank ~0
+        term = build_search_tsquery(words + substrings, weights, "|")
+        if term:
+            rank_terms.append(term)
+        # words are [^\W_]+, so no LIKE wildcards to escape
+        for substring in substrings:
+            pattern = params.add(f"%{substring}%")
+            conditions.append(
+                "("
+                + " OR ".join(f"LOWER({column}) LIKE {pattern}" for column in columns)
+                + ")"
+            )
+    if prefix_terms:
+        tsquery = params.add(" & ".join(prefix_terms))
+        conditions.append(f"c.search_vector @@ to_tsquery('simple', {tsquery})")
+    if rank_terms:
+        from_clause += (
+            f" CROSS JOIN to_tsquery('simple', {params.add(' | '.join(rank_terms))}) tsq"
         )
+        inner_select += ", ts_rank(c.search_vector, tsq) AS relevance"
+    elif sort_by == "relevance":
+        # nothing to rank against
+        sort_by = "created_at"
 
+    inner_select += from_clause
     if conditions:
         inner_select += " WHERE " + " AND ".join(conditions)
 
-    sort_column = {
-        "created_at": "created_at",
-        "published_at": "published_at",
-        "rating": "rating",
-        "likes": "like_count",
-        "comments": "comment_count",
-        "decaying_likes": "log_like_score",
-        "abc": "title",
-        "random": "RANDOM()",
-    }.get(sort_by, "created_at")
-
     sort_order_sql = "DESC" if sort_order.lower() == "desc" else "ASC"
 
+    sort_column = None
+    if sort_by != "random":
+        sort_column, _ = CHART_LIST_SORT_COLUMNS.get(
+            sort_by, CHART_LIST_SORT_COLUMNS["created_at"]
+        )
+
+    if not sort_column:
+        order_clause = "ORDER BY RANDOM()"
+    else:
+        # id breaks ties so every row has a stable position for keyset paging
+        order_clause = f"ORDER BY {sort_column} {sort_order_sql}, id {sort_order_sql}"
+
     filter_published_at_null = (
         "AND published_at IS NOT NULL" if sort_column == "published_at" else ""
     )
 
+    data_params = QueryParams(*params.args)
+    seek_condition = ""
+    if cursor:
+        last_value, last_id = decode_chart_list_cursor(cursor, sort_by, sort_order)
+        seek_condition = (
+            f"AND ({sort_column}, id) {'<' if sort_order_sql == 'DESC' else '>'} "
+            f"({data_params.add(last_value)}, {data_params.add(last_id)})"
+        )
+        page = 0
+
+    limit_placeholders = (
+        f"LIMIT {data_params.add(items_per_page)} "
+        f"OFFSET {data_params.add(page * items_per_page)}"
+    )
+
+    if count_limit is not None:
+        total_count_sql = f"""(
+            SELECT COUNT(*) FROM (SELECT 1 FROM chart_data LIMIT {data_params.add(count_limit)}) capped
+        )"""
+    else:
+        total_count_sql = "(SELECT COUNT(*) FROM chart_data)"
+
+    # NOT MATERIALIZED: chart_data is referenced twice, but both uses
+    # should be planned against the charts indexes
     query = f"""
-        WITH chart_data AS (
+        WITH chart_data AS NOT MATERIALIZED (
             {inner_select}
         )
-        SELECT *
+        SELECT
+            *,
+            {total_count_sql} AS total_count
         FROM chart_data
-        WHERE 1=1 {filter_published_at_null}
-        ORDER BY {sort_column} {sort_order_sql}
-        LIMIT ${len(params) + 1} OFFSET ${len(params) + 2}
+        WHERE 1=1 {filter_published_at_null} {seek_condition}
+        {order_clause}
+        {limit_placeholders}
     """
 
+    # the same for everyone: no user filters, no per-viewer `liked`, not random
+    cache = {}
+    if (
+        status == "PUBLIC"
+        and not (liked_by or commented_by or owned_by)
+        and not (as_json_page and viewer)
+        and sort_by != "random"
+    ):
+        cache = dict(cache_ttl=CHART_LIST_CACHE_TTL, cache_tags=(CHART_LIST_TAG,))
+
+    list_query = SelectQuery(ChartListDBResponse, query, *data_params.args, **cache)
+    if as_json_page:
+        list_query = chart_list_json_page(
+            list_query,
+            data_params,
+            sort_column,
+            sort_order_sql,
+            has_relevance=bool(rank_terms),
+            viewer=viewer,
+        )
+
+    count_params = QueryParams(*params.args)
+    counted = "chart_data"
+    if count_limit is not None:
+        # capped like total_count, so the fallback count stays cheap too
+        counted = f"(SELECT 1 FROM chart_data LIMIT {count_params.add(count_limit)}) capped"
     count_query = f"""
         WITH chart_data AS (
             {inner_select}
         )
-        SELECT COUNT(*) AS total_count FROM chart_data
+        SELECT COUNT(*) AS total_count FROM {counted}
     """
 
-    count_params = tuple(params)
-
-    data_params = tuple(params) + (items_per_page, page * items_per_page)
-
     return (
-        SelectQuery(Count, count_query, *count_params),
         SelectQuery(
-            ChartDBResponse if not sonolus_id else ChartDBResponseLiked,
-            query,
-            *data_params,
+            Count,
+            count_query,
+            *count_params.args,
+            name="charts.get_chart_list.count",
+            **cache,
         ),
+        list_query,
     )
 
 
-def get_random_charts(
-    return_count: int,
-    sonolus_id: Optional[str] = None,
-    staff_pick: Optional[bool] = None,
-) -> SelectQuery[Union[ChartDBResponse, ChartDBResponseLiked]]:
-
-    base_query = """
-        SELECT 
-            c.id,
-            c.title,
-            c.author,
-            c.artists,
-            c.staff_pick,
-            c.description,
-            c.tags,
-            c.jacket_file_hash,
-            c.music_file_hash,
-            c.chart_file_hash,
-            c.preview_file_hash,
-            c.background_file_hash,
-            c.background_v3_file_hash,
-            c.background_v1_file_hash,
-            c.status,
-            c.rating,
-            c.like_count,
-            c.comment_count,
-            c.created_at,
-            c.published_at,
-            c.updated_at,
-            c.chart_author || '#' || a.sonolus_handle AS author_full,
-            c.chart_author AS chart_design
+def chart_list_json_page(
+    list_query: SelectQuery[ChartListDBResponse],
+    params: QueryParams,
+    sort_column: Optional[str],
+    sort_order_sql: str,
+    has_relevance: bool,
+    viewer: Optional[str],
+) -> SelectQuery[JSONPage]:
     """
+    The chart list page as one JSON array, keyed and formatted like
+    ChartListDBResponse.model_dump (minus total_count) through FastAPI.
+    Next to data: total_count, and the last row's id and sort column
+    (named as such, so the row works with encode_chart_list_cursor).
+    """
+    fields = {
+        "id": "p.id",
+        # coerce_rating: 4 decimals, integral values as integers
+        "rating": "trim_scale(round(p.rating, 4))",
+        "author": "p.author",
+        "title": "p.title",
+        "staff_pick": "p.staff_pick",
+        "artists": "p.artists",
+        "jacket_file_hash": "p.jacket_file_hash",
+        "music_file_hash": "p.music_file_hash",
+        "chart_file_hash": "p.chart_file_hash",
+        "background_v1_file_hash": "p.background_v1_file_hash",
+        "background_v3_file_hash": "p.background_v3_file_hash",
+        "tags": "p.tags",
+        "description": "p.description",
+        "preview_file_hash": "p.preview_file_hash",
+        "background_file_hash": "p.background_file_hash",
+        "status": "p.status",
+        "like_count": "p.like_count",
+        "comment_count": "p.comment_count",
+        "created_at": sql_isoformat("p.created_at"),
+        "published_at": sql_isoformat("p.published_at"),
+        "updated_at": sql_isoformat("p.updated_at"),
+        "author_full": "p.author_full",
+        "chart_design": "p.chart_design",
+        "is_first_publish": "NULL",
+        "relevance": "p.relevance::float8" if has_relevance else "NULL",
+    }
+    if viewer:
+        fields["liked"] = f"""EXISTS (
+            SELECT 1 FROM chart_likes l
+            WHERE l.chart_id = p.id AND l.sonolus_id = {params.add(viewer)}
+        )"""
+    extra_columns = {"total_count": "max(p.total_count)"}
+    order_by = ""
+    if sort_column:
+        order_by = f"ORDER BY p.{sort_column} {sort_order_sql}, p.id {sort_order_sql}"
+        reverse = "ASC" if sort_order_sql == "DESC" else "DESC"
+        last = f"ORDER BY p.{sort_column} {reverse}, p.id {reverse}"
+        extra_columns["id"] = f"(array_agg(p.id {last}))[1]"
+        extra_columns[sort_column] = f"(array_agg(p.{sort_column} {last}))[1]"
+    page_query = SelectQuery(
+        list_query.model,
+        list_query.sql,
+        *params.args,
+        name=list_query.name,
+        cache_ttl=list_query.cache_ttl,
+        cache_tags=list_query.cache_tags,
+    )
+    return json_page(page_query, fields, order_by, extra_columns)
 
-    params: list = [return_count]
 
-    if sonolus_id:
-        base_query += (
-            ", CASE WHEN cl.sonolus_id IS NULL THEN FALSE ELSE TRUE END AS liked"
-        )
-
-    base_query += """
-        FROM charts c
-        JOIN accounts a ON c.author = a.sonolus_id
+def get_public_chart_ids() -> SelectQuery[ChartPoolEntry]:
     """
-
-    if sonolus_id:
-        params.append(sonolus_id)
-        base_query += f"""
-            LEFT JOIN chart_likes cl ON c.id = cl.chart_id AND cl.sonolus_id = ${len(params)}
+    Every public chart id, for the in-worker random pick pool.
+    """
+    return SelectQuery(
+        ChartPoolEntry,
         """
-
-    base_query += " WHERE c.status = 'PUBLIC'"
-
-    if staff_pick is not None:
-        params.append(staff_pick)
-        base_query += f" AND c.staff_pick = ${len(params)}::bool"
-
-    base_query += " ORDER BY RANDOM() LIMIT $1"
-
-    if sonolus_id:
-        return SelectQuery(ChartDBResponseLiked, base_query, *params)
-    return SelectQuery(ChartDBResponse, base_query, *params)
+            SELECT id, staff_pick
+            FROM charts
+            WHERE status = 'PUBLIC';
+        """,
+    )
 
 
-def get_chart_by_id(
-    chart_id: str, sonolus_id: Optional[str] = None
-) -> SelectQuery[Union[ChartByID, ChartByIDLiked]]:
+def get_charts_by_ids(chart_ids: List[str]) -> SelectQuery[ChartDBResponse]:
     """
-    Generate a query to get a chart by its ID.
-    If sonolus_id is provided, also return whether this user has liked the chart.
+    Hydrate sampled ids. Charts that stopped being public since the
+    pool was loaded are dropped here.
     """
-    params = [chart_id]
-
-    if sonolus_id:
-        params.append(sonolus_id)
-        query = """
+    return SelectQuery(
+        ChartDBResponse,
+        """
             SELECT 
-                c.*,
-                c.chart_author || '#' || a.sonolus_handle AS author_full,
-                (cl.sonolus_id IS NOT NULL) AS liked,
+                c.id,
+                c.title,
+                c.author,
+                c.artists,
+                c.staff_pick,
+                c.description,
+                c.tags,
+                c.jacket_file_hash,
+                c.music_file_hash,
+                c.chart_file_hash,
+                c.preview_file_hash,
+                c.background_file_hash,
+                c.background_v3_file_hash,
+                c.background_v1_file_hash,
+                c.status,
+                c.rating,
+                c.like_count,
+                c.comment_count,
+                c.created_at,
+                c.published_at,
+                c.updated_at,
+                c.author_full,
                 c.chart_author AS chart_design
             FROM charts c
-            JOIN accounts a ON c.author = a.sonolus_id
-            LEFT JOIN chart_likes cl 
-                ON c.id = cl.chart_id AND cl.sonolus_id = $2
-            WHERE c.id = $1;
+            WHERE c.id = ANY($1::text[])
+            AND c.status = 'PUBLIC';
+        """,
+        chart_ids,
+    )
+
+
+def get_chart_by_id(chart_id: str) -> SelectQuery[ChartByID]:
+    """
+    Generate a query to get a chart by its ID.
+    Whether a user liked it comes from get_liked_chart_ids.
+    """
+    return SelectQuery(
+        ChartByID,
         """
-        return SelectQuery(ChartByIDLiked, query, *params)
-    else:
-        query = """
             SELECT 
                 c.*,
-                c.chart_author || '#' || a.sonolus_handle AS author_full,
                 c.chart_author AS chart_design
             FROM charts c
-            JOIN accounts a ON c.author = a.sonolus_id
             WHERE c.id = $1;
+        """,
+        chart_id,
+        cache_ttl=CHART_CACHE_TTL,
+        cache_tags=(chart_tag(chart_id),),
+    )
+
+
+def get_liked_chart_ids(sonolus_id: str, chart_ids: List[str]) -> SelectQuery[DBID]:
+    """
+    Which of chart_ids sonolus_id has liked, in one lookup for a whole page.
+    """
+    return SelectQuery(
+        DBID,
         """
-        return SelectQuery(ChartByID, query, *params)
+            SELECT chart_id AS id
+            FROM chart_likes
+            WHERE sonolus_id = $1
+            AND chart_id = ANY($2::text[]);
+        """,
+        sonolus_id,
+        chart_ids,
+    )
 
 
 def delete_chart(
@@ -370,6 +617,7 @@ def delete_chart(
                 RETURNING *, chart_author AS chart_design;
             """,
             chart_id,
+            invalidates=(chart_tag(chart_id), CHART_LIST_TAG),
         )
     else:
         return SelectQuery(
@@ -381,11 +629,12 @@ def delete_chart(
             """,
             chart_id,
             sonolus_id,
+            invalidates=(chart_tag(chart_id), CHART_LIST_TAG),
         )
 
 
-def update_metadata(
-    chart_id: str,
+def _metadata_assignments(
+    params: QueryParams,
     chart_author: Optional[str] = None,
     rating: Optional[Union[int, float, Decimal]] = None,
     description: Optional[str] = None,
@@ -393,7 +642,7 @@ def update_metadata(
     artists: Optional[str] = None,
     tags: Optional[List[str]] = None,
     update_none_description: bool = False,
-) -> ExecutableQuery:
+) -> str:
     if not any(
         [
             rating,
@@ -410,44 +659,23 @@ def update_metadata(
     if type(rating) == int:
         rating = float(rating)
 
-    set_fields = []
-    args = []
-
-    def add_field(field_name: str, value):
-        args.append(value)
-        set_fields.append(f"{field_name} = ${len(args)}")
-
-    if rating is not None:
-        add_field("rating", rating)
-    if chart_author is not None:
-        add_field("chart_author", chart_author)
-    if description is not None:
-        add_field("description", description)
-    elif update_none_description:
-        set_fields.append("description = NULL")
-    if title is not None:
-        add_field("title", title)
-    if artists is not None:
-        add_field("artists", artists)
-    if tags is not None:
-        add_field("tags", tags)
-
-    set_fields.append("updated_at = CURRENT_TIMESTAMP")
-
-    set_clause = ", ".join(set_fields)
-
-    args.append(chart_id)
-    query = f"""
-        UPDATE charts
-        SET {set_clause}
-        WHERE id = ${len(args)};
-    """
-
-    return ExecutableQuery(query, *args)
-
-
-def update_file_hash(
-    chart_id: str,
+    # one statement for every combination: NULL keeps the current value
+    description_param = params.add(description, "text")
+    return f"""
+                rating = COALESCE({params.add(rating, "numeric")}, rating),
+                chart_author = COALESCE({params.add(chart_author)}, chart_author),
+                description = CASE
+                    WHEN {description_param} IS NOT NULL THEN {description_param}
+                    WHEN {params.add(update_none_description, "bool")} THEN NULL
+                    ELSE description
+                END,
+                title = COALESCE({params.add(title)}, title),
+                artists = COALESCE({params.add(artists)}, artists),
+                tags = COALESCE({params.add(tags, "text[]")}, tags),"""
+
+
+def _file_hash_assignments(
+    params: QueryParams,
     jacket_hash: Optional[str] = None,
     v1_hash: Optional[str] = None,
     v3_hash: Optional[str] = None,
@@ -458,7 +686,7 @@ def update_file_hash(
     confirm_change: bool = False,
     update_none_preview: bool = False,
     update_none_background: bool = False,
-) -> ExecutableQuery:
+) -> str:
     if not confirm_change:
         raise ValueError(
             "File hash change is not confirmed. Ensure you are deleting the old files from S3 to avoid dangling files."
@@ -467,47 +695,106 @@ def update_file_hash(
         if not (v1_hash and v3_hash):
             raise ValueError("Must regenerate v1/v3 on jacket change")
 
-    set_fields = []
-    args = []
-
-    def add_field(field_name: str, value):
-        args.append(value)
-        set_fields.append(f"{field_name} = ${len(args)}")
-
-    if jacket_hash is not None:
-        add_field("jacket_file_hash", jacket_hash)
-    if v1_hash is not None:
-        add_field("background_v1_file_hash", v1_hash)
-    if v3_hash is not None:
-        add_field("background_v3_file_hash", v3_hash)
-    if music_hash is not None:
-        add_field("music_file_hash", music_hash)
-    if chart_hash is not None:
-        add_field("chart_file_hash", chart_hash)
-    if preview_hash is not None:
-        add_field("preview_file_hash", preview_hash)
-    elif update_none_preview:
-        set_fields.append("preview_file_hash = NULL")
-    if background_hash is not None:
-        add_field("background_file_hash", background_hash)
-    elif update_none_background:
-        set_fields.append("background_file_hash = NULL")
-
-    set_fields.append("updated_at = CURRENT_TIMESTAMP")
-
-    if not set_fields:
-        raise ValueError("At least one file hash must be updated.")
-
-    set_clause = ", ".join(set_fields)
-
-    args.append(chart_id)
-    query = f"""
-        UPDATE charts
-        SET {set_clause}
-        WHERE id = ${len(args)};
-    """
+    preview_param = params.add(preview_hash, "text")
+    update_none_preview_param = params.add(update_none_preview, "bool")
+    background_param = params.add(background_hash, "text")
+    return f"""
+                jacket_file_hash = COALESCE({params.add(jacket_hash)}, jacket_file_hash),
+                background_v1_file_hash = COALESCE({params.add(v1_hash)}, background_v1_file_hash),
+                background_v3_file_hash = COALESCE({params.add(v3_hash)}, background_v3_file_hash),
+                music_file_hash = COALESCE({params.add(music_hash)}, music_file_hash),
+                chart_file_hash = COALESCE({params.add(chart_hash)}, chart_file_hash),
+                preview_file_hash = CASE
+                    WHEN {preview_param} IS NOT NULL THEN {preview_param}
+                    WHEN {update_none_preview_param} THEN NULL
+                    ELSE preview_file_hash
+                END,
+                background_file_hash = CASE
+                    WHEN {background_param} IS NOT NULL THEN {background_param}
+                    WHEN {params.add(update_none_background, "bool")} THEN NULL
+                    ELSE background_file_hash
+                END,"""
+
+
+def _update_chart(params: QueryParams, assignments: str) -> ExecutableQuery:
+    return ExecutableQuery(
+        f"""
+            UPDATE charts
+            SET {assignments.strip()}
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = $1;
+        """,
+        *params.args,
+        name=query_name(),
+        invalidates=(chart_tag(params.args[0]), CHART_LIST_TAG),
+    )
+
+
+def update_metadata(
+    chart_id: str,
+    chart_author: Optional[str] = None,
+    rating: Optional[Union[int, float, Decimal]] = None,
+    description: Optional[str] = None,
+    title: Optional[str] = None,
+    artists: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    update_none_description: bool = False,
+) -> ExecutableQuery:
+    params = QueryParams(chart_id)
+    assignments = _metadata_assignments(
+        params,
+        chart_author=chart_author,
+        rating=rating,
+        description=description,
+        title=title,
+        artists=artists,
+        tags=tags,
+        update_none_description=update_none_description,
+    )
+    return _update_chart(params, assignments)
 
-    return ExecutableQuery(query, *args)
+
+def update_file_hash(
+    chart_id: str,
+    jacket_hash: Optional[str] = None,
+    v1_hash: Optional[str] = None,
+    v3_hash: Optional[str] = None,
+    music_hash: Optional[str] = None,
+    chart_hash: Optional[str] = None,
+    preview_hash: Optional[str] = None,
+    background_hash: Optional[str] = None,
+    confirm_change: bool = False,
+    update_none_preview: bool = False,
+    update_none_background: bool = False,
+) -> ExecutableQuery:
+    params = QueryParams(chart_id)
+    assignments = _file_hash_assignments(
+        params,
+        jacket_hash=jacket_hash,
+        v1_hash=v1_hash,
+        v3_hash=v3_hash,
+        music_hash=music_hash,
+        chart_hash=chart_hash,
+        preview_hash=preview_hash,
+        background_hash=background_hash,
+        confirm_change=confirm_change,
+        update_none_preview=update_none_preview,
+        update_none_background=update_none_background,
+    )
+    return _update_chart(params, assignments)
+
+
+def update_metadata_and_file_hash(
+    chart_id: str, metadata: dict, file_hashes: dict
+) -> ExecutableQuery:
+    """
+    update_metadata and update_file_hash (same keyword arguments, without
+    chart_id) as one UPDATE: one round trip, and never half an edit.
+    """
+    params = QueryParams(chart_id)
+    assignments = _metadata_assignments(params, **metadata)
+    assignments += _file_hash_assignments(params, **file_hashes)
+    return _update_chart(params, assignments)
 
 
 def add_like(chart_id: str, sonolus_id: str) -> ExecutableQuery:
@@ -527,6 +814,52 @@ def add_like(chart_id: str, sonolus_id: str) -> ExecutableQuery:
         """,
         chart_id,
         sonolus_id,
+        invalidates=(chart_tag(chart_id), CHART_LIST_TAG),
+    )
+
+
+def bulk_like(
+    sonolus_id: str, like_ids: List[str], unlike_ids: List[str]
+) -> SelectQuery[BulkLikeResult]:
+    """
+    add_like/remove_like for many charts in one statement; the like
+    triggers are per statement, so each chart's counters update once.
+    A chart id must not be in both lists.
+    """
+    return SelectQuery(
+        BulkLikeResult,
+        """
+            WITH allowed AS (
+                SELECT c.id
+                FROM unnest($2::text[] || $3::text[]) AS r(chart_id)
+                JOIN charts c ON c.id = r.chart_id
+                WHERE c.status IN ('UNLISTED', 'PUBLIC')
+                OR (c.status = 'PRIVATE' AND c.author = $1)
+            ),
+            inserted AS (
+                INSERT INTO chart_likes (chart_id, sonolus_id, created_at)
+                SELECT r.chart_id, $1, CURRENT_TIMESTAMP
+                FROM unnest($2::text[]) AS r(chart_id)
+                JOIN allowed a ON a.id = r.chart_id
+                ON CONFLICT DO NOTHING
+                RETURNING chart_id
+            ),
+            deleted AS (
+                DELETE FROM chart_likes l
+                USING unnest($3::text[]) AS r(chart_id)
+                JOIN allowed a ON a.id = r.chart_id
+                WHERE l.chart_id = r.chart_id
+                AND l.sonolus_id = $1
+                RETURNING l.chart_id
+            )
+            SELECT
+                ARRAY(SELECT chart_id FROM inserted) AS liked,
+                ARRAY(SELECT chart_id FROM deleted) AS unliked;
+        """,
+        sonolus_id,
+        like_ids,
+        unlike_ids,
+        invalidates=(*map(chart_tag, like_ids + unlike_ids), CHART_LIST_TAG),
     )
 
 
@@ -543,14 +876,13 @@ def set_staff_pick(chart_id: str, value: bool) -> SelectQuery[ChartDBResponse]:
         )
         SELECT 
             charts.*, 
-            charts.chart_author AS chart_design,
-            charts.chart_author || '#' || accounts.sonolus_handle AS author_full
+            charts.chart_author AS chart_design
         FROM charts
-        JOIN updated ON charts.id = updated.id
-        JOIN accounts ON charts.author = accounts.sonolus_id;
+        JOIN updated ON charts.id = updated.id;
         """,
         chart_id,
         value,
+        invalidates=(chart_tag(chart_id), CHART_LIST_TAG),
     )
 
 
@@ -571,6 +903,7 @@ def remove_like(chart_id: str, sonolus_id: str) -> ExecutableQuery:
         """,
         chart_id,
         sonolus_id,
+        invalidates=(chart_tag(chart_id), CHART_LIST_TAG),
     )
 
 
@@ -598,15 +931,14 @@ def update_status(
                 SELECT 
                     charts.*, 
                     chart_author AS chart_design, 
-                    (updated.published_at IS DISTINCT FROM charts.published_at) AS is_first_publish,
-                    chart_author || '#' || accounts.sonolus_handle AS author_full
+                    (updated.published_at IS DISTINCT FROM charts.published_at) AS is_first_publish
                 FROM charts
-                JOIN updated ON charts.id = updated.id
-                JOIN accounts ON charts.author = accounts.sonolus_id;
+                JOIN updated ON charts.id = updated.id;
             """,
             status,
             chart_id,
             sonolus_id,
+            invalidates=(chart_tag(chart_id), CHART_LIST_TAG),
         )
     else:
         return SelectQuery(
@@ -627,12 +959,55 @@ def update_status(
                 SELECT 
                     charts.*, 
                     chart_author AS chart_design, 
-                    (updated.published_at IS DISTINCT FROM charts.published_at) AS is_first_publish,
-                    chart_author || '#' || accounts.sonolus_handle AS author_full
+                    (updated.published_at IS DISTINCT FROM charts.published_at) AS is_first_publish
                 FROM charts
-                JOIN updated ON charts.id = updated.id
-                JOIN accounts ON charts.author = accounts.sonolus_id;
+                JOIN updated ON charts.id = updated.id;
             """,
             status,
             chart_id,
+            invalidates=(chart_tag(chart_id), CHART_LIST_TAG),
         )
+
+
+def rescore_trending_batch(
+    after_id: str, batch_size: int
+) -> SelectQuery[RescoreBatch]:
+    """
+    Re-decays trending_score for the next batch_size public charts after
+    after_id (see scripts/database_setup.py); start from "".
+    """
+    return SelectQuery(
+        RescoreBatch,
+        """
+            SELECT last_id, updated FROM rescore_trending_batch($1, $2);
+        """,
+        after_id,
+        batch_size,
+        read_only=False,  # updates charts
+        invalidates=(CHART_LIST_TAG,),
+    )
+
+
+def _canonical_shapes():
+    # public and staff pick listings for every sort, and the edit updates;
+    # anything else still lands in asyncpg's statement cache on first use
+    for staff_pick in (None, True):
+        for sort_by in CHART_LIST_SORT_COLUMNS:
+            for sort_order in ("desc", "asc"):
+                for as_json_page in (False, True):
+                    yield from get_chart_list(
+                        0,
+                        10,
+                        staff_pick=staff_pick,
+                        sort_by=sort_by,
+                        sort_order=sort_order,
+                        as_json_page=as_json_page,
+                    )
+    yield update_metadata("", title="-")
+    yield update_file_hash("", confirm_change=True)
+    yield update_metadata_and_file_hash(
+        "", {"update_none_description": True}, {"confirm_change": True}
+    )
+
+
+prepared_statements.register(*_canonical_shapes())
@@ -1,6 +1,7 @@
 from typing import Optional, Tuple
 
-from database.query import SelectQuery
+from database.charts import chart_tag
+from database.query import SelectQuery, QueryParams, JSONPage, json_page, sql_epoch_ms
 from helpers.models import Comment, CommentID, Count
 
 
@@ -22,6 +23,8 @@ def create_comment(
         sonolus_id,
         content,
         chart_id,
+        # comment_count
+        invalidates=(chart_tag(chart_id),),
     )
 
 
@@ -99,6 +102,7 @@ def get_comments(
             WHERE c.chart_id = $1{' AND c.deleted_at IS NULL' if hide_deleted else ''};
         """,
         chart_id,
+        name="comments.get_comments.count",
     )
     return comments_query, count_query
 
@@ -134,3 +138,39 @@ def get_comments_by_account(
         limit,
         offset,
     )
+
+
+def comments_json_page(
+    comments_query: SelectQuery[Comment],
+    hide_deleted_content: bool,
+    sort_desc: bool = True,
+) -> SelectQuery[JSONPage]:
+    """
+    A get_comments page as one JSON array, with epoch ms timestamps and
+    deleted comments' content replaced (kept under a mod view header
+    unless hide_deleted_content).
+    """
+    params = QueryParams(*comments_query.args)
+    hidden = params.add(hide_deleted_content)
+    fields = {
+        "id": "p.id",
+        "commenter": "p.commenter",
+        "username": "p.username",
+        "content": f"""CASE
+            WHEN p.deleted_at IS NULL THEN p.content
+            WHEN {hidden} THEN '[DELETED]'
+            ELSE E'[DELETED]\\nMod View:\\n{'-' * 10}\\n' || p.content
+        END""",
+        "created_at": sql_epoch_ms("p.created_at"),
+        "deleted_at": sql_epoch_ms("p.deleted_at"),
+        "chart_id": "p.chart_id",
+        "owner": "p.owner",
+    }
+    order_by = f"ORDER BY p.created_at {'DESC' if sort_desc else 'ASC'}"
+    page_query = SelectQuery(
+        comments_query.model,
+        comments_query.sql,
+        *params.args,
+        name=comments_query.name,
+    )
+    return json_page(page_query, fields, order_by)
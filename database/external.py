@@ -28,6 +28,8 @@ def get_external_login(
                 AND expires_at >= CURRENT_TIMESTAMP;
             """,
             id_key,
+            # polled while another request completes the login
+            read_only=False,
         )
     else:
         # NOTE: this doesn't check if the session gets deleted
@@ -42,6 +44,7 @@ def get_external_login(
                 AND session_key IS NOT NULL;
             """,
             id_key,
+            read_only=False,
         )
 
 
@@ -70,3 +73,36 @@ def delete_external_login(id_key: str) -> ExecutableQuery:
         """,
         id_key,
     )
+
+
+def claim_external_login(id_key: str) -> SelectQuery[ExternalLogin]:
+    """Takes a completed login (deleting it), so only one request gets it."""
+    return SelectQuery(
+        ExternalLogin,
+        """
+            DELETE FROM external_login_ids
+            WHERE id_key = $1
+            AND expires_at >= CURRENT_TIMESTAMP
+            AND session_key IS NOT NULL
+            RETURNING id_key, session_key, expires_at;
+        """,
+        id_key,
+    )
+
+
+def delete_expired_logins(batch_size: int) -> ExecutableQuery:
+    """At most batch_size expired login ids, oldest first (helpers.scheduler)."""
+    return ExecutableQuery(
+        """
+            DELETE FROM external_login_ids
+            WHERE id_key IN (
+                SELECT id_key
+                FROM external_login_ids
+                WHERE expires_at < CURRENT_TIMESTAMP
+                ORDER BY expires_at
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            );
+        """,
+        batch_size,
+    )
@@ -62,6 +62,7 @@ def get_leaderboard_for_chart(
             WHERE l.chart_id = $1;
         """,
         chart_id,
+        name="leaderboards.get_leaderboard_for_chart.count",
     )
 
     return (
@@ -0,0 +1,97 @@
+import asyncio
+from contextlib import contextmanager
+from typing import Optional
+
+import asyncpg
+
+EXTERNAL_LOGIN_CHANNEL = "external_login"
+
+
+class NotifyListener:
+    """
+    One connection per worker LISTENing on Postgres channels, so requests
+    can park until a NOTIFY with their payload arrives instead of polling.
+    notify_local() wakes this worker's waiters directly, for writes made
+    here (and as the fallback while the connection is down: a dropped
+    connection is reopened on the next expect()).
+    Payloads are matched exactly; waiters only ever see that they were woken.
+    """
+
+    def __init__(self):
+        self.channels: set[str] = set()
+        self.notifications = 0
+        self._conn: Optional[asyncpg.Connection] = None
+        self._connect_kwargs: Optional[dict] = None
+        self._connecting: Optional[asyncio.Task] = None
+        self._waiters: dict[tuple[str, str], set[asyncio.Future]] = {}
+
+    async def connect(self, *channels: str, **connect_kwargs) -> None:
+        self.channels.update(channels)
+        self._connect_kwargs = connect_kwargs
+        await self._ensure_connected()
+
+    async def _ensure_connected(self) -> None:
+        if self._connect_kwargs is None:
+            return
+        if self._conn is not None and not self._conn.is_closed():
+            return
+        # concurrent waiters share one reconnect attempt
+        if self._connecting is None or self._connecting.done():
+            self._connecting = asyncio.create_task(self._connect())
+        await asyncio.shield(self._connecting)
+
+    async def _connect(self) -> None:
+        try:
+            conn = await asyncpg.connect(**self._connect_kwargs)
+            for channel in self.channels:
+                await conn.add_listener(channel, self._on_notify)
+        except Exception as e:
+            print(f"[LISTEN] connect failed, local notifications only: {e}")
+            self._conn = None
+            return
+        self._conn = conn
+
+    def _on_notify(self, conn, pid: int, channel: str, payload: str) -> None:
+        self.notifications += 1
+        self.notify_local(channel, payload)
+
+    def notify_local(self, channel: str, payload: str) -> None:
+        for waiter in self._waiters.get((channel, payload), ()):
+            if not waiter.done():
+                waiter.set_result(None)
+
+    @contextmanager
+    def expect(self, channel: str, payload: str):
+        """
+        Yields a future resolved on the next notification for payload.
+        Enter it before checking whether the event already happened, so
+        nothing sent in between is missed.
+        """
+        if self._connect_kwargs is not None and (
+            self._conn is None or self._conn.is_closed()
+        ):
+            asyncio.ensure_future(self._ensure_connected())
+        key = (channel, payload)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, set()).add(waiter)
+        try:
+            yield waiter
+        finally:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[key]
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    def stats(self) -> dict:
+        return {
+            "connected": self._conn is not None and not self._conn.is_closed(),
+            "channels": sorted(self.channels),
+            "waiting": sum(len(waiters) for waiters in self._waiters.values()),
+            "notifications": self.notifications,
+        }
@@ -0,0 +1,131 @@
+import bisect, time
+from collections import deque
+from typing import Any, Optional
+
+# histogram bucket upper bounds, milliseconds (the last bucket is open)
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def param_shape(value: Any) -> str:
+    """A parameter's type (and length for lists), never its value."""
+    if value is None:
+        return "None"
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def row_count(result: Any) -> int:
+    """Rows from a fetch/fetchrow result or an execute status ("UPDATE 3")."""
+    if result is None:
+        return 0
+    if isinstance(result, str):
+        count = result.rsplit(" ", 1)[-1]
+        return int(count) if count.isdigit() else 0
+    if isinstance(result, list):
+        return len(result)
+    return 1
+
+
+class _QueryStats:
+    __slots__ = ("count", "errors", "total", "max", "rows", "pool_wait", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.pool_wait = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def percentile_ms(self, fraction: float) -> Optional[float]:
+        """Upper bound of the bucket the percentile falls in."""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for i, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= target:
+                break
+        return BUCKETS_MS[i] if i < len(BUCKETS_MS) else round(self.max * 1000, 2)
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": round(self.total * 1000, 2),
+            "mean_ms": round(self.total / self.count * 1000, 2) if self.count else None,
+            "max_ms": round(self.max * 1000, 2),
+            "p50_ms": self.percentile_ms(0.5),
+            "p95_ms": self.percentile_ms(0.95),
+            "p99_ms": self.percentile_ms(0.99),
+            "rows": self.rows,
+            "pool_wait_ms": round(self.pool_wait * 1000, 2),
+            "buckets": {
+                **{f"le_{bound}": n for bound, n in zip(BUCKETS_MS, self.buckets)},
+                "inf": self.buckets[-1],
+            },
+        }
+
+
+class QueryMetrics:
+    """
+    Latency histogram, row count and pool wait per query name (see
+    SelectQuery.name), recorded by DBConnWrapper. Queries slower than
+    slow_threshold seconds also go to the slow-query log: printed, and the
+    last slow_log_size kept for the metrics endpoint, with the parameters'
+    shape only (values can be session keys).
+    NOTE: per worker, like prepared_statements.
+    """
+
+    def __init__(self, slow_threshold: float = 0.5, slow_log_size: int = 100):
+        self.slow_threshold = slow_threshold
+        self.queries: dict[str, _QueryStats] = {}
+        self.slow_log: deque[dict] = deque(maxlen=slow_log_size)
+
+    def _stats(self, name: str) -> _QueryStats:
+        stats = self.queries.get(name)
+        if stats is None:
+            stats = self.queries[name] = _QueryStats()
+        return stats
+
+    def record(self, query, seconds: float, result: Any, pool_wait: float) -> None:
+        stats = self._stats(query.name)
+        rows = row_count(result)
+        stats.count += 1
+        stats.total += seconds
+        stats.max = max(stats.max, seconds)
+        stats.rows += rows
+        stats.pool_wait += pool_wait
+        stats.buckets[bisect.bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+
+        if seconds >= self.slow_threshold:
+            entry = {
+                "name": query.name,
+                "ms": round(seconds * 1000, 2),
+                "rows": rows,
+                "params": [param_shape(arg) for arg in query.args],
+                "at": time.time(),
+            }
+            self.slow_log.append(entry)
+            print(
+                f"[SLOW QUERY] {entry['name']} {entry['ms']}ms "
+                f"rows={rows} params=({', '.join(entry['params'])})"
+            )
+
+    def record_error(self, query) -> None:
+        self._stats(query.name).errors += 1
+
+    def stats(self) -> dict:
+        return {
+            "slow_threshold_ms": self.slow_threshold * 1000,
+            "queries": {
+                name: stats.as_dict() for name, stats in sorted(self.queries.items())
+            },
+            "slow_queries": list(self.slow_log),
+        }
+
+
+query_metrics = QueryMetrics()
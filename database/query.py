@@ -1,19 +1,257 @@
-from typing import TypeVar, Generic
+import re, sys
+from typing import TypeVar, Generic, Optional, Union
 from pydantic import BaseModel
 
-# TODO: add redis
+from asyncpg import Connection, PostgresError
 
 T = TypeVar("T", bound=BaseModel)
 
+# anything that writes or locks; such a SelectQuery must run on the primary
+WRITE_SQL_RE = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|nextval|setval|pg_advisory_\w+)\b"
+    r"|\bFOR\s+(NO\s+KEY\s+)?(UPDATE|SHARE)\b",
+    re.IGNORECASE,
+)
+
+
+def is_write_sql(sql: str) -> bool:
+    return not sql.lstrip().upper().startswith(
+        ("SELECT", "WITH")
+    ) or bool(WRITE_SQL_RE.search(sql))
+
+
+def query_name(depth: int = 2) -> str:
+    """
+    "module.function" of the query constructor `depth` frames up, e.g.
+    charts.get_chart_list; names queries in database.metrics.
+    """
+    frame = sys._getframe(depth)
+    module = frame.f_globals.get("__name__", "").removeprefix("database.")
+    return f"{module}.{frame.f_code.co_name}"
+
 
 class SelectQuery(Generic[T]):
-    def __init__(self, model: BaseModel, sql: str, *args):
+    """
+    read_only: may run on a read replica (see database.replicas).
+    Defaults to whether the SQL writes; pass False for reads that must
+    see the primary's latest state.
+    name: metrics name, defaults to the function building the query.
+    cache_ttl: serve fetch()/fetchrow() from database.cache for this many
+    seconds; cache_tags are what writes invalidate it by.
+    invalidates: cache tags dropped once this query (a write) has run.
+    """
+
+    def __init__(
+        self,
+        model: BaseModel,
+        sql: str,
+        *args,
+        read_only: Optional[bool] = None,
+        name: Optional[str] = None,
+        cache_ttl: Optional[float] = None,
+        cache_tags: tuple[str, ...] = (),
+        invalidates: tuple[str, ...] = (),
+    ):
         self.sql = sql
         self.args = args
         self.model = model
+        self.writes = is_write_sql(sql)
+        self.read_only = not self.writes if read_only is None else read_only
+        self.name = name or query_name()
+        self.cache_ttl = cache_ttl
+        self.cache_tags = cache_tags
+        self.invalidates = invalidates
 
 
 class ExecutableQuery:
-    def __init__(self, sql: str, *args):
+    def __init__(
+        self,
+        sql: str,
+        *args,
+        name: Optional[str] = None,
+        invalidates: tuple[str, ...] = (),
+    ):
         self.sql = sql
         self.args = args
+        self.name = name or query_name()
+        self.invalidates = invalidates
+
+
+class JSONPage(BaseModel):
+    data: str  # JSON array text, one object per row
+    row_count: int
+
+
+def sql_epoch_ms(column: str) -> str:
+    """Timestamp as epoch milliseconds, truncated like int(ts.timestamp() * 1000)."""
+    return f"floor(EXTRACT(EPOCH FROM {column}) * 1000)::bigint"
+
+
+def sql_isoformat(column: str) -> str:
+    """timestamptz as the UTC ISO 8601 text FastAPI writes for datetimes."""
+    return f"""to_char({column} AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.US"+00:00"')"""
+
+
+def json_page(
+    query: SelectQuery,
+    fields: dict[str, str],
+    order_by: str = "",
+    extra_columns: Optional[dict[str, str]] = None,
+) -> SelectQuery[JSONPage]:
+    """
+    Wraps a row query so Postgres returns the whole page as one JSON array
+    (JSONPage.data), to be written out as the response body as is.
+    `fields` maps output keys to SQL expressions over the rows (alias p);
+    `order_by` orders the array (json_agg ignores the subquery's order
+    otherwise); `extra_columns` are more aggregates next to data.
+    """
+    build = ", ".join(f"'{key}', {expression}" for key, expression in fields.items())
+    extra = "".join(
+        f", {expression} AS {name}" for name, expression in (extra_columns or {}).items()
+    )
+    sql = f"""
+        SELECT
+            COALESCE(json_agg(json_build_object({build}) {order_by}), '[]')::text AS data,
+            count(*) AS row_count{extra}
+        FROM ({query.sql.strip().rstrip(';')}) p
+    """
+    return SelectQuery(
+        JSONPage,
+        sql,
+        *query.args,
+        name=f"{query.name}.json_page",
+        cache_ttl=query.cache_ttl,
+        cache_tags=query.cache_tags,
+    )
+
+
+PLACEHOLDER_RE = re.compile(r"\$(\d+)")
+
+
+class CombinedResult(BaseModel):
+    # never validated; DBConnWrapper.fetch_many reads the row as is
+    pass
+
+
+def combine_queries(*queries: SelectQuery) -> SelectQuery:
+    """
+    One statement running every (read-only) query as a CTE: one round
+    trip, one snapshot. Column rN is the json_agg of the Nth query's rows,
+    in the order the query returned them.
+    Writes don't go here: Postgres only allows data-modifying WITH at the
+    top level, and sibling CTEs wouldn't see each other's writes anyway.
+    Use DBConnWrapper.transaction() for those.
+    """
+    ctes, columns, args = [], [], []
+    for i, query in enumerate(queries):
+        if not isinstance(query, SelectQuery) or query.writes:
+            raise ValueError(f"combine_queries: {query.name} writes")
+        offset = len(args)
+        sql = PLACEHOLDER_RE.sub(
+            lambda match: f"${int(match.group(1)) + offset}", query.sql
+        )
+        # numbered here, since json_agg doesn't keep the subquery's order
+        ctes.append(
+            f"q{i} AS (SELECT row_number() OVER () AS fetch_many_row, s.* "
+            f"FROM ({sql.strip().rstrip(';')}) s)"
+        )
+        args.extend(query.args)
+        columns.append(
+            f"(SELECT json_agg(to_jsonb(q{i}) - 'fetch_many_row' "
+            f"ORDER BY fetch_many_row) FROM q{i}) AS r{i}"
+        )
+    sql = f"WITH {', '.join(ctes)} SELECT {', '.join(columns)}"
+    name = f"fetch_many({', '.join(query.name for query in queries)})"
+    return SelectQuery(CombinedResult, sql, *args, name=name)
+
+
+class QueryParams:
+    """
+    Positional args of a query being built; hands out the $n placeholders.
+    """
+
+    def __init__(self, *args):
+        self.args = list(args)
+
+    def add(self, value, cast: Optional[str] = None) -> str:
+        self.args.append(value)
+        placeholder = f"${len(self.args)}"
+        return f"{placeholder}::{cast}" if cast else placeholder
+
+
+class PreparedStatements:
+    """
+    Canonical query shapes prepared on every pool connection when it's
+    created (pool init), so they never pay parse/plan on first use.
+
+    They're prepared into asyncpg's own statement cache, which conn.fetch()
+    etc. look up by SQL text: PreparedStatement objects can't be kept, asyncpg
+    invalidates them the first time the connection goes back to the pool.
+    The cache also re-prepares after a schema change by itself. Pools need
+    statement_cache_size >= cache_size() so the shapes aren't evicted.
+
+    hits/misses only count registered shapes: a miss means the shape
+    ran on a connection that wasn't prepared (and was parsed again).
+    """
+
+    def __init__(self):
+        self.shapes: set[str] = set()
+        # shapes that failed to prepare (logged once)
+        self.failed: set[str] = set()
+        # raw asyncpg connections that were prepared; dropped when closed
+        self._connections: set[Connection] = set()
+        self.hits = 0
+        self.misses = 0
+        self.unregistered = 0
+
+    def register(self, *queries: Union[SelectQuery, ExecutableQuery]) -> None:
+        for query in queries:
+            self.shapes.add(query.sql)
+
+    def cache_size(self, ad_hoc: int = 100) -> int:
+        """statement_cache_size for the shapes plus `ad_hoc` other queries."""
+        return len(self.shapes) + ad_hoc
+
+    async def prepare_connection(self, conn: Connection) -> None:
+        # in a transaction: a bare prepare can leave the connection
+        # idle in an open implicit transaction, holding locks on the tables
+        async with conn.transaction():
+            for sql in self.shapes:
+                # a savepoint each: a shape that can't be prepared (e.g. a
+                # column whose migration hasn't run) is skipped, and left
+                # to fail when it's used, instead of failing pool creation
+                try:
+                    async with conn.transaction():
+                        # the same lookup conn.fetch(sql) does, so it finds these
+                        await conn._get_statement(sql, None)
+                except PostgresError as e:
+                    if sql not in self.failed:
+                        self.failed.add(sql)
+                        print(f"[PREPARE] skipped a shape: {e!r}\n{sql.strip()}")
+        self._connections.add(conn)
+        conn.add_termination_listener(self._forget_connection)
+
+    def _forget_connection(self, conn: Connection) -> None:
+        self._connections.discard(conn)
+
+    def count(self, conn: Connection, sql: str) -> None:
+        if sql not in self.shapes:
+            self.unregistered += 1
+        # pool connections are proxies around the raw connection
+        elif getattr(conn, "_con", conn) in self._connections:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def stats(self) -> dict:
+        return {
+            "shapes": len(self.shapes),
+            "failed": len(self.failed),
+            "connections": len(self._connections),
+            "hits": self.hits,
+            "misses": self.misses,
+            "unregistered": self.unregistered,
+        }
+
+
+prepared_statements = PreparedStatements()
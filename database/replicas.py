@@ -0,0 +1,116 @@
+import asyncio, math, random
+from contextvars import ContextVar
+from typing import Optional
+
+import asyncpg
+from asyncpg.exceptions import (
+    OperatorInterventionError,
+    PostgresConnectionError,
+    SerializationError,
+)
+
+from database.query import prepared_statements
+from helpers.ttl_cache import TTLCache
+
+# sonolus id of the user the current request is for (set by helpers.session)
+request_user: ContextVar[Optional[str]] = ContextVar("request_user", default=None)
+
+# a replica that fails like this is skipped and the query retried on the
+# primary (SerializationError: canceled by a recovery conflict)
+REPLICA_ERRORS = (
+    OSError,
+    PostgresConnectionError,
+    OperatorInterventionError,
+    SerializationError,
+)
+
+# 0 when everything received is replayed, even if the primary has been idle
+# (pg_last_xact_replay_timestamp alone would keep growing then)
+REPLAY_LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END;
+"""
+
+
+class ReadReplicas:
+    """
+    Read pools next to the primary pool. DBConnWrapper sends read-only
+    SelectQuerys here; everything else, and every read once the wrapper
+    has written, stays on the primary.
+
+    A replica is only picked while its replay lag (checked every
+    check_interval seconds) is under max_lag, so a lagging or unreachable
+    replica falls back to the primary. Users who wrote in the last
+    sticky_seconds read from the primary too (read-your-writes).
+    NOTE: stickiness is per worker, like every other in-process cache;
+    keep max_lag well under sticky_seconds so other workers rarely matter.
+    """
+
+    def __init__(
+        self,
+        max_lag: float = 5,
+        sticky_seconds: float = 10,
+        check_interval: float = 2,
+    ):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.pools: list[asyncpg.Pool] = []
+        self.lag: dict[asyncpg.Pool, float] = {}
+        self._recent_writers = TTLCache(maxsize=100_000, ttl=sticky_seconds)
+        self._lag_task: Optional[asyncio.Task] = None
+
+    async def connect(self, replica_configs: list[dict], **pool_kwargs) -> None:
+        """
+        pool_kwargs are the primary's; each replica entry overrides them.
+        Replica pools start empty (min_size 0 unless set), so a replica that
+        is down at startup is just skipped until its lag check succeeds.
+        """
+        for replica_config in replica_configs:
+            kwargs = {**pool_kwargs, "min_size": 0, **replica_config}
+            pool = await asyncpg.create_pool(
+                **kwargs, init=prepared_statements.prepare_connection
+            )
+            self.pools.append(pool)
+            self.lag[pool] = math.inf
+        if self.pools:
+            await self.check_lag()
+            self._lag_task = asyncio.create_task(self._check_lag_forever())
+
+    async def check_lag(self) -> None:
+        for pool in self.pools:
+            try:
+                async with pool.acquire(timeout=self.check_interval) as conn:
+                    self.lag[pool] = float(await conn.fetchval(REPLAY_LAG_SQL))
+            except Exception:
+                self.lag[pool] = math.inf
+
+    async def _check_lag_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check_lag()
+
+    def mark_down(self, pool: asyncpg.Pool) -> None:
+        """Skip a replica that just failed until the next lag check."""
+        self.lag[pool] = math.inf
+
+    def note_write(self) -> None:
+        user = request_user.get()
+        if user:
+            self._recent_writers.set(user, True)
+
+    def pick(self) -> Optional[asyncpg.Pool]:
+        """A replica for this request's reads, or None for the primary."""
+        user = request_user.get()
+        if user and user in self._recent_writers:
+            return None
+        healthy = [pool for pool in self.pools if self.lag[pool] <= self.max_lag]
+        return random.choice(healthy) if healthy else None
+
+    def stats(self) -> dict:
+        return {
+            "replicas": len(self.pools),
+            "lag": [None if math.isinf(lag) else lag for lag in self.lag.values()],
+            "sticky_users": len(self._recent_writers),
+        }
@@ -0,0 +1,30 @@
+import json
+
+from database import DBConnWrapper
+from database.query import SelectQuery
+from helpers.ttl_cache import TTLCache
+
+# approximate_total: past this many rows, totals come from the planner
+# (cached per filter shape) instead of an exact COUNT(*)
+APPROXIMATE_TOTAL_THRESHOLD = 1000
+approximate_count_cache = TTLCache(maxsize=2048, ttl=120)
+
+
+def count_cache_key(count_query: SelectQuery) -> tuple[str, str]:
+    # args can hold lists (tags), so they're keyed by their JSON text
+    return count_query.sql, json.dumps(count_query.args, default=str)
+
+
+async def approximate_total(
+    conn: DBConnWrapper, count_query: SelectQuery, total_count: int
+) -> int:
+    """
+    Total for a count that hit its cap: the planner's estimate of the
+    uncapped count, never less than what was actually counted.
+    """
+    cache_key = count_cache_key(count_query)
+    estimate = approximate_count_cache.get(cache_key)
+    if estimate is None:
+        estimate = await conn.estimate_count(count_query)
+        approximate_count_cache.set(cache_key, estimate)
+    return max(estimate, total_count)
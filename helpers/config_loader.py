@@ -36,6 +36,8 @@ ConfigTypeServer = TypedDict(
         "auth-header": str,
         "token-secret-key": str,
         "debug": bool,
+        "json-pages": bool,
+        "background-jobs": bool,
     },
 )
 
@@ -51,6 +53,21 @@ ConfigTypeS3 = TypedDict(
     },
 )
 
+ConfigTypePsqlReplica = TypedDict(
+    "ConfigTypePsqlReplica",
+    {
+        # anything left out is taken from the primary's settings
+        "host": str,
+        "port": int,
+        "user": str,
+        "database": str,
+        "password": str,
+        "min_size": int,
+        "max_size": int,
+    },
+    total=False,
+)
+
 ConfigTypePsql = TypedDict(
     "ConfigTypePsql",
     {
@@ -61,7 +78,24 @@ ConfigTypePsql = TypedDict(
         "password": str,
         "pool-min-size": int,
         "pool-max-size": int,
+        "replicas": list[ConfigTypePsqlReplica],
+        "replica-max-lag": float,
+        "replica-sticky-seconds": float,
+        "slow-query-ms": float,
+    },
+)
+
+ConfigTypeCache = TypedDict(
+    "ConfigTypeCache",
+    {
+        "backend": str,  # "local" (default) or "redis"
+        "max-size": int,
+        "redis-host": str,
+        "redis-port": int,
+        "redis-db": int,
+        "redis-password": str,
     },
+    total=False,
 )
 
 ConfigType = TypedDict(
@@ -72,6 +106,7 @@ ConfigType = TypedDict(
         "psql": ConfigTypePsql,
         "discord": ConfigTypeDiscord,
         "oauth": ConfigTypeOAuth,
+        "cache": ConfigTypeCache,
     },
 )
 
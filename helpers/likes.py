@@ -0,0 +1,38 @@
+from typing import Iterable
+
+from database import DBConnWrapper, charts
+from helpers.ttl_cache import TTLCache
+
+# (sonolus_id, chart_id) -> liked
+# short-lived so a like made through another worker shows up quickly
+liked_cache = TTLCache(maxsize=50_000, ttl=30)
+
+
+async def get_liked_chart_ids(
+    conn: DBConnWrapper, sonolus_id: str, chart_ids: Iterable[str]
+) -> set[str]:
+    """
+    Resolve liked flags for a page of charts.
+    Only ids missing from the cache are looked up, in a single query.
+    """
+    liked = set()
+    missing = []
+    for chart_id in chart_ids:
+        cached = liked_cache.get((sonolus_id, chart_id))
+        if cached is None:
+            missing.append(chart_id)
+        elif cached:
+            liked.add(chart_id)
+
+    if missing:
+        rows = await conn.fetch(charts.get_liked_chart_ids(sonolus_id, missing))
+        found = {row.id for row in rows} if rows else set()
+        for chart_id in missing:
+            liked_cache.set((sonolus_id, chart_id), chart_id in found)
+        liked |= found
+
+    return liked
+
+
+def forget_liked(sonolus_id: str, chart_id: str) -> None:
+    liked_cache.pop((sonolus_id, chart_id))
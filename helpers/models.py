@@ -4,6 +4,7 @@ from typing import List, Literal, Optional
 from datetime import datetime
 from typing import Any, Union
 from decimal import Decimal, ROUND_HALF_UP
+from enum import IntFlag
 
 
 class ServiceUserProfile(BaseModel):
@@ -35,6 +36,14 @@ class Like(BaseModel):
     type: Literal["like", "unlike"]
 
 
+class BulkLikeItem(Like):
+    chart_id: str
+
+
+class BulkLike(BaseModel):
+    likes: List[BulkLikeItem]
+
+
 class ServiceUserProfileWithType(ServiceUserProfile):
     type: Literal["game"]
 
@@ -83,10 +92,36 @@ class ChartEditData(BaseModel):
     includes_chart: Optional[bool] = False
 
 
+class Role(IntFlag):
+    MOD = 1
+    ADMIN = 2
+    BANNED = 4
+
+
 class SessionKeyData(BaseModel):
     id: str
     user_id: str
     type: Literal["game", "external"]
+    # v2 tokens only, see ChartFastAPI.encode_key
+    v: int = 1
+    exp: Optional[int] = None  # epoch ms
+    roles: int = 0  # Role bits when signed
+    epoch: int = 0  # token_epochs.epoch when signed
+
+
+class TokenClaims(BaseModel):
+    mod: bool = False
+    admin: bool = False
+    banned: bool = False
+    epoch: int = 0
+
+    @property
+    def roles(self) -> int:
+        return (
+            (Role.MOD if self.mod else 0)
+            | (Role.ADMIN if self.admin else 0)
+            | (Role.BANNED if self.banned else 0)
+        )
 
 
 class OAuth(BaseModel):
@@ -107,9 +142,6 @@ class Account(BaseModel):
     discord_id: Optional[int] = None
     patreon_id: Optional[str] = None
     chart_upload_cooldown: Optional[datetime] = None
-    sonolus_sessions: Optional[
-        dict[Literal["game", "external"], dict[int, SessionData]]
-    ] = None
     oauth_details: Optional[dict[str, OAuth]] = None
     subscription_details: Optional[Any] = None
     created_at: datetime
@@ -118,7 +150,7 @@ class Account(BaseModel):
     admin: bool = False
     banned: bool = False
 
-    @field_validator("sonolus_sessions", "oauth_details", mode="before")
+    @field_validator("oauth_details", mode="before")
     @classmethod
     def parse_json(cls, v):
         if isinstance(v, str):
@@ -129,6 +161,15 @@ class Account(BaseModel):
         return v
 
 
+class AuthContext(BaseModel):
+    # what a request is authenticated as, see helpers.session.Session.context
+    sonolus_id: str
+    mod: bool = False
+    admin: bool = False
+    banned: bool = False
+    session_expires: Optional[int] = None  # epoch ms
+
+
 class Chart(BaseModel):
     # THIS IS FOR INCOMING API REQUESTS ONLY!
     id: str
@@ -152,6 +193,11 @@ class Count(BaseModel):
     total_count: int
 
 
+class RescoreBatch(BaseModel):
+    last_id: Optional[str] = None  # None once past the last chart
+    updated: int
+
+
 class ChartDBResponse(BaseModel):
     id: str
     rating: Union[int, Decimal]
@@ -203,16 +249,19 @@ class ChartDBResponse(BaseModel):
         return values
 
 
-class ChartDBResponseLiked(ChartDBResponse):
-    liked: bool
+class ChartListDBResponse(ChartDBResponse):
+    total_count: int  # whole result set, not just this page
+    relevance: Optional[float] = None  # only with a text filter
+    trending_score: Optional[float] = None  # decaying_likes cursor, not sent
 
 
 class ChartByID(ChartDBResponse):
     log_like_score: float
 
 
-class ChartByIDLiked(ChartByID):
-    liked: bool
+class ChartPoolEntry(BaseModel):
+    id: str
+    staff_pick: bool
 
 
 class CommentID(BaseModel):
@@ -248,6 +297,12 @@ class DBID(BaseModel):
     id: str
 
 
+class BulkLikeResult(BaseModel):
+    # chart ids that actually changed
+    liked: List[str]
+    unliked: List[str]
+
+
 class ChartConstantData(BaseModel):
     constant: Decimal
 
@@ -0,0 +1,92 @@
+import asyncio, random, time
+from typing import Optional
+
+from database import DBConnWrapper, charts
+
+
+class RandomChartPool:
+    """
+    Public chart ids kept in each worker so random picks are a sample
+    from memory plus one `id = ANY($1)` fetch, instead of ORDER BY RANDOM().
+
+    Reloaded every refresh_interval seconds. Changes made in this worker
+    (publish/unpublish/staff pick/delete) are applied in place with
+    update()/remove(); other workers see them on their next reload.
+    """
+
+    def __init__(self, refresh_interval: float = 120):
+        self.refresh_interval = refresh_interval
+        self._staff_picks: list[str] = []
+        self._others: list[str] = []
+        # id -> its index in _staff_picks or _others, for O(1) removal
+        self._positions: dict[str, int] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def _list(self, staff_pick: bool) -> list[str]:
+        return self._staff_picks if staff_pick else self._others
+
+    def update(self, chart_id: str, public: bool, staff_pick: bool) -> None:
+        """A chart's new status/staff pick, written by this worker."""
+        self.remove(chart_id)
+        if public and self._loaded_at is not None:
+            ids = self._list(staff_pick)
+            self._positions[chart_id] = len(ids)
+            ids.append(chart_id)
+
+    def remove(self, chart_id: str) -> None:
+        position = self._positions.pop(chart_id, None)
+        if position is None:
+            return
+        for ids in (self._staff_picks, self._others):
+            if position < len(ids) and ids[position] == chart_id:
+                # swap with the last id instead of shifting the list
+                last = ids.pop()
+                if last != chart_id:
+                    ids[position] = last
+                    self._positions[last] = position
+                return
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._loaded_at is not None
+            and time.monotonic() - self._loaded_at < self.refresh_interval
+        )
+
+    async def _refresh(self, conn: DBConnWrapper) -> None:
+        async with self._lock:
+            if self._is_fresh():
+                return  # another request reloaded it while we waited
+            rows = await conn.fetch(charts.get_public_chart_ids())
+            staff_picks, others = [], []
+            for row in rows or []:
+                (staff_picks if row.staff_pick else others).append(row.id)
+            self._staff_picks, self._others = staff_picks, others
+            self._positions = {
+                **{chart_id: i for i, chart_id in enumerate(staff_picks)},
+                **{chart_id: i for i, chart_id in enumerate(others)},
+            }
+            self._loaded_at = time.monotonic()
+
+    async def sample(
+        self, conn: DBConnWrapper, count: int, staff_pick: Optional[bool] = None
+    ) -> list[str]:
+        if not self._is_fresh():
+            await self._refresh(conn)
+
+        if staff_pick is True:
+            return random.sample(self._staff_picks, min(count, len(self._staff_picks)))
+        if staff_pick is False:
+            return random.sample(self._others, min(count, len(self._others)))
+
+        # sample positions across both lists without building a combined list
+        staff_count = len(self._staff_picks)
+        total = staff_count + len(self._others)
+        return [
+            (
+                self._staff_picks[i]
+                if i < staff_count
+                else self._others[i - staff_count]
+            )
+            for i in random.sample(range(total), min(count, total))
+        ]
@@ -0,0 +1,145 @@
+import json, types, typing
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from json.encoder import encode_basestring
+from typing import Callable, Iterable, Optional
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+# Read-path serialization for trusted DB rows: asyncpg Record -> JSON text,
+# skipping model_validate/model_dump/jsonable_encoder. Output matches what
+# FastAPI would have produced from the validated model.
+
+
+def _dumps(value) -> str:
+    # same settings as fastapi's JSONResponse
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _bool(value) -> str:
+    return "true" if value else "false"
+
+
+def _datetime(value: datetime) -> str:
+    return '"' + value.isoformat() + '"'
+
+
+def _float(value) -> str:
+    # numeric columns come back as Decimal
+    return repr(float(value))
+
+
+def _rating(value) -> str:
+    # ChartDBResponse.coerce_rating, then fastapi's Decimal -> int/float
+    if isinstance(value, float):
+        value = Decimal(str(value))
+    if isinstance(value, Decimal):
+        value = value.quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP)
+        if value == value.to_integral():
+            return str(int(value))
+        return repr(float(value))
+    return str(int(value))
+
+
+def epoch_ms(value: Optional[datetime]) -> str:
+    """Override for timestamp fields the API sends as epoch milliseconds."""
+    return "null" if value is None else str(int(value.timestamp() * 1000))
+
+
+def _field_encoder(annotation) -> Callable[[object], str]:
+    args = [a for a in typing.get_args(annotation) if a is not type(None)]
+    origin = typing.get_origin(annotation)
+    if origin in (typing.Union, types.UnionType):
+        if Decimal in args:
+            return _rating
+        if len(args) == 1:
+            return _field_encoder(args[0])
+        return _dumps
+    if origin is typing.Literal or annotation is str:
+        return encode_basestring
+    if annotation is bool:
+        return _bool
+    if annotation is int:
+        return str
+    if annotation is float:
+        return _float
+    if annotation is datetime:
+        return _datetime
+    if annotation is Decimal:
+        return _rating
+    return _dumps
+
+
+class RecordEncoder:
+    """
+    Compiled Record -> JSON object encoder for one pydantic model.
+    Every model field is written (missing columns as null, like model_dump),
+    minus `exclude`; `overrides` replaces the encoder of a field and must
+    return JSON text. Works on asyncpg Records and plain dicts.
+    """
+
+    def __init__(
+        self,
+        model: type[BaseModel],
+        exclude: Iterable[str] = (),
+        overrides: Optional[dict[str, Callable[[object], str]]] = None,
+    ):
+        overrides = overrides or {}
+        namespace = {}
+        parts = []
+        for i, (name, field) in enumerate(model.model_fields.items()):
+            if name in exclude:
+                continue
+            namespace[f"e{i}"] = overrides.get(name) or _field_encoder(field.annotation)
+            key = encode_basestring(name)
+            prefix = ("{" if not parts else ",") + key + ":"
+            parts.append(
+                f"{prefix!r} + ('null' if (v := r.get({name!r})) is None else e{i}(v))"
+            )
+        body = " + ".join(parts) if parts else "'{'"
+        source = f"def encode(r):\n    return {body} + '}}'\n"
+        exec(source, namespace)
+        self._encode = namespace["encode"]
+
+    def encode(self, record, **extra) -> str:
+        """JSON object text; `extra` keys are appended (json.dumps'd)."""
+        text = self._encode(record)
+        if extra:
+            text = (
+                text[:-1]
+                + "".join(
+                    f",{encode_basestring(key)}:{_dumps(value)}"
+                    for key, value in extra.items()
+                )
+                + "}"
+            )
+        return text
+
+
+class RawJSON(str):
+    """Already-encoded JSON, spliced into json_response as is."""
+
+
+def json_array(items: Iterable[str]) -> RawJSON:
+    return RawJSON("[" + ",".join(items) + "]")
+
+
+def json_response(content: dict, status_code: int = 200) -> Response:
+    """
+    JSON object response where RawJSON values are inserted verbatim
+    and everything else goes through json.dumps.
+    """
+    body = (
+        "{"
+        + ",".join(
+            encode_basestring(key)
+            + ":"
+            + (value if isinstance(value, RawJSON) else _dumps(value))
+            for key, value in content.items()
+        )
+        + "}"
+    )
+    return Response(
+        content=body.encode(), status_code=status_code, media_type="application/json"
+    )
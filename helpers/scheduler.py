@@ -0,0 +1,221 @@
+import asyncio, random, time, zlib
+from typing import Awaitable, Callable, Optional
+
+import asyncpg
+
+from database import DBConnWrapper, accounts, charts, external
+from database.metrics import row_count
+from database.query import ExecutableQuery
+
+# advisory lock keys are (LOCK_NAMESPACE, crc32 of the job name)
+LOCK_NAMESPACE = 0x43484254
+
+HOLDS_LOCK_SQL = """
+    SELECT EXISTS (
+        SELECT 1 FROM pg_locks
+        WHERE locktype = 'advisory' AND classid = $1 AND objid = $2
+        AND objsubid = 2 AND pid = pg_backend_pid() AND granted
+    );
+"""
+
+JobFunc = Callable[[DBConnWrapper], Awaitable[Optional[int]]]
+
+
+class Job:
+    def __init__(self, name: str, interval: float, func: JobFunc, jitter: float):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.jitter = jitter
+        self.lock_key = zlib.crc32(name.encode()) & 0x7FFFFFFF
+        self.leader = False
+        self.runs = 0
+        self.errors = 0
+        self.rows = 0
+        self.total = 0.0
+        self.last_duration: Optional[float] = None
+        self.last_run: Optional[float] = None
+
+    def next_delay(self) -> float:
+        # spread out so workers (and jobs) don't all fire at once
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def as_dict(self) -> dict:
+        return {
+            "interval": self.interval,
+            "leader": self.leader,
+            "runs": self.runs,
+            "errors": self.errors,
+            "rows": self.rows,
+            "total_ms": round(self.total * 1000, 2),
+            "last_ms": (
+                round(self.last_duration * 1000, 2)
+                if self.last_duration is not None
+                else None
+            ),
+            "last_run": self.last_run,
+        }
+
+
+class Scheduler:
+    """
+    Periodic maintenance jobs, started in every worker. Each job only runs
+    in the worker holding its advisory lock: a session lock on one
+    connection of the scheduler's own, kept until the worker exits (or the
+    connection drops), so another worker takes over within an interval.
+    Workers that lose keep trying on every tick.
+    NOTE: stats are for this worker's jobs; poll the metrics endpoint
+    until it hits the leader.
+    """
+
+    def __init__(self):
+        self.jobs: dict[str, Job] = {}
+        self._new_db_wrapper: Optional[Callable[[], DBConnWrapper]] = None
+        self._connect_kwargs: Optional[dict] = None
+        self._conn: Optional[asyncpg.Connection] = None
+        self._lock = asyncio.Lock()
+        self._tasks: list[asyncio.Task] = []
+
+    def job(self, name: str, interval: float, jitter: float = 0.1):
+        def register(func: JobFunc) -> JobFunc:
+            self.jobs[name] = Job(name, interval, func, jitter)
+            return func
+
+        return register
+
+    async def start(
+        self, new_db_wrapper: Callable[[], DBConnWrapper], **connect_kwargs
+    ) -> None:
+        self._new_db_wrapper = new_db_wrapper
+        self._connect_kwargs = connect_kwargs
+        for job in self.jobs.values():
+            self._tasks.append(asyncio.create_task(self._run_forever(job)))
+
+    async def _connection(self) -> Optional[asyncpg.Connection]:
+        if self._conn is not None and not self._conn.is_closed():
+            return self._conn
+        # the locks went with the old connection
+        for job in self.jobs.values():
+            job.leader = False
+        try:
+            self._conn = await asyncpg.connect(**self._connect_kwargs)
+        except Exception as e:
+            print(f"[SCHEDULER] connect failed: {e}")
+            self._conn = None
+        return self._conn
+
+    async def _lead(self, job: Job) -> bool:
+        async with self._lock:
+            conn = await self._connection()
+            if conn is None:
+                return False
+            try:
+                if job.leader:
+                    # a dropped connection can look open until it's used
+                    job.leader = await conn.fetchval(
+                        HOLDS_LOCK_SQL, LOCK_NAMESPACE, job.lock_key
+                    )
+                if not job.leader:
+                    job.leader = await conn.fetchval(
+                        "SELECT pg_try_advisory_lock($1, $2);",
+                        LOCK_NAMESPACE,
+                        job.lock_key,
+                    )
+            except Exception as e:
+                print(f"[SCHEDULER] {job.name}: lock check failed: {e}")
+                # start over on a new connection, giving up every lock
+                conn.terminate()
+                job.leader = False
+            return job.leader
+
+    async def _run_forever(self, job: Job) -> None:
+        while True:
+            await asyncio.sleep(job.next_delay())
+            if await self._lead(job):
+                await self.run(job)
+
+    async def run(self, job: Job) -> None:
+        wrapper = self._new_db_wrapper()
+        start = time.perf_counter()
+        try:
+            job.rows += await job.func(wrapper) or 0
+        except Exception as e:
+            job.errors += 1
+            print(f"[SCHEDULER] {job.name} failed: {e!r}")
+        finally:
+            await wrapper.close()
+            job.last_duration = time.perf_counter() - start
+            job.total += job.last_duration
+            job.runs += 1
+            job.last_run = time.time()
+
+    async def stop(self) -> None:
+        """
+        Cancels the jobs, waits for them to give their connections back,
+        then closes the lock connection (releasing every lock with it).
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        async with self._lock:
+            if self._conn is not None:
+                await self._conn.close()
+                self._conn = None
+            for job in self.jobs.values():
+                job.leader = False
+
+    def stats(self) -> dict:
+        return {name: job.as_dict() for name, job in sorted(self.jobs.items())}
+
+
+async def delete_in_batches(
+    conn: DBConnWrapper,
+    query: Callable[[int], ExecutableQuery],
+    batch_size: int = 1000,
+    pause: float = 0.1,
+) -> int:
+    """
+    Runs query(batch_size) until it deletes less than a batch, so locks
+    are held one short batch at a time; the connection goes back to the
+    pool between batches.
+    """
+    deleted = 0
+    while True:
+        batch = row_count(await conn.execute(query(batch_size)))
+        deleted += batch
+        if batch < batch_size:
+            return deleted
+        await conn.release()
+        await asyncio.sleep(pause)
+
+
+scheduler = Scheduler()
+
+
+@scheduler.job("delete_expired_logins", interval=60)
+async def delete_expired_logins(conn: DBConnWrapper) -> int:
+    return await delete_in_batches(conn, external.delete_expired_logins)
+
+
+@scheduler.job("delete_expired_sessions", interval=10 * 60)
+async def delete_expired_sessions(conn: DBConnWrapper) -> int:
+    return await delete_in_batches(conn, accounts.delete_expired_sessions)
+
+
+@scheduler.job("rescore_trending", interval=10 * 60)
+async def rescore_trending(
+    conn: DBConnWrapper, batch_size: int = 1000, pause: float = 0.1
+) -> int:
+    # keyset over chart ids, one batch per statement (and transaction)
+    updated, after_id = 0, ""
+    while True:
+        batch = await conn.fetchrow(
+            charts.rescore_trending_batch(after_id, batch_size)
+        )
+        if batch is None or batch.last_id is None:
+            return updated
+        updated += batch.updated
+        after_id = batch.last_id
+        await conn.release()
+        await asyncio.sleep(pause)
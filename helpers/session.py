@@ -1,9 +1,98 @@
+import time
 from fastapi import Header, HTTPException, status, Request
 from core import ChartFastAPI
 from typing import Literal, Optional
 from database import accounts
+from database.replicas import request_user
 from fastapi import Depends
-from helpers.models import Account
+from helpers.models import Account, AuthContext, Role, SessionKeyData, TokenClaims
+from helpers.ttl_cache import TTLCache
+
+_MISSING = object()
+
+# sonolus_id -> {(session type, session key): (AuthContext, expires)}
+# keyed by account so forget_account() drops all of its sessions at once;
+# short-lived so changes made through another worker or the scripts show up
+verified_sessions = TTLCache(maxsize=50_000, ttl=60)
+
+
+def _get_verified(sonolus_id: str, key: tuple[str, str]) -> Optional[AuthContext]:
+    entry = verified_sessions.get(sonolus_id, {}).get(key)
+    if entry is None:
+        return None
+    context, expires = entry
+    if expires <= time.monotonic():
+        return None
+    return context
+
+
+def _remember_verified(
+    sonolus_id: str, key: tuple[str, str], context: AuthContext
+) -> None:
+    # never outlive the session itself
+    ttl = verified_sessions.ttl
+    if context.session_expires is not None:
+        ttl = min(ttl, context.session_expires / 1000 - time.time())
+    if ttl <= 0:
+        return
+    now = time.monotonic()
+    sessions = {
+        other: entry
+        for other, entry in (verified_sessions.get(sonolus_id) or {}).items()
+        if entry[1] > now
+    }
+    sessions[key] = (context, now + ttl)
+    verified_sessions.set(sonolus_id, sessions)
+
+
+# sonolus_id -> token_epochs.epoch (None: no account), see check_token
+token_epochs = TTLCache(maxsize=100_000, ttl=30)
+
+
+def forget_account(sonolus_id: str) -> None:
+    """Call after banning, changing roles of or deleting an account."""
+    verified_sessions.pop(sonolus_id)
+    token_epochs.pop(sonolus_id)
+
+
+def new_session_key(
+    app: ChartFastAPI,
+    session_id: str,
+    sonolus_id: str,
+    session_type: str,
+    expires_at: int,
+    claims: Optional[TokenClaims],
+) -> str:
+    """v2 session token; claims from accounts.get_token_claims (None: new account)."""
+    claims = claims or TokenClaims()
+    return app.encode_key(
+        {
+            "v": 2,
+            "id": session_id,
+            "user_id": sonolus_id,
+            "type": session_type,
+            "exp": expires_at,
+            "roles": claims.roles,
+            "epoch": claims.epoch,
+        }
+    )
+
+
+async def check_token(app: ChartFastAPI, session_data: SessionKeyData) -> bool:
+    """
+    Whether a v2 token (already checked by decode_key) is still current:
+    its epoch is the account's. Epochs are cached per worker for
+    token_epochs.ttl, which is how long revocation takes on other workers.
+    """
+    epoch = token_epochs.get(session_data.user_id, _MISSING)
+    if epoch is _MISSING:
+        async with app.db_acquire() as conn:
+            claims = await conn.fetchrow(
+                accounts.get_token_claims(session_data.user_id)
+            )
+        epoch = claims.epoch if claims else None
+        token_epochs.set(session_data.user_id, epoch)
+    return epoch == session_data.epoch
 
 
 def get_session(
@@ -33,27 +122,62 @@ class Session:
         self.enforce_auth = enforce_auth
         self.enforce_type = enforce_type
         self.allow_banned_users = allow_banned_users
-        self._user_fetched = False
-        self._user = None
+        self.context: Optional[AuthContext] = None
+        self._user: Optional[Account] = None
 
-    async def user(self) -> Account:
-        if not self._user_fetched:
-            query = accounts.get_account_from_session(
-                self.session_data.user_id, self.auth, self.session_data.type
+    async def _verify(self) -> AuthContext:
+        session_data = self.session_data
+        if session_data.v >= 2:
+            # stateless: signature and expiry (decode_key), epoch and roles
+            if not await check_token(self.app, session_data):
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Not logged in.",
+                )
+            return AuthContext(
+                sonolus_id=session_data.user_id,
+                mod=bool(session_data.roles & Role.MOD),
+                admin=bool(session_data.roles & Role.ADMIN),
+                banned=bool(session_data.roles & Role.BANNED),
+                session_expires=session_data.exp,
             )
 
+        key = (session_data.type, self.auth)
+        context = _get_verified(session_data.user_id, key)
+        if context is None:
             async with self.app.db_acquire() as conn:
-                result = await conn.fetchrow(query)
-
-                if not result and self.enforce_auth:
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail="Not logged in.",
+                context = await conn.fetchrow(
+                    accounts.get_auth_context(
+                        session_data.user_id, self.auth, session_data.type
                     )
+                )
+            if not context:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Not logged in.",
+                )
+            _remember_verified(session_data.user_id, key, context)
+        return context
 
-                self._user = result
-                self._user_fetched = True
-
+    async def user(self) -> Account:
+        """
+        The full account row, loaded on first call. Most handlers only
+        need self.context, which the dependency has already filled in.
+        """
+        if self.context is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="Not logged in."
+            )
+        if self._user is None:
+            async with self.app.db_acquire() as conn:
+                self._user = await conn.fetchrow(
+                    accounts.get_account(self.context.sonolus_id)
+                )
+            if not self._user:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Not logged in.",
+                )
         return self._user
 
     async def __call__(
@@ -69,19 +193,22 @@ class Session:
 
         if authorization:
             self.session_data = self.app.decode_key(authorization)
+            if not isinstance(self.session_data, SessionKeyData):
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid session token.",
+                )
             self.sonolus_id = self.session_data.user_id
+            # for read-your-writes on the replicas
+            request_user.set(self.sonolus_id)
 
             if self.enforce_type and self.session_data.type != self.enforce_type:
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN, detail="Invalid token type."
                 )
-            user = await self.user()
-            if not user:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED, detail="Not logged in."
-                )
+            self.context = await self._verify()
             if not self.allow_banned_users:
-                if user.banned:
+                if self.context.banned:
                     raise HTTPException(
                         status_code=status.HTTP_403_FORBIDDEN, detail="User banned."
                     )
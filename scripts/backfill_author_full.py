@@ -0,0 +1,60 @@
+import asyncio
+
+import asyncpg
+import yaml
+
+with open("config.yml", "r") as f:
+    config = yaml.load(f, yaml.Loader)
+
+psql_config = config["psql"]
+
+BATCH_SIZE = 1000
+
+# Fills charts.author_full for rows created before the column existed
+# (or that drifted). Batched so it never locks the whole table.
+# Run scripts/database_setup.py first so the column and triggers exist.
+
+
+async def main():
+    db = await asyncpg.create_pool(
+        host=psql_config["host"],
+        user=psql_config["user"],
+        database=psql_config["database"],
+        password=psql_config["password"],
+        port=psql_config["port"],
+        min_size=1,
+        max_size=1,
+        ssl="disable",
+    )
+    print("Connected!")
+
+    total = 0
+    async with db.acquire() as connection:
+        while True:
+            result = await connection.execute(
+                """
+                UPDATE charts c
+                SET author_full = c.chart_author || '#' || a.sonolus_handle
+                FROM accounts a
+                WHERE a.sonolus_id = c.author
+                AND c.id IN (
+                    SELECT c2.id
+                    FROM charts c2
+                    JOIN accounts a2 ON a2.sonolus_id = c2.author
+                    WHERE c2.author_full IS DISTINCT FROM c2.chart_author || '#' || a2.sonolus_handle
+                    LIMIT $1
+                );
+                """,
+                BATCH_SIZE,
+            )
+            updated = int(result.split()[-1])
+            total += updated
+            if updated:
+                print(f"Updated {total} charts...")
+            if updated < BATCH_SIZE:
+                break
+    print(f"Done! {total} charts backfilled.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,313 @@
+import argparse, asyncio, datetime, json, os, subprocess, sys, time
+
+import asyncpg
+import yaml
+
+from database import charts
+from scripts.query_shapes import (
+    load_samples,
+    chart_list_shapes,
+    cursor_kwargs,
+    detail_shapes,
+    seq_scans,
+)
+
+with open("config.yml", "r") as f:
+    config = yaml.load(f, yaml.Loader)
+
+psql_config = config["psql"]
+
+# Latency and plan benchmark for the list/comment/leaderboard queries.
+# Run from the repo root, against a throwaway database:
+#   python -m scripts.benchmark_queries --seed     (once, on an empty database)
+#   python -m scripts.benchmark_queries            (writes benchmark_results/<commit>.json)
+#   python -m scripts.benchmark_queries --compare old.json new.json
+# Seeding uses a fixed random seed so every commit is measured on the same data.
+
+SCALE = {
+    "accounts": 50_000,
+    "charts": 200_000,
+    "likes": 10_000_000,
+    "comments": 1_000_000,
+    "leaderboards": 200_000,
+}
+SEED_BATCH = 1_000_000
+ITERATIONS = 20
+WARMUP = 2
+RESULTS_DIR = "benchmark_results"
+# --compare flags shapes whose p95 grew by more than this
+REGRESSION_RATIO = 1.2
+
+
+async def seed(connection: asyncpg.Connection) -> None:
+    if await connection.fetchval("SELECT EXISTS (SELECT 1 FROM charts)"):
+        print("charts is not empty, refusing to seed.")
+        sys.exit(1)
+
+    await connection.execute("SELECT setseed(0.42);")
+    print(f"Seeding {SCALE['accounts']} accounts...")
+    await connection.execute(
+        """
+        INSERT INTO accounts (sonolus_id, sonolus_handle, sonolus_username)
+        SELECT 'bench' || g, g, 'user' || g
+        FROM generate_series(1, $1) g;
+        """,
+        SCALE["accounts"],
+    )
+    print(f"Seeding {SCALE['charts']} charts...")
+    # skewed authors, 80% public, ~1% staff picks
+    await connection.execute(
+        """
+        INSERT INTO charts (
+            id, author, rating, chart_author, title, artists, description, tags, status,
+            staff_pick, jacket_file_hash, music_file_hash, chart_file_hash,
+            background_v1_file_hash, background_v3_file_hash, created_at, published_at
+        )
+        SELECT
+            md5('bench' || g),
+            'bench' || (1 + floor(power(random(), 2) * $2))::int,
+            1 + floor(random() * 40),
+            'designer' || g,
+            'Song ' || (g % 5000) || ' ' || substr(md5(g::text), 1, 6),
+            'Artist ' || (g % 2000),
+            'Description for chart ' || g,
+            ARRAY['tag' || (g % 30), 'tag' || (g % 7)],
+            (CASE WHEN g % 10 = 0 THEN 'PRIVATE' WHEN g % 10 = 1 THEN 'UNLISTED' ELSE 'PUBLIC' END)::chart_status,
+            random() < 0.01,
+            'j', 'm', 'c', 'b1', 'b3',
+            ts,
+            CASE WHEN g % 10 > 1 THEN ts END
+        FROM (
+            SELECT g, NOW() - random() * INTERVAL '730 days' AS ts
+            FROM generate_series(1, $1) g
+        ) s;
+        """,
+        SCALE["charts"],
+        SCALE["accounts"],
+    )
+
+    # counters are rebuilt in bulk below instead of firing per row
+    await connection.execute(
+        "ALTER TABLE chart_likes DISABLE TRIGGER trg_like_count_inserted;"
+    )
+    await connection.execute(
+        "ALTER TABLE comments DISABLE TRIGGER trg_update_comment_count;"
+    )
+    try:
+        for start in range(1, SCALE["likes"] + 1, SEED_BATCH):
+            end = min(start + SEED_BATCH - 1, SCALE["likes"])
+            print(f"Seeding likes {start}-{end}...")
+            # popularity skewed towards a few charts
+            await connection.execute(
+                """
+                INSERT INTO chart_likes (chart_id, sonolus_id, created_at)
+                SELECT
+                    md5('bench' || (1 + floor(power(random(), 3) * $3))::int),
+                    'bench' || (1 + floor(random() * $4))::int,
+                    NOW() - random() * INTERVAL '365 days'
+                FROM generate_series($1::int, $2::int) g
+                ON CONFLICT DO NOTHING;
+                """,
+                start,
+                end,
+                SCALE["charts"],
+                SCALE["accounts"],
+            )
+        print(f"Seeding {SCALE['comments']} comments...")
+        await connection.execute(
+            """
+            INSERT INTO comments (commenter, content, chart_id, created_at, deleted_at)
+            SELECT
+                'bench' || (1 + floor(random() * $2))::int,
+                'comment ' || g,
+                md5('bench' || (1 + floor(power(random(), 3) * $3))::int),
+                NOW() - random() * INTERVAL '365 days',
+                CASE WHEN random() < 0.05 THEN NOW() END
+            FROM generate_series(1, $1) g;
+            """,
+            SCALE["comments"],
+            SCALE["accounts"],
+            SCALE["charts"],
+        )
+    finally:
+        await connection.execute(
+            "ALTER TABLE chart_likes ENABLE TRIGGER trg_like_count_inserted;"
+        )
+        await connection.execute(
+            "ALTER TABLE comments ENABLE TRIGGER trg_update_comment_count;"
+        )
+
+    print(f"Seeding {SCALE['leaderboards']} leaderboard entries...")
+    await connection.execute(
+        """
+        INSERT INTO leaderboards (submitter, replay_hash, chart_id, created_at)
+        SELECT
+            'bench' || (1 + floor(random() * $2))::int,
+            md5(g::text),
+            md5('bench' || (1 + floor(power(random(), 3) * $3))::int),
+            NOW() - random() * INTERVAL '365 days'
+        FROM generate_series(1, $1) g;
+        """,
+        SCALE["leaderboards"],
+        SCALE["accounts"],
+        SCALE["charts"],
+    )
+
+    print("Rebuilding counters...")
+    await connection.execute(
+        """
+        UPDATE charts c
+        SET like_count = l.n
+        FROM (SELECT chart_id, COUNT(*) AS n FROM chart_likes GROUP BY chart_id) l
+        WHERE c.id = l.chart_id;
+        """
+    )
+    await connection.execute(
+        """
+        UPDATE charts c
+        SET comment_count = m.n
+        FROM (SELECT chart_id, COUNT(*) AS n FROM comments GROUP BY chart_id) m
+        WHERE c.id = m.chart_id;
+        """
+    )
+    await connection.execute("SELECT rescore_trending();")
+    print("Vacuuming...")
+    await connection.execute("VACUUM ANALYZE;")
+
+
+def percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summarize_plan(plan: dict) -> dict:
+    return {
+        "planning_ms": round(plan.get("Planning Time", 0), 3),
+        "execution_ms": round(plan.get("Execution Time", 0), 3),
+        "shared_hit": plan["Plan"].get("Shared Hit Blocks", 0),
+        "shared_read": plan["Plan"].get("Shared Read Blocks", 0),
+        "top_node": plan["Plan"]["Node Type"],
+        "seq_scans": seq_scans(plan["Plan"]),
+    }
+
+
+async def measure(connection: asyncpg.Connection, query) -> dict:
+    for _ in range(WARMUP):
+        await connection.fetch(query.sql, *query.args)
+    timings = []
+    rows = 0
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        rows = len(await connection.fetch(query.sql, *query.args))
+        timings.append((time.perf_counter() - start) * 1000)
+    explain = await connection.fetchval(
+        "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query.sql, *query.args
+    )
+    return {
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "rows": rows,
+        "plan": summarize_plan(json.loads(explain)[0]),
+    }
+
+
+async def run(connection: asyncpg.Connection) -> dict:
+    samples = await load_samples(connection)
+    results = {}
+
+    for name, kwargs in chart_list_shapes(samples):
+        _, query = charts.get_chart_list(**kwargs)
+        results[f"charts/{name}"] = await measure(connection, query)
+        resumed = await cursor_kwargs(connection, kwargs)
+        if resumed:
+            _, query = charts.get_chart_list(**resumed)
+            results[f"charts/{name}/cursor"] = await measure(connection, query)
+        print(f"charts/{name}: p95 {results[f'charts/{name}']['p95_ms']}ms")
+
+    for name, (page_query, count_query) in detail_shapes(samples):
+        results[f"{name}/page"] = await measure(connection, page_query)
+        results[f"{name}/count"] = await measure(connection, count_query)
+        print(f"{name}: p95 {results[f'{name}/page']['p95_ms']}ms")
+
+    dataset = {
+        table: await connection.fetchval(f"SELECT COUNT(*) FROM {table}")
+        for table in ("accounts", "charts", "chart_likes", "comments", "leaderboards")
+    }
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+    ).stdout.strip()
+    return {
+        "commit": commit or "unknown",
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "server_version": connection.get_server_version().major,
+        "dataset": dataset,
+        "iterations": ITERATIONS,
+        "queries": results,
+    }
+
+
+def compare(old_path: str, new_path: str) -> int:
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    if old["dataset"] != new["dataset"]:
+        print("Warning: the two runs were measured on different datasets.")
+
+    regressions = 0
+    print(f"{'shape':<60} {old['commit']:>10} {new['commit']:>10}  ratio")
+    for name, result in new["queries"].items():
+        if name not in old["queries"]:
+            print(f"{name:<60} {'-':>10} {result['p95_ms']:>10}")
+            continue
+        before, after = old["queries"][name]["p95_ms"], result["p95_ms"]
+        ratio = after / before if before else 1
+        flag = ""
+        if ratio > REGRESSION_RATIO:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{name:<60} {before:>10} {after:>10}  {ratio:.2f}{flag}")
+    print(f"{regressions} regressions (p95 > {REGRESSION_RATIO}x).")
+    return 1 if regressions else 0
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", action="store_true", help="seed an empty database")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare)
+
+    db = await asyncpg.create_pool(
+        host=psql_config["host"],
+        user=psql_config["user"],
+        database=psql_config["database"],
+        password=psql_config["password"],
+        port=psql_config["port"],
+        min_size=1,
+        max_size=1,
+        ssl="disable",
+        command_timeout=None,
+    )
+    print("Connected!")
+
+    async with db.acquire() as connection:
+        if args.seed:
+            await seed(connection)
+            print("Done!")
+            return 0
+        report = await run(connection)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
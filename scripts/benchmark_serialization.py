@@ -0,0 +1,141 @@
+import asyncio, timeit
+
+import asyncpg
+import yaml
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from database import accounts, charts, comments
+from helpers.models import ChartListDBResponse, Comment, NotificationList
+from helpers.record_json import RecordEncoder, epoch_ms, json_array
+
+with open("config.yml", "r") as f:
+    config = yaml.load(f, yaml.Loader)
+
+psql_config = config["psql"]
+
+# Per-row cost of turning DB rows into the JSON response body:
+# model_validate + model_dump + jsonable_encoder + json.dumps (old path)
+# against helpers.record_json (new path), on real rows from the database.
+# Also checks both produce the same body. Run from the repo root:
+#   python -m scripts.benchmark_serialization
+
+ROWS = 100
+ITERATIONS = 200
+
+
+def old_charts(rows) -> bytes:
+    data = [
+        ChartListDBResponse.model_validate(dict(row)).model_dump(
+            exclude={"total_count"}
+        )
+        for row in rows
+    ]
+    return JSONResponse(jsonable_encoder(data)).body
+
+
+def old_comments(rows) -> bytes:
+    data = []
+    for row in rows:
+        comment = Comment.model_validate(dict(row))
+        data.append(
+            {
+                **comment.model_dump(),
+                "created_at": int(comment.created_at.timestamp() * 1000),
+                "deleted_at": (
+                    int(comment.deleted_at.timestamp() * 1000)
+                    if comment.deleted_at
+                    else None
+                ),
+            }
+        )
+    return JSONResponse(jsonable_encoder(data)).body
+
+
+def old_notifications(rows) -> bytes:
+    data = [NotificationList.model_validate(dict(row)).model_dump() for row in rows]
+    return JSONResponse(jsonable_encoder(data)).body
+
+
+def new_path(encoder: RecordEncoder):
+    return lambda rows: json_array(encoder.encode(row) for row in rows).encode()
+
+
+async def fetch_rows(connection: asyncpg.Connection) -> dict:
+    _, chart_query = charts.get_chart_list(page=0, items_per_page=ROWS)
+    chart_rows = await connection.fetch(chart_query.sql, *chart_query.args)
+
+    chart_id = await connection.fetchval(
+        "SELECT chart_id FROM comments GROUP BY chart_id ORDER BY count(*) DESC LIMIT 1"
+    )
+    comment_query, _ = comments.get_comments(chart_id or "", limit=ROWS)
+    comment_rows = await connection.fetch(comment_query.sql, *comment_query.args)
+
+    user_id = await connection.fetchval(
+        "SELECT user_id FROM notifications GROUP BY user_id ORDER BY count(*) DESC LIMIT 1"
+    )
+    notification_query = accounts.get_notifications(user_id or "", limit=ROWS)
+    notification_rows = await connection.fetch(
+        notification_query.sql, *notification_query.args
+    )
+    return {
+        "charts": (
+            chart_rows,
+            old_charts,
+            new_path(RecordEncoder(ChartListDBResponse, exclude={"total_count"})),
+        ),
+        "comments": (
+            comment_rows,
+            old_comments,
+            new_path(
+                RecordEncoder(
+                    Comment, overrides={"created_at": epoch_ms, "deleted_at": epoch_ms}
+                )
+            ),
+        ),
+        "notifications": (
+            notification_rows,
+            old_notifications,
+            new_path(RecordEncoder(NotificationList)),
+        ),
+    }
+
+
+async def main():
+    connection = await asyncpg.connect(
+        host=psql_config["host"],
+        user=psql_config["user"],
+        database=psql_config["database"],
+        password=psql_config["password"],
+        port=psql_config["port"],
+        ssl="disable",
+    )
+    try:
+        shapes = await fetch_rows(connection)
+    finally:
+        await connection.close()
+
+    print(f"{'shape':<16}{'rows':>6}{'old us/row':>12}{'new us/row':>12}{'speedup':>9}")
+    for name, (rows, old, new) in shapes.items():
+        if not rows:
+            print(f"{name:<16}{0:>6}  (no rows to measure)")
+            continue
+        if old(rows) != new(rows):
+            print(f"{name}: output differs!")
+            print(f"  old: {old(rows[:1]).decode()}")
+            print(f"  new: {new(rows[:1]).decode()}")
+            continue
+        per_row = []
+        for path in (old, new):
+            seconds = min(
+                timeit.repeat(lambda: path(rows), number=ITERATIONS, repeat=3)
+            )
+            per_row.append(seconds / ITERATIONS / len(rows) * 1_000_000)
+        print(
+            f"{name:<16}{len(rows):>6}{per_row[0]:>12.2f}{per_row[1]:>12.2f}"
+            f"{per_row[0] / per_row[1]:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+import asyncio, sys
+
+import asyncpg
+import yaml
+
+with open("config.yml", "r") as f:
+    config = yaml.load(f, yaml.Loader)
+
+psql_config = config["psql"]
+
+# Verifies charts.author_full matches chart_author || '#' || accounts.sonolus_handle.
+# Exits with 1 if anything drifted; fix with scripts/backfill_author_full.py
+
+
+async def main() -> int:
+    db = await asyncpg.create_pool(
+        host=psql_config["host"],
+        user=psql_config["user"],
+        database=psql_config["database"],
+        password=psql_config["password"],
+        port=psql_config["port"],
+        min_size=1,
+        max_size=1,
+        ssl="disable",
+    )
+    print("Connected!")
+
+    async with db.acquire() as connection:
+        mismatched = await connection.fetch(
+            """
+            SELECT
+                c.id,
+                c.author_full,
+                c.chart_author || '#' || a.sonolus_handle AS expected
+            FROM charts c
+            LEFT JOIN accounts a ON a.sonolus_id = c.author
+            WHERE c.author_full IS DISTINCT FROM c.chart_author || '#' || a.sonolus_handle;
+            """
+        )
+        missing_triggers = await connection.fetch(
+            """
+            SELECT name
+            FROM unnest(ARRAY['trg_set_chart_author_full', 'trg_update_charts_author_full']) AS t(name)
+            WHERE NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = t.name);
+            """
+        )
+
+    for row in missing_triggers:
+        print(f"Missing trigger: {row['name']}")
+    for row in mismatched[:20]:
+        print(f"{row['id']}: {row['author_full']!r} != {row['expected']!r}")
+    if len(mismatched) > 20:
+        print(f"...and {len(mismatched) - 20} more")
+
+    if mismatched or missing_triggers:
+        print(f"Inconsistent! {len(mismatched)} charts drifted.")
+        return 1
+    print("OK! author_full is consistent.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,79 @@
+import asyncio, sys
+
+import asyncpg
+import yaml
+
+from database import charts
+from scripts.query_shapes import (
+    load_samples,
+    chart_list_shapes,
+    cursor_kwargs,
+    seq_scans,
+    explain_custom,
+    explain_generic,
+)
+
+with open("config.yml", "r") as f:
+    config = yaml.load(f, yaml.Loader)
+
+psql_config = config["psql"]
+
+# Plans every chart list shape (see scripts/query_shapes.py) and exits with 1
+# if any of them sequentially scans a table. Run from the repo root:
+#   python -m scripts.check_query_plans
+# against a seeded database (scripts/benchmark_queries.py --seed); on tiny
+# tables a seq scan is the right plan and this will complain.
+# Checks the custom and the generic plan, since prepared statements
+# switch to the generic one after a few executions.
+
+PLANS = {"custom": explain_custom, "generic": explain_generic}
+
+
+async def check(connection: asyncpg.Connection, name: str, kwargs: dict) -> list:
+    count_query, query = charts.get_chart_list(**kwargs)
+    problems = []
+    for mode, explain in PLANS.items():
+        for label, q in (("list", query), ("count", count_query)):
+            tables = seq_scans((await explain(connection, q))["Plan"])
+            if tables:
+                problems.append(f"{name} [{label}, {mode}]: seq scan on {', '.join(tables)}")
+    return problems
+
+
+async def main() -> int:
+    db = await asyncpg.create_pool(
+        host=psql_config["host"],
+        user=psql_config["user"],
+        database=psql_config["database"],
+        password=psql_config["password"],
+        port=psql_config["port"],
+        min_size=1,
+        max_size=1,
+        ssl="disable",
+    )
+    print("Connected!")
+
+    problems = []
+    checked = 0
+    async with db.acquire() as connection:
+        samples = await load_samples(connection)
+        for name, kwargs in chart_list_shapes(samples):
+            if kwargs["sort_by"] == "random":
+                # ORDER BY RANDOM() has to read every matching row anyway;
+                # the random listing itself uses the in-worker pool
+                continue
+            problems.extend(await check(connection, name, kwargs))
+            checked += 1
+            resumed = await cursor_kwargs(connection, kwargs)
+            if resumed:
+                problems.extend(await check(connection, name + "/cursor", resumed))
+                checked += 1
+
+    for problem in problems:
+        print(problem)
+    print(f"Checked {checked} shapes, {len(problems)} problems.")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -50,7 +50,6 @@ END $$;""",
     discord_id BIGINT,
     patreon_id TEXT,
     chart_upload_cooldown TIMESTAMP with time zone,
-    sonolus_sessions JSONB,
     oauth_details JSONB,
     subscription_details JSONB,
     created_at timestamp with time zone DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC'),
@@ -59,6 +58,74 @@ END $$;""",
     admin BOOL default false,
     banned BOOL DEFAULT false
 );""",
+        # one row per login; key_hash = sha256 of the session key
+        # (database.accounts.sql_key_hash), expires_at in epoch ms
+        """CREATE TABLE IF NOT EXISTS sessions (
+    key_hash BYTEA PRIMARY KEY,
+    sonolus_id TEXT NOT NULL REFERENCES accounts(sonolus_id) ON DELETE CASCADE,
+    session_type TEXT NOT NULL CHECK (session_type IN ('game', 'external')),
+    expires_at BIGINT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_account
+    ON sessions (sonolus_id, session_type, expires_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at);""",
+        # v2 session tokens carry the account's epoch (0 without a row) and
+        # roles when signed (ChartFastAPI.encode_key); a role or ban change
+        # bumps the epoch, revoking them
+        """CREATE TABLE IF NOT EXISTS token_epochs (
+    sonolus_id TEXT PRIMARY KEY REFERENCES accounts(sonolus_id) ON DELETE CASCADE,
+    epoch INTEGER NOT NULL DEFAULT 0
+);""",
+        """CREATE OR REPLACE FUNCTION bump_token_epoch()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO token_epochs (sonolus_id, epoch)
+    VALUES (NEW.sonolus_id, 1)
+    ON CONFLICT (sonolus_id) DO UPDATE
+    SET epoch = token_epochs.epoch + 1;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_bump_token_epoch ON accounts;
+
+CREATE TRIGGER trg_bump_token_epoch
+AFTER UPDATE OF mod, admin, banned ON accounts
+FOR EACH ROW
+WHEN (
+    OLD.mod IS DISTINCT FROM NEW.mod
+    OR OLD.admin IS DISTINCT FROM NEW.admin
+    OR OLD.banned IS DISTINCT FROM NEW.banned
+)
+EXECUTE FUNCTION bump_token_epoch();""",
+        # sessions used to be three slots per type in accounts.sonolus_sessions;
+        # move the live ones over and drop the column
+        """DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'accounts' AND column_name = 'sonolus_sessions'
+    ) THEN
+        INSERT INTO sessions (key_hash, sonolus_id, session_type, expires_at)
+        SELECT
+            sha256(convert_to(slot.data->>'session_key', 'UTF8')),
+            a.sonolus_id,
+            t.session_type,
+            (slot.data->>'expires')::bigint
+        FROM accounts a
+        CROSS JOIN LATERAL jsonb_each(a.sonolus_sessions) AS t(session_type, slots)
+        CROSS JOIN LATERAL jsonb_each(t.slots) AS slot(slot, data)
+        WHERE jsonb_typeof(a.sonolus_sessions) = 'object'
+            AND t.session_type IN ('game', 'external')
+            AND jsonb_typeof(t.slots) = 'object'
+            AND slot.data->>'session_key' IS NOT NULL
+            AND (slot.data->>'expires')::bigint > EXTRACT(EPOCH FROM NOW()) * 1000
+        ON CONFLICT (key_hash) DO NOTHING;
+
+        ALTER TABLE accounts DROP COLUMN sonolus_sessions;
+    END IF;
+END $$;""",
         """CREATE TABLE IF NOT EXISTS charts (
     id TEXT PRIMARY KEY,
     rating DECIMAL DEFAULT 1,
@@ -73,6 +140,8 @@ END $$;""",
     like_count BIGINT NOT NULL DEFAULT 0,
     comment_count BIGINT NOT NULL DEFAULT 0,
     log_like_score DOUBLE PRECISION DEFAULT 0 NOT NULL,
+    trending_score DOUBLE PRECISION DEFAULT 0 NOT NULL,
+    author_full TEXT,
     created_at timestamp with time zone DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC'),
     updated_at timestamp with time zone DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC'),
     published_at timestamp with time zone DEFAULT NULL,
@@ -145,66 +214,198 @@ EXECUTE FUNCTION update_comment_count();""",
     chart_id TEXT REFERENCES charts(id) ON DELETE CASCADE,
     created_at timestamp with time zone DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC')
 );""",
-        """CREATE OR REPLACE FUNCTION update_like_count()
+        # statement-level, on the transition tables: a bulk like/unlike
+        # (database.charts.bulk_like) updates each chart once, not once per row
+        """CREATE OR REPLACE FUNCTION update_like_count_inserted()
 RETURNS TRIGGER AS $$
 DECLARE
     a DOUBLE PRECISION := 1.0 / EXTRACT(EPOCH FROM INTERVAL '7 days');
     tnow DOUBLE PRECISION := EXTRACT(EPOCH FROM NOW());
-    s DOUBLE PRECISION;
 BEGIN
-    IF EXISTS (SELECT 1 FROM charts WHERE id = COALESCE(NEW.chart_id, OLD.chart_id)) THEN
+    -- like_count, trending_score (+1 per like) and
+    -- log_like_score = LN(EXP(log_like_score) + SUM(EXP(a * (liked_at - now))))
+    UPDATE charts c
+    SET like_count = c.like_count + n.likes,
+        log_like_score = COALESCE(c.log_like_score, 0)
+            + LN(1 + n.score / EXP(COALESCE(c.log_like_score, 0))),
+        trending_score = c.trending_score + n.likes
+    FROM (
+        SELECT
+            chart_id,
+            COUNT(*) AS likes,
+            SUM(EXP(a * (EXTRACT(EPOCH FROM created_at) - tnow))) AS score
+        FROM inserted_likes
+        GROUP BY chart_id
+    ) n
+    WHERE c.id = n.chart_id;
 
-        IF TG_OP = 'INSERT' THEN
-            -- increment like_count
-            UPDATE charts
-            SET like_count = like_count + 1
-            WHERE id = NEW.chart_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
 
-            -- update log_like_score
-            SELECT COALESCE(
-                LN(
-                    1 + EXP(a * (EXTRACT(EPOCH FROM NEW.created_at) - tnow)) /
-                        EXP(COALESCE(c.log_like_score, 0))
-                ),
-                a * (EXTRACT(EPOCH FROM NEW.created_at) - tnow)
-            )
-            INTO s
-            FROM charts c
-            WHERE c.id = NEW.chart_id;
+CREATE OR REPLACE FUNCTION update_like_count_deleted()
+RETURNS TRIGGER AS $$
+DECLARE
+    a DOUBLE PRECISION := 1.0 / EXTRACT(EPOCH FROM INTERVAL '7 days');
+    tnow DOUBLE PRECISION := EXTRACT(EPOCH FROM NOW());
+BEGIN
+    -- charts deleted along with their likes (cascade) just don't match
+    UPDATE charts c
+    SET like_count = c.like_count - o.likes,
+        -- recalc log_like_score from remaining likes
+        log_like_score = COALESCE((
+            SELECT LN(SUM(EXP(a * (EXTRACT(EPOCH FROM cl.created_at) - tnow))))
+            FROM chart_likes cl
+            WHERE cl.chart_id = c.id
+        ), 0),
+        trending_score = GREATEST(c.trending_score - o.score, 0)
+    FROM (
+        SELECT
+            chart_id,
+            COUNT(*) AS likes,
+            SUM(EXP(a * (EXTRACT(EPOCH FROM created_at) - tnow))) AS score
+        FROM deleted_likes
+        GROUP BY chart_id
+    ) o
+    WHERE c.id = o.chart_id;
 
-            UPDATE charts
-            SET log_like_score = COALESCE(log_like_score, 0) + s
-            WHERE id = NEW.chart_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
 
-        ELSIF TG_OP = 'DELETE' THEN
-            -- decrement like_count
-            UPDATE charts
-            SET like_count = like_count - 1
-            WHERE id = OLD.chart_id;
+-- replaces the old per-row trigger
+DROP TRIGGER IF EXISTS trg_update_like_count ON chart_likes;
+DROP FUNCTION IF EXISTS update_like_count();
 
-            -- recalc log_like_score from remaining likes
-            UPDATE charts c
-            SET log_like_score = COALESCE((
-                SELECT LN(SUM(EXP(a * (EXTRACT(EPOCH FROM cl.created_at) - tnow))))
-                FROM chart_likes cl
-                WHERE cl.chart_id = OLD.chart_id
-            ), 0)
-            WHERE c.id = OLD.chart_id;
+DROP TRIGGER IF EXISTS trg_like_count_inserted ON chart_likes;
+CREATE TRIGGER trg_like_count_inserted
+AFTER INSERT ON chart_likes
+REFERENCING NEW TABLE AS inserted_likes
+FOR EACH STATEMENT
+EXECUTE FUNCTION update_like_count_inserted();
 
-        END IF;
+DROP TRIGGER IF EXISTS trg_like_count_deleted ON chart_likes;
+CREATE TRIGGER trg_like_count_deleted
+AFTER DELETE ON chart_likes
+REFERENCING OLD TABLE AS deleted_likes
+FOR EACH STATEMENT
+EXECUTE FUNCTION update_like_count_deleted();""",
+        # author_full = chart_author || '#' || accounts.sonolus_handle
+        # kept on the chart row so listing never has to join accounts
+        # backfill existing rows with scripts/backfill_author_full.py
+        """ALTER TABLE charts ADD COLUMN IF NOT EXISTS author_full TEXT;""",
+        """CREATE OR REPLACE FUNCTION set_chart_author_full()
+RETURNS TRIGGER AS $$
+BEGIN
+    SELECT NEW.chart_author || '#' || a.sonolus_handle
+    INTO NEW.author_full
+    FROM accounts a
+    WHERE a.sonolus_id = NEW.author;
 
-    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_set_chart_author_full ON charts;
+
+CREATE TRIGGER trg_set_chart_author_full
+BEFORE INSERT OR UPDATE OF chart_author, author ON charts
+FOR EACH ROW
+EXECUTE FUNCTION set_chart_author_full();""",
+        """CREATE OR REPLACE FUNCTION update_charts_author_full()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE charts
+    SET author_full = chart_author || '#' || NEW.sonolus_handle
+    WHERE author = NEW.sonolus_id;
 
     RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
-DROP TRIGGER IF EXISTS trg_update_like_count ON chart_likes;
+DROP TRIGGER IF EXISTS trg_update_charts_author_full ON accounts;
 
-CREATE TRIGGER trg_update_like_count
-AFTER INSERT OR DELETE ON chart_likes
+CREATE TRIGGER trg_update_charts_author_full
+AFTER UPDATE OF sonolus_handle ON accounts
 FOR EACH ROW
-EXECUTE FUNCTION update_like_count();""",
+WHEN (OLD.sonolus_handle IS DISTINCT FROM NEW.sonolus_handle)
+EXECUTE FUNCTION update_charts_author_full();""",
+        # weighted so ts_rank orders title > artists > author > description
+        """ALTER TABLE charts ADD COLUMN IF NOT EXISTS search_vector tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', COALESCE(title, '')), 'A') ||
+    setweight(to_tsvector('simple', COALESCE(artists, '')), 'B') ||
+    setweight(to_tsvector('simple', COALESCE(author_full, '')), 'C') ||
+    setweight(to_tsvector('simple', COALESCE(description, '')), 'D')
+) STORED;""",
+        """CREATE INDEX IF NOT EXISTS idx_charts_search_vector ON charts USING GIN (search_vector);""",
+        # trending_score = SUM(EXP(-(now - liked_at) / 7 days)) over a chart's likes,
+        # i.e. each like is worth 1 when new and decays with a 7 day time constant.
+        # the like trigger adds 1 per like; rescore_trending_batch() re-decays it
+        # batch by batch (run by helpers/scheduler.py or scripts/rescore_trending.py,
+        # or rescore_trending() from pg_cron below)
+        """ALTER TABLE charts ADD COLUMN IF NOT EXISTS trending_score DOUBLE PRECISION DEFAULT 0 NOT NULL;""",
+        """CREATE INDEX IF NOT EXISTS idx_charts_trending_public
+    ON charts (trending_score DESC, id DESC)
+    WHERE status = 'PUBLIC';""",
+        # one batch of public charts by id (keyset), so each transaction
+        # only locks batch_size rows; last_id is NULL past the last chart
+        """CREATE OR REPLACE FUNCTION rescore_trending_batch(after_id TEXT, batch_size INTEGER)
+RETURNS TABLE (last_id TEXT, updated INTEGER) AS $$
+DECLARE
+    a DOUBLE PRECISION := 1.0 / EXTRACT(EPOCH FROM INTERVAL '7 days');
+    tnow DOUBLE PRECISION := EXTRACT(EPOCH FROM NOW());
+BEGIN
+    SELECT MAX(b.id) INTO last_id
+    FROM (
+        SELECT c.id FROM charts c
+        WHERE c.status = 'PUBLIC' AND c.id > after_id
+        ORDER BY c.id
+        LIMIT batch_size
+    ) b;
+    updated := 0;
+    IF last_id IS NULL THEN
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    UPDATE charts c
+    SET trending_score = s.score
+    FROM (
+        SELECT
+            c2.id,
+            COALESCE(SUM(EXP(a * (EXTRACT(EPOCH FROM cl.created_at) - tnow))), 0) AS score
+        FROM charts c2
+        LEFT JOIN chart_likes cl ON cl.chart_id = c2.id
+        WHERE c2.status = 'PUBLIC' AND c2.id > after_id AND c2.id <= last_id
+        GROUP BY c2.id
+    ) s
+    WHERE c.id = s.id
+    -- skip rows whose score barely moved (old likes, no likes)
+    AND ABS(c.trending_score - s.score) > 1e-6;
+
+    GET DIAGNOSTICS updated = ROW_COUNT;
+    RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;""",
+        # every batch, in one transaction (for pg_cron); the scheduler and
+        # scripts/rescore_trending.py run the batches one transaction each
+        """CREATE OR REPLACE FUNCTION rescore_trending()
+RETURNS INTEGER AS $$
+DECLARE
+    batch RECORD;
+    after_id TEXT := '';
+    total INTEGER := 0;
+BEGIN
+    LOOP
+        SELECT * INTO batch FROM rescore_trending_batch(after_id, 1000);
+        EXIT WHEN batch.last_id IS NULL;
+        total := total + batch.updated;
+        after_id := batch.last_id;
+    END LOOP;
+    RETURN total;
+END;
+$$ LANGUAGE plpgsql;""",
         """-- Scalar columns: B-Tree
 CREATE INDEX IF NOT EXISTS idx_charts_status ON charts(status);
 CREATE INDEX IF NOT EXISTS idx_charts_rating ON charts(rating);
@@ -218,22 +419,84 @@ CREATE INDEX IF NOT EXISTS idx_chart_likes_chart_created
 -- GIN
 CREATE INDEX IF NOT EXISTS idx_charts_tags ON charts USING GIN(tags);
 
--- Text columns with pg_trgm for fast ILIKE
+-- Text columns with pg_trgm for substring search (see split_search_words)
 CREATE INDEX IF NOT EXISTS idx_charts_title_trgm ON charts USING GIN (LOWER(title) gin_trgm_ops);
 CREATE INDEX IF NOT EXISTS idx_charts_description_trgm ON charts USING GIN (LOWER(description) gin_trgm_ops);
 CREATE INDEX IF NOT EXISTS idx_charts_artists_trgm ON charts USING GIN (LOWER(artists) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_charts_author_full_trgm ON charts USING GIN (LOWER(author_full) gin_trgm_ops);
 """,
+        # List paths: one (sort column, id) index per sort_by, partial on
+        # public charts (the literal in get_chart_list) so keyset seeks and
+        # both sort directions are plain index scans. owned_by lists every
+        # status, so that one is keyed on author instead.
+        # CONCURRENTLY can't run inside a multi-statement string, hence one entry each.
+        # A failed CONCURRENTLY build leaves an INVALID index that IF NOT EXISTS
+        # will skip; drop it and rerun. Check with scripts/check_query_plans.py
+        """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_charts_public_created_at
+    ON charts (created_at, id)
+    WHERE status = 'PUBLIC';""",
+        """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_charts_public_published_at
+    ON charts (published_at, id)
+    WHERE status = 'PUBLIC' AND published_at IS NOT NULL;""",
+        """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_charts_public_rating
+    ON charts (rating, id)
+    WHERE status = 'PUBLIC';""",
+        """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_charts_public_like_count
+    ON charts (like_count, id)
+    WHERE status = 'PUBLIC';""",
+        """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_charts_public_comment_count
+    ON charts (comment_count, id)
+    WHERE status = 'PUBLIC';""",
+        """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_charts_public_title
+    ON charts (title, id)
+    WHERE status = 'PUBLIC';""",
+        """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_charts_public_staff_pick_created_at
+    ON charts (created_at, id)
+    WHERE status = 'PUBLIC' AND staff_pick;""",
+        """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_charts_author_created_at
+    ON charts (author, created_at, id);""",
+        """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_comments_commenter_chart
+    ON comments (commenter, chart_id);""",
         """CREATE TABLE IF NOT EXISTS external_login_ids (
     id_key TEXT NOT NULL PRIMARY KEY,
     session_key TEXT,
     expires_at timestamp with time zone DEFAULT ((CURRENT_TIMESTAMP + INTERVAL '6 minutes') AT TIME ZONE 'UTC')
 );
 CREATE INDEX IF NOT EXISTS idx_expires_at ON external_login_ids (expires_at);""",
+        # wakes api/accounts/session/external/wait.py (database.listener)
+        """CREATE OR REPLACE FUNCTION notify_external_login()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('external_login', NEW.id_key);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_notify_external_login ON external_login_ids;
+
+CREATE TRIGGER trg_notify_external_login
+AFTER UPDATE OF session_key ON external_login_ids
+FOR EACH ROW
+WHEN (NEW.session_key IS NOT NULL)
+EXECUTE FUNCTION notify_external_login();""",
+        # The app runs these jobs itself (helpers/scheduler.py, one worker
+        # each, elected by advisory lock). Only schedule them with pg_cron
+        # with server.background-jobs set to false.
         # """SELECT cron.schedule(
         #     'delete_expired_login_ids',
         #     '* * * * *', -- every minute
         #     'DELETE FROM external_login_ids WHERE expires_at < CURRENT_TIMESTAMP;'
         # );"""
+        # """SELECT cron.schedule(
+        #     'delete_expired_sessions',
+        #     '*/10 * * * *', -- every 10 minutes
+        #     'DELETE FROM sessions WHERE expires_at < EXTRACT(EPOCH FROM NOW()) * 1000;'
+        # );"""
+        # """SELECT cron.schedule(
+        #     'rescore_trending',
+        #     '*/10 * * * *', -- every 10 minutes
+        #     'SELECT rescore_trending();'
+        # );"""
         # superuser to schedule
     ]
 
@@ -0,0 +1,173 @@
+import json
+from typing import Iterator
+
+import asyncpg
+
+from database import charts, comments, leaderboards
+
+# Every get_chart_list shape the /api/charts/ handler can produce
+# (one filter at a time, every sort, both orders, first page and cursor page).
+# Shared by scripts/check_query_plans.py and scripts/benchmark_queries.py,
+# which also runs the comment and leaderboard pages (detail_shapes).
+# Run those from the repo root with `python -m scripts.<name>`.
+
+SORTS = list(charts.CHART_LIST_SORT_COLUMNS) + ["random"]
+ORDERS = ["desc", "asc"]
+
+
+async def load_samples(connection: asyncpg.Connection) -> dict:
+    """
+    Real filter values from the database, picking the busiest rows
+    so the shapes are tested at their worst.
+    """
+    return {
+        "owned_by": await connection.fetchval(
+            "SELECT author FROM charts GROUP BY author ORDER BY COUNT(*) DESC LIMIT 1"
+        ),
+        "liked_by": await connection.fetchval(
+            "SELECT sonolus_id FROM chart_likes GROUP BY sonolus_id ORDER BY COUNT(*) DESC LIMIT 1"
+        ),
+        "commented_by": await connection.fetchval(
+            "SELECT commenter FROM comments GROUP BY commenter ORDER BY COUNT(*) DESC LIMIT 1"
+        ),
+        "tag": await connection.fetchval(
+            "SELECT t FROM charts, unnest(tags) t GROUP BY t ORDER BY COUNT(*) DESC LIMIT 1"
+        ),
+        "word": await connection.fetchval(
+            "SELECT split_part(title, ' ', 1) FROM charts WHERE status = 'PUBLIC' LIMIT 1"
+        ),
+        "comment_chart": await connection.fetchval(
+            "SELECT chart_id FROM comments GROUP BY chart_id ORDER BY COUNT(*) DESC LIMIT 1"
+        ),
+        "leaderboard_chart": await connection.fetchval(
+            "SELECT chart_id FROM leaderboards GROUP BY chart_id ORDER BY COUNT(*) DESC LIMIT 1"
+        ),
+    }
+
+
+def filter_sets(samples: dict) -> dict[str, dict]:
+    word = samples["word"] or "a"
+    return {
+        "none": {},
+        "staff_pick": {"staff_pick": True},
+        "rating": {"min_rating": 10, "max_rating": 20},
+        "tags": {"tags": [samples["tag"] or ""]},
+        "likes": {"min_likes": 1},
+        "comments": {"min_comments": 1},
+        "title": {"title_includes": word},
+        "meta": {"meta_includes": word},
+        "owned_by": {"status": None, "owned_by": samples["owned_by"]},
+        "liked_by": {"liked_by": samples["liked_by"]},
+        "commented_by": {"commented_by": samples["commented_by"]},
+    }
+
+
+def chart_list_shapes(samples: dict) -> Iterator[tuple[str, dict]]:
+    """
+    Yields (shape name, get_chart_list kwargs).
+    Cursor shapes need a row to point at, see cursor_kwargs.
+    """
+    for filter_name, filters in filter_sets(samples).items():
+        for sort_by in SORTS:
+            if sort_by == "relevance" and not (
+                filters.get("title_includes") or filters.get("meta_includes")
+            ):
+                continue  # falls back to created_at
+            for sort_order in ORDERS if sort_by != "random" else ["desc"]:
+                yield f"{filter_name}/{sort_by}/{sort_order}", {
+                    "page": 0,
+                    "items_per_page": 10,
+                    "sort_by": sort_by,
+                    "sort_order": sort_order,
+                    **filters,
+                }
+
+
+async def cursor_kwargs(connection: asyncpg.Connection, kwargs: dict) -> dict | None:
+    """
+    Same shape, resumed from the last row of its first page.
+    None if the sort has no cursor or the first page is empty.
+    """
+    if kwargs["sort_by"] == "random":
+        return None
+    _, query = charts.get_chart_list(**kwargs)
+    rows = await connection.fetch(query.sql, *query.args)
+    if not rows:
+        return None
+    last = query.model.model_validate(dict(rows[-1]))
+    cursor = charts.encode_chart_list_cursor(
+        last, kwargs["sort_by"], kwargs["sort_order"]
+    )
+    if not cursor:
+        return None
+    return {**kwargs, "cursor": cursor}
+
+
+def detail_shapes(samples: dict) -> Iterator[tuple[str, tuple]]:
+    """
+    Yields (shape name, (page query, count query)) for the busiest
+    chart's comments and leaderboard.
+    """
+    for sort_desc in (True, False):
+        order = "desc" if sort_desc else "asc"
+        for hide_deleted in (False, True):
+            yield f"comments/{order}/{'visible' if hide_deleted else 'all'}", comments.get_comments(
+                samples["comment_chart"] or "",
+                sort_desc=sort_desc,
+                hide_deleted=hide_deleted,
+            )
+        yield f"leaderboard/{order}", leaderboards.get_leaderboard_for_chart(
+            samples["leaderboard_chart"] or "", sort_desc=sort_desc
+        )
+
+
+def seq_scans(plan: dict) -> list[str]:
+    """Tables a plan tree (an EXPLAIN (FORMAT JSON) "Plan") scans sequentially."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name", "?"))
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+async def explain_custom(connection: asyncpg.Connection, query) -> dict:
+    """
+    EXPLAIN with the args bound: postgres plans with them as constants,
+    which is the custom plan a prepared statement starts with.
+    """
+    explain = await connection.fetchval(
+        "EXPLAIN (FORMAT JSON) " + query.sql, *query.args
+    )
+    return json.loads(explain)[0]
+
+
+async def explain_generic(connection: asyncpg.Connection, query) -> dict:
+    """
+    The generic plan a prepared statement switches to after a few
+    executions: SQL-level PREPARE, then EXPLAIN EXECUTE under
+    force_generic_plan. The args have to go in as literals; bound args
+    (even with EXPLAIN (GENERIC_PLAN)) are planned as constants.
+    """
+    async with connection.transaction():
+        statement = await connection.prepare(query.sql)
+        types = [
+            await connection.fetchval("SELECT format_type($1::oid, NULL)", t.oid)
+            for t in statement.get_parameters()
+        ]
+        literals = [
+            await connection.fetchval(f"SELECT quote_nullable($1::{t})", arg)
+            for t, arg in zip(types, query.args)
+        ]
+        await connection.execute("SET LOCAL plan_cache_mode = force_generic_plan")
+        prepare = "PREPARE plan_check"
+        execute = "EXECUTE plan_check"
+        if types:
+            prepare += f"({', '.join(types)})"
+            execute += f"({', '.join(f'{l}::{t}' for l, t in zip(literals, types))})"
+        await connection.execute(f"{prepare} AS {query.sql.strip().rstrip(';')}")
+        try:
+            explain = await connection.fetchval(f"EXPLAIN (FORMAT JSON) {execute}")
+        finally:
+            await connection.execute("DEALLOCATE plan_check")
+    return json.loads(explain)[0]
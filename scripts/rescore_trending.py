@@ -0,0 +1,46 @@
+import asyncio
+
+import asyncpg
+import yaml
+
+with open("config.yml", "r") as f:
+    config = yaml.load(f, yaml.Loader)
+
+psql_config = config["psql"]
+
+# Re-decays charts.trending_score (the decaying_likes sort).
+# Use this from cron/systemd timers where pg_cron isn't available,
+# otherwise schedule rescore_trending() (see scripts/database_setup.py).
+
+
+async def main():
+    db = await asyncpg.create_pool(
+        host=psql_config["host"],
+        user=psql_config["user"],
+        database=psql_config["database"],
+        password=psql_config["password"],
+        port=psql_config["port"],
+        min_size=1,
+        max_size=1,
+        ssl="disable",
+    )
+    print("Connected!")
+
+    # a batch per transaction, like helpers/scheduler.py
+    updated, after_id = 0, ""
+    async with db.acquire() as connection:
+        while True:
+            batch = await connection.fetchrow(
+                "SELECT last_id, updated FROM rescore_trending_batch($1, $2);",
+                after_id,
+                1000,
+            )
+            if batch["last_id"] is None:
+                break
+            updated += batch["updated"]
+            after_id = batch["last_id"]
+    print(f"Done! {updated} charts rescored.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
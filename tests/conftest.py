@@ -0,0 +1,4 @@
+import os, sys
+
+# the app runs from the repository root (python3 main.py); so do the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,62 @@
+import asyncio
+
+from database import charts
+from helpers.approximate_count import (
+    APPROXIMATE_TOTAL_THRESHOLD,
+    approximate_count_cache,
+    approximate_total,
+)
+
+
+class FakeConnection:
+    def __init__(self, estimate: int):
+        self.estimate = estimate
+        self.estimates = 0
+
+    async def estimate_count(self, query):
+        self.estimates += 1
+        return self.estimate
+
+
+def count_query(tags):
+    query, _ = charts.get_chart_list(
+        page=0,
+        items_per_page=10,
+        tags=tags,
+        count_limit=APPROXIMATE_TOTAL_THRESHOLD + 1,
+    )
+    return query
+
+
+def test_tags_filter_past_threshold():
+    approximate_count_cache.clear()
+    conn = FakeConnection(estimate=50_000)
+    query = count_query(["x"])
+    # the list of tags is one of the query args
+    assert ["x"] in query.args
+
+    first = asyncio.run(approximate_total(conn, query, APPROXIMATE_TOTAL_THRESHOLD + 1))
+    # same filter again, built anew: served from the cache
+    second = asyncio.run(
+        approximate_total(conn, count_query(["x"]), APPROXIMATE_TOTAL_THRESHOLD + 1)
+    )
+
+    assert first == second == 50_000
+    assert conn.estimates == 1
+
+
+def test_other_tags_are_estimated_separately():
+    approximate_count_cache.clear()
+    conn = FakeConnection(estimate=5_000)
+
+    asyncio.run(approximate_total(conn, count_query(["x"]), 1001))
+    asyncio.run(approximate_total(conn, count_query(["y"]), 1001))
+
+    assert conn.estimates == 2
+
+
+def test_never_below_the_counted_rows():
+    approximate_count_cache.clear()
+    conn = FakeConnection(estimate=10)
+
+    assert asyncio.run(approximate_total(conn, count_query(["x"]), 1001)) == 1001
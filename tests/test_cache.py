@@ -0,0 +1,260 @@
+import asyncio, time
+from datetime import datetime, timezone
+
+import pytest
+
+from database.cache import (
+    MISS,
+    TAG_TTL,
+    CacheBackendError,
+    QueryCache,
+    RedisCacheBackend,
+)
+from database.query import SelectQuery
+from helpers.models import DBID
+
+
+class FakeRedis:
+    """
+    In-process server speaking enough RESP for RedisCacheBackend:
+    GET, SET (PX), SADD, SMEMBERS, EXPIRE, DEL, AUTH and SELECT.
+    """
+
+    def __init__(self):
+        self.values: dict[bytes, bytes] = {}
+        self.sets: dict[bytes, set[bytes]] = {}
+        self.expires: dict[bytes, float] = {}
+        self.commands: list[list[bytes]] = []
+        self.connections = 0
+        self.silent = False
+        self._writers: list[asyncio.StreamWriter] = []
+        self._server = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.drop_connections()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def drop_connections(self) -> None:
+        for writer in self._writers:
+            writer.close()
+        self._writers.clear()
+
+    def _alive(self, key: bytes) -> bool:
+        if self.expires.get(key, float("inf")) <= time.monotonic():
+            self.values.pop(key, None)
+            self.sets.pop(key, None)
+            del self.expires[key]
+        return key in self.values or key in self.sets
+
+    @staticmethod
+    def _bulk(value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _reply(self, command: list[bytes]) -> bytes:
+        name, args = command[0].upper(), command[1:]
+        if name in (b"AUTH", b"SELECT"):
+            return b"+OK\r\n"
+        if name == b"GET":
+            alive = self._alive(args[0])
+            return self._bulk(self.values.get(args[0]) if alive else None)
+        if name == b"SET":
+            self.values[args[0]] = args[1]
+            self.expires.pop(args[0], None)
+            if len(args) == 4 and args[2].upper() == b"PX":
+                self.expires[args[0]] = time.monotonic() + int(args[3]) / 1000
+            return b"+OK\r\n"
+        if name == b"SADD":
+            self._alive(args[0])
+            self.sets.setdefault(args[0], set()).update(args[1:])
+            return b":%d\r\n" % (len(args) - 1)
+        if name == b"SMEMBERS":
+            members = self.sets.get(args[0], set()) if self._alive(args[0]) else set()
+            return b"*%d\r\n" % len(members) + b"".join(map(self._bulk, members))
+        if name == b"EXPIRE":
+            self.expires[args[0]] = time.monotonic() + int(args[1])
+            return b":1\r\n"
+        if name == b"DEL":
+            deleted = 0
+            for key in args:
+                deleted += self.values.pop(key, None) is not None
+                deleted += self.sets.pop(key, None) is not None
+                self.expires.pop(key, None)
+            return b":%d\r\n" % deleted
+        return b"-ERR unknown command\r\n"
+
+    async def _handle(self, reader, writer) -> None:
+        self.connections += 1
+        self._writers.append(writer)
+        try:
+            while True:
+                count = int((await reader.readuntil(b"\r\n"))[1:-2])
+                command = []
+                for _ in range(count):
+                    length = int((await reader.readuntil(b"\r\n"))[1:-2])
+                    command.append((await reader.readexactly(length + 2))[:-2])
+                self.commands.append(command)
+                if not self.silent:
+                    writer.write(self._reply(command))
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+
+def with_redis(test, **backend_kwargs):
+    async def main():
+        server = FakeRedis()
+        port = await server.start()
+        backend = RedisCacheBackend(port=port, **backend_kwargs)
+        try:
+            await test(server, backend)
+        finally:
+            await backend.close()
+            await server.stop()
+
+    asyncio.run(main())
+
+
+def test_get_and_set():
+    async def test(server, backend):
+        assert await backend.get("a") is None
+        await backend.set("a", "[1,2]", 60, ())
+        assert await backend.get("a") == "[1,2]"
+        # one connection, kept between commands
+        assert server.connections == 1
+
+    with_redis(test)
+
+
+def test_set_expires():
+    async def test(server, backend):
+        await backend.set("a", "1", 0.05, ())
+        assert server.commands[-1] == [b"SET", b"a", b"1", b"PX", b"50"]
+        assert await backend.get("a") == "1"
+        await asyncio.sleep(0.1)
+        assert await backend.get("a") is None
+
+    with_redis(test)
+
+
+def test_tags_expire():
+    async def test(server, backend):
+        await backend.set("a", "1", 60, ("charts",))
+        assert [b"EXPIRE", b"tag:charts", str(TAG_TTL).encode()] in server.commands
+
+    with_redis(test)
+
+
+def test_invalidate_drops_tagged_keys():
+    async def test(server, backend):
+        await backend.set("a", "1", 60, ("charts",))
+        await backend.set("b", "2", 60, ("charts", "comments"))
+        await backend.set("c", "3", 60, ("comments",))
+
+        await backend.invalidate(["charts"])
+
+        assert await backend.get("a") is None
+        assert await backend.get("b") is None
+        assert await backend.get("c") == "3"
+        assert b"tag:charts" not in server.sets
+
+        # no tags: nothing sent
+        commands = len(server.commands)
+        await backend.invalidate([])
+        assert len(server.commands) == commands
+
+    with_redis(test)
+
+
+def test_auth_and_select_on_connect():
+    async def test(server, backend):
+        await backend.get("a")
+        assert server.commands[:2] == [[b"AUTH", b"secret"], [b"SELECT", b"2"]]
+
+    with_redis(test, password="secret", db=2)
+
+
+def test_error_reply():
+    async def test(server, backend):
+        with pytest.raises(CacheBackendError):
+            await backend._pipeline(("NOPE",))
+        # the connection was dropped; the next command opens a new one
+        await backend.set("a", "1", 60, ())
+        assert server.connections == 2
+
+    with_redis(test)
+
+
+def test_reconnect_after_drop():
+    async def test(server, backend):
+        await backend.set("a", "1", 60, ())
+        server.drop_connections()
+        await asyncio.sleep(0)
+
+        with pytest.raises((OSError, asyncio.IncompleteReadError)):
+            await backend.get("a")
+        assert await backend.get("a") == "1"
+        assert server.connections == 2
+
+    with_redis(test)
+
+
+def test_timeout():
+    async def test(server, backend):
+        server.silent = True
+        with pytest.raises(asyncio.TimeoutError):
+            await backend.get("a")
+        server.silent = False
+        assert await backend.get("a") is None
+
+    with_redis(test, timeout=0.05)
+
+
+def cached_query(chart_id: str) -> SelectQuery:
+    return SelectQuery(
+        DBID,
+        "SELECT id, created_at FROM charts WHERE id = $1",
+        chart_id,
+        cache_ttl=60,
+        cache_tags=("charts", f"chart:{chart_id}"),
+    )
+
+
+def test_query_cache_invalidation():
+    async def test(server, backend):
+        cache = QueryCache(backend)
+        row = {"id": "a", "created_at": datetime(2025, 1, 2, tzinfo=timezone.utc)}
+
+        assert await cache.get(cached_query("a"), "fetchrow") is MISS
+        await cache.set(cached_query("a"), "fetchrow", row)
+        await cache.set(cached_query("b"), "fetchrow", {"id": "b"})
+        assert await cache.get(cached_query("a"), "fetchrow") == row
+
+        await cache.invalidate(["chart:a"])
+
+        assert await cache.get(cached_query("a"), "fetchrow") is MISS
+        assert await cache.get(cached_query("b"), "fetchrow") == {"id": "b"}
+        assert (cache.hits, cache.misses, cache.errors) == (2, 2, 0)
+
+    with_redis(test)
+
+
+def test_query_cache_survives_drop():
+    async def test(server, backend):
+        cache = QueryCache(backend)
+        await cache.set(cached_query("a"), "fetchrow", {"id": "a"})
+        server.drop_connections()
+        await asyncio.sleep(0)
+
+        # a broken connection is a miss, not an error for the request
+        assert await cache.get(cached_query("a"), "fetchrow") is MISS
+        assert cache.errors == 1
+        assert await cache.get(cached_query("a"), "fetchrow") == {"id": "a"}
+
+    with_redis(test)
@@ -0,0 +1,75 @@
+from datetime import datetime, timezone
+
+from database import charts
+from helpers.models import ChartByID, ChartDBResponse, ChartListDBResponse
+
+
+def test_internal_scores_are_not_chart_fields():
+    assert "log_like_score" not in ChartDBResponse.model_fields
+    # the chart page keeps it, like it always did
+    assert "log_like_score" in ChartByID.model_fields
+    # sort key for the cursor only
+    assert "trending_score" in ChartListDBResponse.model_fields
+
+
+def test_json_page_leaves_out_internal_scores():
+    _, query = charts.get_chart_list(
+        page=0, items_per_page=10, sort_by="decaying_likes", as_json_page=True
+    )
+
+    assert "'log_like_score'" not in query.sql
+    assert "'trending_score'" not in query.sql
+    # still there for the cursor, next to data
+    assert "AS trending_score" in query.sql
+
+
+def test_relevance_without_search_text_gets_a_created_at_cursor():
+    created_at = datetime(2025, 1, 2, tzinfo=timezone.utc)
+    # no text filter: no relevance column, the list was sorted by created_at
+    row = {"id": "a" * 32, "created_at": created_at}
+
+    cursor = charts.encode_chart_list_cursor(row, "relevance", "desc")
+
+    assert cursor is not None
+    assert charts.decode_chart_list_cursor(cursor, "created_at", "desc") == (
+        created_at,
+        "a" * 32,
+    )
+    # the next page, asked for with the same sort_by
+    _, query = charts.get_chart_list(
+        page=0, items_per_page=10, sort_by="relevance", cursor=cursor
+    )
+    assert created_at in query.args
+
+
+def test_relevance_cursor_with_search_text():
+    row = {"id": "a" * 32, "relevance": 0.25, "created_at": datetime.now()}
+
+    cursor = charts.encode_chart_list_cursor(row, "relevance", "desc")
+
+    assert charts.decode_chart_list_cursor(cursor, "relevance", "desc") == (
+        0.25,
+        "a" * 32,
+    )
+
+
+def test_split_search_words():
+    # short words are word prefixes; the rest, and CJK runs, substrings
+    assert charts.split_search_words("Night ci 千本桜 x") == (
+        ["ci", "x"],
+        ["night", "千本桜"],
+    )
+
+
+def test_partial_words_are_substring_matches():
+    _, query = charts.get_chart_list(
+        page=0, items_per_page=10, title_includes="ight", sort_by="relevance"
+    )
+
+    # "ight" finds "Night", like the original LIKE search
+    assert "LOWER(c.title) LIKE" in query.sql
+    assert "%ight%" in query.args
+    assert "search_vector @@" not in query.sql
+    # still ranked, whole words first
+    assert "ight:*A" in query.args
+    assert "AS relevance" in query.sql
@@ -0,0 +1,202 @@
+import asyncio
+
+import pytest
+from asyncpg import UndefinedColumnError
+
+from database import DBConnWrapper, query_cache
+from database.query import (
+    SelectQuery,
+    ExecutableQuery,
+    CombinedResult,
+    PreparedStatements,
+    combine_queries,
+)
+from helpers.models import DBID
+
+
+def test_combine_queries_renumbers_placeholders():
+    first = SelectQuery(
+        DBID, "SELECT id FROM charts WHERE author = $1 AND id > $2;", "a", 1
+    )
+    second = SelectQuery(DBID, "SELECT id FROM comments WHERE chart_id = $1", 2)
+
+    query = combine_queries(first, second)
+
+    assert query.model is CombinedResult
+    assert query.args == ("a", 1, 2)
+    assert "author = $1 AND id > $2)" in query.sql
+    assert "chart_id = $3)" in query.sql
+    assert not query.writes
+    assert query.name.startswith("fetch_many(")
+
+
+def test_combine_queries_keeps_row_order():
+    query = combine_queries(
+        SelectQuery(DBID, "SELECT id FROM charts ORDER BY created_at DESC LIMIT 10")
+    )
+
+    # numbered in the subquery's order, aggregated in that order
+    assert "row_number() OVER () AS fetch_many_row" in query.sql
+    assert "ORDER BY fetch_many_row" in query.sql
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        ExecutableQuery("UPDATE accounts SET chart_upload_cooldown = now()"),
+        SelectQuery(DBID, "INSERT INTO charts (id) VALUES ($1) RETURNING id", "x"),
+        SelectQuery(
+            DBID,
+            """
+            WITH account AS (
+                INSERT INTO accounts (sonolus_id) VALUES ($1)
+                ON CONFLICT (sonolus_id) DO UPDATE SET sonolus_id = EXCLUDED.sonolus_id
+                RETURNING sonolus_id
+            )
+            SELECT sonolus_id AS id FROM account;
+            """,
+            "x",
+        ),
+    ],
+)
+def test_combine_queries_rejects_writes(query):
+    read = SelectQuery(DBID, "SELECT id FROM charts")
+    with pytest.raises(ValueError):
+        combine_queries(read, query)
+
+
+class FakeTransaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def __aenter__(self):
+        self.conn.log.append("BEGIN")
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.conn.log.append("COMMIT" if exc_type is None else "ROLLBACK")
+
+
+class FakeConnection:
+    def __init__(self, log):
+        self.log = log
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    async def fetchrow(self, sql, *args):
+        self.log.append(sql)
+        return {"id": "1"}
+
+    async def execute(self, sql, *args):
+        self.log.append(sql)
+        return "UPDATE 1"
+
+
+class FakePool:
+    def __init__(self):
+        self.log = []
+
+    async def acquire(self):
+        return FakeConnection(self.log)
+
+    async def release(self, conn):
+        pass
+
+
+def run_transaction(monkeypatch, fail: bool):
+    pool = FakePool()
+
+    async def invalidate(tags):
+        pool.log.append(("invalidate", tuple(tags)))
+
+    monkeypatch.setattr(query_cache, "invalidate", invalidate)
+
+    async def main():
+        conn = DBConnWrapper(pool)
+        try:
+            async with conn.transaction():
+                await conn.fetchrow(
+                    SelectQuery(
+                        DBID,
+                        "INSERT INTO charts DEFAULT VALUES RETURNING id",
+                        invalidates=("charts",),
+                    )
+                )
+                await conn.execute(
+                    ExecutableQuery(
+                        "UPDATE accounts SET x = 1", invalidates=("accounts",)
+                    )
+                )
+                if fail:
+                    raise RuntimeError
+        finally:
+            await conn.close()
+
+    if fail:
+        with pytest.raises(RuntimeError):
+            asyncio.run(main())
+    else:
+        asyncio.run(main())
+    return pool.log
+
+
+def test_transaction_invalidates_after_commit(monkeypatch):
+    log = run_transaction(monkeypatch, fail=False)
+
+    assert log[0] == "BEGIN"
+    assert log[-2:] == ["COMMIT", ("invalidate", ("charts", "accounts"))]
+
+
+def test_transaction_rollback_keeps_cache(monkeypatch):
+    log = run_transaction(monkeypatch, fail=True)
+
+    assert log[-1] == "ROLLBACK"
+    assert not any(isinstance(entry, tuple) for entry in log)
+
+
+def test_fetch_many_rejects_login_query():
+    from database import accounts
+
+    login = accounts.create_account_if_not_exists_and_new_session(
+        "session", "sonolus id", 1, "name", "external", expires_at=0
+    )
+
+    async def main():
+        # raises before a connection is taken
+        await DBConnWrapper(None).fetch_many(
+            accounts.get_token_claims("sonolus id"), login
+        )
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
+
+
+class PreparingConnection(FakeConnection):
+    def __init__(self, log):
+        super().__init__(log)
+        self.prepared = []
+
+    async def _get_statement(self, sql, timeout):
+        if "missing_column" in sql:
+            raise UndefinedColumnError('column "missing_column" does not exist')
+        self.prepared.append(sql)
+
+    def add_termination_listener(self, callback):
+        pass
+
+
+def test_prepare_connection_skips_failing_shapes():
+    statements = PreparedStatements()
+    statements.register(
+        SelectQuery(DBID, "SELECT id FROM charts"),
+        SelectQuery(DBID, "SELECT missing_column AS id FROM charts"),
+    )
+    conn = PreparingConnection([])
+
+    asyncio.run(statements.prepare_connection(conn))
+
+    assert conn.prepared == ["SELECT id FROM charts"]
+    assert statements.stats()["failed"] == 1
+    assert statements.stats()["connections"] == 1
+    # outer transaction, plus a savepoint per shape
+    assert conn.log.count("ROLLBACK") == 1
@@ -0,0 +1,64 @@
+import asyncio
+
+from helpers.models import ChartPoolEntry
+from helpers.random_pool import RandomChartPool
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.loads = 0
+
+    async def fetch(self, query):
+        self.loads += 1
+        return [
+            ChartPoolEntry(id=id, staff_pick=staff_pick) for id, staff_pick in self.rows
+        ]
+
+
+def loaded_pool(rows):
+    pool, conn = RandomChartPool(), FakeConnection(rows)
+    asyncio.run(pool.sample(conn, 1))
+    return pool, conn
+
+
+def everything(pool, conn, staff_pick=None):
+    return set(asyncio.run(pool.sample(conn, 100, staff_pick=staff_pick)))
+
+
+def test_update_and_remove_in_place():
+    pool, conn = loaded_pool([("a", False), ("b", False), ("c", True)])
+
+    pool.update("d", public=True, staff_pick=False)
+    pool.update("a", public=True, staff_pick=True)
+    pool.update("b", public=False, staff_pick=False)
+    pool.remove("c")
+
+    assert everything(pool, conn, staff_pick=True) == {"a"}
+    assert everything(pool, conn, staff_pick=False) == {"d"}
+    assert everything(pool, conn) == {"a", "d"}
+    # no reload
+    assert conn.loads == 1
+
+
+def test_remove_keeps_positions():
+    rows = [(str(i), False) for i in range(10)]
+    pool, conn = loaded_pool(rows)
+
+    for i in range(0, 10, 2):
+        pool.remove(str(i))
+    pool.remove("missing")
+
+    assert everything(pool, conn) == {"1", "3", "5", "7", "9"}
+    for chart_id in ("1", "3", "5", "7", "9"):
+        pool.remove(chart_id)
+    assert everything(pool, conn) == set()
+
+
+def test_update_before_load():
+    pool, conn = RandomChartPool(), FakeConnection([("a", False)])
+
+    # the first sample loads everything anyway
+    pool.update("b", public=True, staff_pick=False)
+
+    assert everything(pool, conn) == {"a"}